@@ -25,7 +25,7 @@
     'author': 'OpenERP SA',
     'category': 'Human Resources',
     'website': 'http://www.openerp.com',
-    'depends': ['hr_attendance'],
+    'depends': ['hr_attendance', 'l10n_in_base'],
     'description': '''
          Employee attendance import
 ''',
@@ -9,6 +9,22 @@ from openerp import SUPERUSER_ID
 from dateutil.relativedelta import relativedelta
 from openerp.tools import DEFAULT_SERVER_DATE_FORMAT, DEFAULT_SERVER_DATETIME_FORMAT, DATETIME_FORMATS_MAP
 from operator import itemgetter
+from itertools import groupby
+import logging
+import time
+import psycopg2
+from openerp.addons.l10n_in_base.orm_bulk import bulk_insert
+
+_logger = logging.getLogger(__name__)
+
+#: number of csv rows written per multi-row INSERT in the streaming import
+IMPORT_CHUNK_SIZE = 5000
+#: number of base64 characters decoded at once (must stay a multiple of 4)
+DECODE_CHUNK_SIZE = 4 * 16384
+#: default number of card numbers per shard for the parallel processing
+SHARD_SIZE = 500
+#: default number of background jobs for the parallel processing
+WORKER_COUNT = 4
 
 class attendances_import(osv.osv):
 	_name = 'attendances.import'
@@ -23,10 +39,17 @@ class attendances_import(osv.osv):
 					('draft', 'Draft'),
 					('import', 'Imported'),
 					('process', 'Processed')], 'State', readonly=True),
+		'import_rows': fields.integer('Imported Rows', readonly=True),
+		'import_rate': fields.float('Rows per Second', digits=(16, 2), readonly=True),
+		'shard_ids': fields.one2many('attendances.import.shard', 'import_id', 'Processing Shards', readonly=True),
+		'shard_size': fields.integer('Cards per Shard', help="Number of card numbers processed together by one worker."),
+		'worker_count': fields.integer('Workers', help="Number of background jobs sharing the shards. How many run at the same time is bounded by the cron workers of the server."),
 	}
 
 	_defaults = {
-		'state': 'draft'
+		'state': 'draft',
+		'shard_size': SHARD_SIZE,
+		'worker_count': WORKER_COUNT,
 	}
 
 	def import_attendances(self, cr, uid, ids, context=None):
@@ -54,48 +77,319 @@ class attendances_import(osv.osv):
 
 		return True
 
+	def _iter_file_lines(self, data):
+		"""Decode a base64 payload chunk by chunk and yield it line by line,
+		so the whole file never has to sit decoded in memory."""
+		if '\n' in data or '\r' in data:
+			data = ''.join(data.split())
+		pending = ''
+		for pos in xrange(0, len(data), DECODE_CHUNK_SIZE):
+			pending += base64.b64decode(data[pos:pos + DECODE_CHUNK_SIZE])
+			rows = pending.split('\n')
+			pending = rows.pop()
+			for row in rows:
+				yield row + '\n'
+		if pending:
+			yield pending
+
+	def _get_user_tz(self, cr, uid, context=None):
+		if context and context.get('tz'):
+			tz_name = context['tz']
+		else:
+			tz_name = self.pool.get('res.users').read(cr, SUPERUSER_ID, uid, ['tz'])['tz']
+		return tz_name and pytz.timezone(tz_name) or False
+
+	def _convert_check_dates(self, check_times, user_tz):
+		"""Convert a batch of CHECKTIME strings to UTC server datetimes.
+		Punches repeat a lot within one export, so each distinct value is
+		only parsed once."""
+		converted = {}
+		res = []
+		utc = pytz.timezone('UTC')
+		for check_time in check_times:
+			if check_time not in converted:
+				user_date = datetime.strptime(check_time, '%d/%m/%Y %H:%M:%S')
+				if user_tz:
+					user_date = user_tz.localize(user_date, is_dst=False).astimezone(utc)
+				converted[check_time] = user_date.strftime(DEFAULT_SERVER_DATETIME_FORMAT)
+			res.append(converted[check_time])
+		return res
+
+	def _insert_import_lines(self, cr, uid, import_id, rows, user_tz):
+		"""Write a chunk of parsed csv rows with a single multi-row INSERT."""
+		check_dates = self._convert_check_dates([row['CHECKTIME'] for row in rows], user_tz)
+		values = []
+		params = []
+		for row, check_date in zip(rows, check_dates):
+			values.append("(%s, %s, %s, %s, %s, %s, (now() at time zone 'UTC'), %s, (now() at time zone 'UTC'))")
+			params.extend([import_id, row['USERID'], check_date, row['SENSORID'], row['CardNo'], uid, uid])
+		cr.execute('INSERT INTO attendances_import_line '
+				   '(hr_import_id, "user", check_date, machine, card_no, create_uid, create_date, write_uid, write_date) '
+				   'VALUES ' + ', '.join(values), params)
+		return len(rows)
+
+	def import_attendances_stream(self, cr, uid, ids, context=None):
+		"""Streaming variant of import_attendances for large biometric
+		exports: the file is parsed incrementally, the user timezone is
+		resolved once and lines are written in chunks of IMPORT_CHUNK_SIZE
+		rows instead of one ORM create per punch."""
+		if context is None:
+			context = {}
+		chunk_size = context.get('import_chunk_size', IMPORT_CHUNK_SIZE)
+		user_tz = self._get_user_tz(cr, uid, context=context)
+
+		for attendance_import in self.browse(cr, uid, ids, context=context):
+			start = time.time()
+			total_import = 0
+			lines = csv.reader(self._iter_file_lines(attendance_import.input_file), quotechar=' ')
+			header = lines.next()
+			rows = []
+			for ln in lines:
+				if not ln:
+					continue
+				rows.append(dict(zip(header, ln)))
+				if len(rows) >= chunk_size:
+					total_import += self._insert_import_lines(cr, uid, attendance_import.id, rows, user_tz)
+					rows = []
+					_logger.info('Attendance import %s: %d rows imported (%.2f rows/s)',
+								 attendance_import.name, total_import, total_import / max(time.time() - start, 0.001))
+			if rows:
+				total_import += self._insert_import_lines(cr, uid, attendance_import.id, rows, user_tz)
+			import_rate = total_import / max(time.time() - start, 0.001)
+			_logger.info('Attendance import %s: done, %d rows imported (%.2f rows/s)',
+						 attendance_import.name, total_import, import_rate)
+			self.write(cr, uid, [attendance_import.id], {
+				'state': 'import',
+				'import_date': fields.datetime.now(),
+				'import_rows': total_import,
+				'import_rate': import_rate,
+			}, context=context)
+		return True
+
 	def process_attendaces(self, cr, uid, ids, context=None):
+		"""Pair the imported punches into hr.attendance records.
+
+		All lines of the imports are read once, ordered by card and time,
+		grouped in memory by card and day and the resulting sign_in/sign_out
+		pairs are inserted in chunks."""
 		if context is None:
 			context = {}
+		self._process_cards(cr, uid, ids, context=context)
+		self.write(cr, uid, ids, {'state': 'process', 'process_date': fields.datetime.now()}, context=context)
+		return True
 
-		attendance_obj = self.pool.get('hr.attendance')
+	def _process_cards(self, cr, uid, ids, card_from=None, card_to=None, context=None):
+		"""Create the attendances of the given imports, optionally limited to
+		the inclusive card number range [card_from, card_to].
+		Returns the number of hr.attendance records created."""
 		employee_obj = self.pool.get('hr.employee')
-		import_line_obj = self.pool.get('attendances.import.line')
 
-		super_employee_dict = {}
+		domain = [('otherid', '!=', False)]
+		if card_from is not None:
+			domain += [('otherid', '>=', card_from), ('otherid', '<=', card_to)]
+		card_employees = {}
+		employee_ids = employee_obj.search(cr, uid, domain, context=context)
+		for emp in employee_obj.read(cr, uid, employee_ids, ['otherid'], context=context):
+			card_employees.setdefault(emp['otherid'], []).append(emp['id'])
 
-		employee_ids = employee_obj.search(cr, uid, [])
-		for emp in employee_obj.browse(cr, uid, employee_ids, context=context):
-			if emp.otherid:
-				super_employee_dict = {}
-				import_line_ids = import_line_obj.search(cr, uid, [('hr_import_id', 'in', ids), ('card_no', '=', emp.otherid)], order='check_date')
-				for import_line in import_line_obj.browse(cr, uid, import_line_ids, context=context):
-					res = {}
-					if import_line.machine in ['101', '103']:
-						res = {
-							'employee_id': emp.id,
-							'name': import_line.check_date,
-							'action': 'sign_in',
-						}
-					elif import_line.machine in ['102', '104']:
-						res = {
-							'employee_id':  emp.id,
-							'name': import_line.check_date,
-							'action': 'sign_out',
-						}
-					if import_line.check_date:
-						import_line_date = import_line.check_date.split()
-						if len(import_line_date) > 1:
-							check_date = import_line_date[0]
-							if check_date in super_employee_dict:
-								super_employee_dict[check_date].append(res)
-							else:
-								super_employee_dict.update({check_date: [res]})
-			self.create_attendance(cr, uid, super_employee_dict, context=context)
+		total = 0
+		if ids and card_employees:
+			cr.execute('SELECT card_no, check_date, machine FROM attendances_import_line '
+					   'WHERE hr_import_id IN %s AND card_no IN %s AND check_date IS NOT NULL '
+					   'ORDER BY card_no, check_date, id', (tuple(ids), tuple(card_employees)))
+			attendances = []
+			for card_no, card_lines in groupby(cr.fetchall(), key=itemgetter(0)):
+				super_employee_dict = self._group_punches_by_day(card_lines)
+				for employee_id in card_employees[card_no]:
+					for check_date in sorted(super_employee_dict):
+						for att in self._pair_day_attendances(super_employee_dict[check_date]):
+							att['employee_id'] = employee_id
+							attendances.append(att)
+				if len(attendances) >= IMPORT_CHUNK_SIZE:
+					total += self._insert_attendances(cr, uid, attendances, context=context)
+					attendances = []
+			total += self._insert_attendances(cr, uid, attendances, context=context)
+		return total
 
-		self.write(cr, uid, ids, {'state': 'process', 'process_date': fields.datetime.now()}, context=context)
+	def _create_shards(self, cr, uid, attendance_import, context=None):
+		"""Split the card numbers of an import into ranges of shard_size
+		cards, following the database ordering of card_no."""
+		shard_obj = self.pool.get('attendances.import.shard')
+		shard_size = max(attendance_import.shard_size or SHARD_SIZE, 1)
+		cr.execute('SELECT DISTINCT card_no FROM attendances_import_line '
+				   'WHERE hr_import_id = %s AND card_no IS NOT NULL ORDER BY card_no', (attendance_import.id,))
+		cards = [row[0] for row in cr.fetchall()]
+		shard_ids = []
+		for pos in xrange(0, len(cards), shard_size):
+			shard_cards = cards[pos:pos + shard_size]
+			shard_ids.append(shard_obj.create(cr, uid, {
+				'import_id': attendance_import.id,
+				'card_from': shard_cards[0],
+				'card_to': shard_cards[-1],
+				'card_count': len(shard_cards),
+			}, context=context))
+		return shard_ids
+
+	def _claim_shard(self, cr, uid, shard_id, context=None):
+		"""Lock a pending shard for the current transaction.
+		Returns False when the shard is done or being processed by another job."""
+		try:
+			cr.execute('SELECT id FROM attendances_import_shard WHERE id = %s AND state = %s FOR UPDATE NOWAIT',
+					   (shard_id, 'pending'), log_exceptions=False)
+		except psycopg2.OperationalError:
+			cr.rollback()
+			return False
+		return bool(cr.fetchone())
+
+	def _process_shards(self, cr, uid, shard_ids, context=None):
+		"""Background job of one worker, called by ir.cron on its own cursor:
+		process the given shards one after the other with one commit per
+		shard, then mark the imports whose shards are all done as processed."""
+		shard_obj = self.pool.get('attendances.import.shard')
+		import_ids = set()
+		for shard in shard_obj.read(cr, uid, shard_ids, ['import_id', 'card_from', 'card_to'], context=context):
+			import_ids.add(shard['import_id'][0])
+			if not self._claim_shard(cr, uid, shard['id'], context=context):
+				continue
+			try:
+				count = self._process_cards(cr, uid, [shard['import_id'][0]], shard['card_from'], shard['card_to'], context=context)
+				shard_obj.write(cr, uid, [shard['id']], {
+					'state': 'done',
+					'attendance_count': count,
+					'process_date': fields.datetime.now(),
+				}, context=context)
+				cr.commit()
+			except Exception:
+				cr.rollback()
+				_logger.exception('Attendance import shard %s failed, it stays pending', shard['id'])
+
+		# every worker checks after its last commit, so the one finishing last
+		# always sees all the shards done
+		cr.execute('SELECT i.id FROM attendances_import i WHERE i.id IN %s AND i.state = %s '
+				   'AND NOT EXISTS (SELECT 1 FROM attendances_import_shard s WHERE s.import_id = i.id AND s.state != %s)',
+				   (tuple(import_ids or [0]), 'import', 'done'))
+		done_ids = [row[0] for row in cr.fetchall()]
+		if done_ids:
+			try:
+				self.write(cr, uid, done_ids, {'state': 'process', 'process_date': fields.datetime.now()}, context=context)
+				cr.commit()
+			except psycopg2.extensions.TransactionRollbackError:
+				# another worker finishing at the same time marked them
+				cr.rollback()
+		return True
+
+	def process_attendaces_parallel(self, cr, uid, ids, context=None):
+		"""Process the imports by card_no shards in background jobs.
+
+		The pending shards are spread over worker_count one-shot ir.cron jobs,
+		which start once this transaction is committed. Each job runs on its
+		own cursor, in its own process on a multi-process server, and commits
+		per shard, so running this again after an interruption only picks up
+		the shards which are still pending. The caller's transaction is never
+		committed here."""
+		if context is None:
+			context = {}
+		cron_obj = self.pool.get('ir.cron')
+
+		for attendance_import in self.browse(cr, uid, ids, context=context):
+			if not attendance_import.shard_ids:
+				self._create_shards(cr, uid, attendance_import, context=context)
+
+		for attendance_import in self.browse(cr, uid, ids, context=context):
+			shard_ids = [shard.id for shard in attendance_import.shard_ids if shard.state == 'pending']
+			if not shard_ids:
+				self.write(cr, uid, [attendance_import.id], {'state': 'process', 'process_date': fields.datetime.now()}, context=context)
+				continue
+			workers = min(max(attendance_import.worker_count or WORKER_COUNT, 1), len(shard_ids))
+			_logger.info('Attendance import %s: processing %d pending shards with %d workers',
+						 attendance_import.name, len(shard_ids), workers)
+			for worker in range(workers):
+				cron_obj.create(cr, SUPERUSER_ID, {
+					'name': 'Attendance import %s: worker %d/%d' % (attendance_import.name, worker + 1, workers),
+					'user_id': uid,
+					'model': self._name,
+					'function': '_process_shards',
+					'args': repr((shard_ids[worker::workers],)),
+					'interval_number': 1,
+					'interval_type': 'minutes',
+					'numbercall': 1,
+					'doall': False,
+					'nextcall': fields.datetime.now(),
+				}, context=context)
 		return True
 
+	def _group_punches_by_day(self, punches):
+		"""Group (card_no, check_date, machine) rows by check day, keeping
+		only the punches of known sign_in/sign_out machines."""
+		super_employee_dict = {}
+		for card_no, check_date, machine in punches:
+			if machine in ['101', '103']:
+				action = 'sign_in'
+			elif machine in ['102', '104']:
+				action = 'sign_out'
+			else:
+				continue
+			check_date = str(check_date)
+			import_line_date = check_date.split()
+			if len(import_line_date) > 1:
+				super_employee_dict.setdefault(import_line_date[0], []).append({
+					'name': check_date,
+					'action': action,
+				})
+		return super_employee_dict
+
+	def _pair_day_attendances(self, attendances):
+		"""Turn the punches of one day into alternating sign_in/sign_out
+		records: consecutive sign_ins collapse onto the latest one, repeated
+		sign_outs are dropped, and a missing first sign_in or last sign_out
+		is synthesised one minute before/after its partner."""
+		aa_lst = []
+		for att in sorted(attendances, key=itemgetter('name')):
+			if len(aa_lst) >= 1:
+				last_att = aa_lst[-1]
+				if last_att['action'] == att['action'] and last_att['action'] == 'sign_in':
+					last_att.update({'name': att['name']})
+				elif last_att['action'] == att['action'] and last_att['action'] == 'sign_out':
+					continue
+				else:
+					aa_lst.append(dict(att))
+			else:
+				if att['action'] == 'sign_in':
+					aa_lst.append(dict(att))
+				elif att['action'] == 'sign_out':
+					first_att = dict(att)
+					first_att['action'] = 'sign_in'
+					first_att['name'] = (datetime.strptime(att['name'], '%Y-%m-%d %H:%M:%S') - relativedelta(minutes = 1)).strftime('%Y-%m-%d %H:%M:%S')
+					aa_lst.append(first_att)
+					aa_lst.append(dict(att))
+
+		if len(aa_lst) >= 1:
+			check_last = aa_lst[-1]
+			if check_last['action'] == 'sign_in':
+				last_att = check_last.copy()
+				last_att['action'] = 'sign_out'
+				last_att['name'] = (datetime.strptime(check_last['name'], '%Y-%m-%d %H:%M:%S') + relativedelta(minutes = 1)).strftime('%Y-%m-%d %H:%M:%S')
+				aa_lst.append(last_att)
+		return aa_lst
+
+	def _insert_attendances(self, cr, uid, attendances, context=None):
+		"""Write paired attendances with one multi-row INSERT through
+		bulk_insert(): the stored fields of hr.attendance (`day`, and the
+		`sheet_id` of hr_timesheet_sheet when installed) are computed and the
+		_altern_si_so constraint is checked on the new records. hr.attendance
+		has no workflow or mail hook, and the create() check of
+		hr_timesheet_sheet only applies with a `sheet_id` in the context,
+		which the import never sets."""
+		if not attendances:
+			return 0
+		attendance_obj = self.pool.get('hr.attendance')
+		bulk_insert(attendance_obj, cr, uid, [{
+			'employee_id': att['employee_id'],
+			'name': att['name'],
+			'action': att['action'],
+		} for att in attendances], context=context)
+		return len(attendances)
+
 	def date_to_datetime(self, cr, uid, userdate, context=None):
 		user_date = datetime.strptime(userdate, DEFAULT_SERVER_DATETIME_FORMAT)
 		if context and context.get('tz'):
@@ -112,45 +406,10 @@ class attendances_import(osv.osv):
 		return user_date.strftime(DEFAULT_SERVER_DATETIME_FORMAT)
 
 	def create_attendance(self, cr, uid, super_employee_dict, context=None):
-		ss = sorted(super_employee_dict)
-		atten_obj = self.pool.get('hr.attendance')
-
-		for key in ss:
-			attendances_lst = sorted(super_employee_dict[key], key=itemgetter('name'))
-			aa_lst = []
-
-			for att in attendances_lst:
-				if len(aa_lst) >= 1:
-					last_att = aa_lst[-1]
-					if last_att['action'] == att['action'] and last_att['action'] == 'sign_in':
-						last_att.update({'name': att['name']})
-					elif last_att['action'] == att['action'] and last_att['action'] == 'sign_out':
-						continue
-					else:
-						aa_lst.append(att)
-				else:
-					if att['action'] == 'sign_in':
-						aa_lst.append(att)
-
-					elif att['action'] == 'sign_out':
-						first_att = att.copy()
-						first_att['action'] = 'sign_in'
-						first_date = (datetime.strptime(att['name'], '%Y-%m-%d %H:%M:%S') - relativedelta(minutes = 1)).strftime('%Y-%m-%d %H:%M:%S')
-						first_att['name'] = first_date
-						aa_lst.insert(0, first_att)
-						aa_lst.append(att)
-
-			if len(aa_lst) >= 1:
-				check_last = aa_lst[-1]
-				if check_last['action'] == 'sign_in':
-					last_att = check_last.copy()
-					last_date = (datetime.strptime(att['name'], '%Y-%m-%d %H:%M:%S') + relativedelta(minutes = 1)).strftime('%Y-%m-%d %H:%M:%S')
-					last_att['action'] = 'sign_out'
-					last_att['name'] = last_date
-					aa_lst.append(last_att)
-
-			for r in aa_lst:
-				atten_obj.create(cr, uid, r)
+		attendances = []
+		for key in sorted(super_employee_dict):
+			attendances.extend(self._pair_day_attendances(super_employee_dict[key]))
+		self._insert_attendances(cr, uid, attendances, context=context)
 		return True
 
 attendances_import()
@@ -167,3 +426,23 @@ class attendances_import_line(osv.osv):
 
 attendances_import_line()
 
+class attendances_import_shard(osv.osv):
+	_name = 'attendances.import.shard'
+	_order = 'card_from'
+	_columns = {
+		'import_id': fields.many2one('attendances.import', 'Attendances Import', required=True, ondelete='cascade', select=True),
+		'card_from': fields.char('From Card', size=256, required=True),
+		'card_to': fields.char('To Card', size=256, required=True),
+		'card_count': fields.integer('Cards'),
+		'attendance_count': fields.integer('Attendances Created'),
+		'process_date': fields.datetime('Process Date', readonly=True),
+		'state': fields.selection([
+					('pending', 'Pending'),
+					('done', 'Done')], 'State', readonly=True),
+	}
+
+	_defaults = {
+		'state': 'pending'
+	}
+
+attendances_import_shard()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+#    OpenERP, Open Source Management Solution
+#    Copyright (C) 2004-2009 Tiny SPRL (<http://tiny.be>).
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as
+#    published by the Free Software Foundation, either version 3 of the
+#    License, or (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+##############################################################################
+
+"""Time the attendance import on the generated benchmark data set.
+
+The data set of generate_benchmark_data.py (1,000 employees over 30 days
+by default) is generated in a temporary directory and loaded on a
+database where import_attendance is installed: the employees are created
+with their card number, then an Attendances Import is created with the
+punches file. The two steps of the import are timed:
+
+ - import_attendances_stream(): parsing of the file into import lines,
+ - process_attendaces(): pairing of the lines into hr.attendance records.
+
+Everything is rolled back at the end, the database is left as it was.
+
+Usage: python benchmark_import.py -d DATABASE [-c openerp-server.conf]
+       [--employees 1000] [--days 30] [--seed 42]
+"""
+
+import base64
+import csv
+import optparse
+import os
+import shutil
+import tempfile
+import time
+from datetime import datetime
+
+import openerp
+from openerp import SUPERUSER_ID
+
+from generate_benchmark_data import generate
+
+def create_employees(cr, registry, path):
+    """
+    -Process
+        -Create the employees of hr.employee.csv with their card number.
+    """
+    employee_obj = registry.get('hr.employee')
+    employee_file = open(path, 'rb')
+    try:
+        for row in csv.DictReader(employee_file):
+            employee_obj.create(cr, SUPERUSER_ID, {'name': row['name'], 'otherid': row['otherid']})
+    finally:
+        employee_file.close()
+
+def run(database, employees, days, seed):
+    directory = tempfile.mkdtemp()
+    try:
+        punches = generate(directory, employees, days, datetime(2014, 1, 1), seed)
+        registry = openerp.modules.registry.RegistryManager.get(database)
+        import_obj = registry.get('attendances.import')
+        cr = registry.db.cursor()
+        try:
+            create_employees(cr, registry, os.path.join(directory, 'hr.employee.csv'))
+            attendance_file = open(os.path.join(directory, 'attendances.csv'), 'rb')
+            try:
+                import_id = import_obj.create(cr, SUPERUSER_ID, {
+                    'name': 'Benchmark Import',
+                    'input_file': base64.encodestring(attendance_file.read()),
+                })
+            finally:
+                attendance_file.close()
+
+            start = time.time()
+            import_obj.import_attendances_stream(cr, SUPERUSER_ID, [import_id])
+            import_time = time.time() - start
+            start = time.time()
+            import_obj.process_attendaces(cr, SUPERUSER_ID, [import_id])
+            process_time = time.time() - start
+
+            cr.execute("SELECT count(*) FROM attendances_import_line WHERE hr_import_id = %s", (import_id,))
+            lines = cr.fetchone()[0]
+            cr.execute("SELECT count(*) FROM hr_attendance a JOIN hr_employee e ON (e.id = a.employee_id) "
+                       "WHERE e.otherid IN (SELECT DISTINCT card_no FROM attendances_import_line WHERE hr_import_id = %s)",
+                       (import_id,))
+            attendances = cr.fetchone()[0]
+        finally:
+            cr.rollback()
+            cr.close()
+    finally:
+        shutil.rmtree(directory)
+    return punches, lines, import_time, attendances, process_time
+
+if __name__ == '__main__':
+    parser = optparse.OptionParser(usage='%prog -d DATABASE [options]')
+    parser.add_option('-d', '--database', help='database where import_attendance is installed')
+    parser.add_option('-c', '--config', help='OpenERP server configuration file')
+    parser.add_option('--employees', type='int', default=1000, help='number of employees [default: %default]')
+    parser.add_option('--days', type='int', default=30, help='number of days [default: %default]')
+    parser.add_option('--seed', type='int', default=42, help='random seed [default: %default]')
+    options, args = parser.parse_args()
+    if not options.database:
+        parser.error('a database is required')
+    openerp.tools.config.parse_config(options.config and ['-c', options.config] or [])
+    punches, lines, import_time, attendances, process_time = run(options.database, options.employees, options.days, options.seed)
+    print '%d punches generated for %d employees over %d days' % (punches, options.employees, options.days)
+    print 'import:  %d lines in %.2fs (%.0f rows/s)' % (lines, import_time, lines / max(import_time, 0.001))
+    print 'process: %d attendances in %.2fs (%.0f attendances/s)' % (attendances, process_time, attendances / max(process_time, 0.001))
@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+#    OpenERP, Open Source Management Solution
+#    Copyright (C) 2004-2009 Tiny SPRL (<http://tiny.be>).
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as
+#    published by the Free Software Foundation, either version 3 of the
+#    License, or (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+##############################################################################
+
+"""Generate a benchmark data set for the attendance import.
+
+Two files are written in the output directory:
+
+ - hr.employee.csv: the employees with their card number (`otherid`), to
+   load with the standard import of Human Resources > Employees,
+ - attendances.csv: the biometric export to load on an Attendances Import,
+   in the format read by import_attendances_stream (USERID, CHECKTIME,
+   SENSORID, CardNo).
+
+The default size is 1,000 employees over 30 days, about 80,000 punches.
+The data is random but reproducible through --seed. Besides the regular
+sign_in (101/103) and sign_out (102/104) punches, some days have a lunch
+break, repeated punches, a missing first or last punch or a punch of an
+unknown machine, so that every branch of the pairing is exercised.
+
+benchmark_import.py generates this data set and times the import on it.
+
+Usage: python generate_benchmark_data.py [--employees 1000] [--days 30]
+       [--start 01/01/2014] [--seed 42] [--output .]
+"""
+
+import csv
+import optparse
+import os
+import random
+from datetime import datetime, timedelta
+
+CHECKTIME_FORMAT = '%d/%m/%Y %H:%M:%S'
+
+def card_number(index):
+    return '%06d' % (index + 1)
+
+def day_punches(rand, day):
+    """
+    -Process
+        -Build the (time, machine) punches of one employee on one day.
+    -Return
+        -list of (datetime, machine) sorted by time
+    """
+    sign_in = day + timedelta(hours=9, minutes=rand.randint(-30, 30), seconds=rand.randint(0, 59))
+    sign_out = day + timedelta(hours=18, minutes=rand.randint(-30, 60), seconds=rand.randint(0, 59))
+    punches = [(sign_in, rand.choice(['101', '103'])), (sign_out, rand.choice(['102', '104']))]
+    if rand.random() < 0.3:
+        lunch = day + timedelta(hours=13, minutes=rand.randint(0, 30))
+        punches += [(lunch, '102'), (lunch + timedelta(minutes=rand.randint(20, 45)), '101')]
+    if rand.random() < 0.05:
+        # the employee punched twice in a row
+        time, machine = rand.choice(punches)
+        punches.append((time + timedelta(seconds=rand.randint(1, 120)), machine))
+    if rand.random() < 0.03:
+        # missing first or last punch, completed by the pairing
+        punches.remove(rand.choice([punches[0], punches[1]]))
+    if rand.random() < 0.01:
+        punches.append((day + timedelta(hours=rand.randint(8, 19)), '199'))
+    return sorted(punches)
+
+def generate(output, employees, days, start, seed):
+    rand = random.Random(seed)
+    employee_file = open(os.path.join(output, 'hr.employee.csv'), 'wb')
+    try:
+        writer = csv.writer(employee_file)
+        writer.writerow(['name', 'otherid'])
+        for index in xrange(employees):
+            writer.writerow(['Benchmark Employee %s' % card_number(index), card_number(index)])
+    finally:
+        employee_file.close()
+
+    count = 0
+    attendance_file = open(os.path.join(output, 'attendances.csv'), 'wb')
+    try:
+        # import_attendances_stream reads the file with quotechar=' '
+        writer = csv.writer(attendance_file, quoting=csv.QUOTE_NONE)
+        writer.writerow(['USERID', 'CHECKTIME', 'SENSORID', 'CardNo'])
+        for index in xrange(employees):
+            for day_index in xrange(days):
+                day = start + timedelta(days=day_index)
+                for time, machine in day_punches(rand, day):
+                    writer.writerow([index + 1, time.strftime(CHECKTIME_FORMAT), machine, card_number(index)])
+                    count += 1
+    finally:
+        attendance_file.close()
+    return count
+
+if __name__ == '__main__':
+    parser = optparse.OptionParser(usage='%prog [options]')
+    parser.add_option('--employees', type='int', default=1000, help='number of employees [default: %default]')
+    parser.add_option('--days', type='int', default=30, help='number of days [default: %default]')
+    parser.add_option('--start', default='01/01/2014', help='first day, dd/mm/yyyy [default: %default]')
+    parser.add_option('--seed', type='int', default=42, help='random seed [default: %default]')
+    parser.add_option('--output', default='.', help='output directory [default: %default]')
+    options, args = parser.parse_args()
+    count = generate(options.output, options.employees, options.days,
+                     datetime.strptime(options.start, '%d/%m/%Y'), options.seed)
+    print '%d employees, %d punches written to %s' % (options.employees, count, options.output)
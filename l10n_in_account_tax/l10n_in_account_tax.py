@@ -19,8 +19,12 @@
 #
 ##############################################################################
 
+import re
 import time
+from ast import literal_eval
+from openerp import tools
 from openerp.osv import fields, osv
+from openerp.osv.orm import browse_null
 from openerp.tools.translate import _
 
 TAX_TYPES = [
@@ -45,90 +49,375 @@ TAX_TYPES = [
     ('other', 'Other')
 ]
 
+_TAX_NUMBER = r'([-+]?\d+(?:\.\d*)?(?:[eE][-+]?\d+)?)'
+# Expression shapes of python_compute evaluated without exec
+TAX_CODE_SHAPES = [
+    ('percent', re.compile(r'^result\s*=\s*price_unit\s*\*\s*%s$' % _TAX_NUMBER)),
+    ('percent', re.compile(r'^result\s*=\s*%s\s*\*\s*price_unit$' % _TAX_NUMBER)),
+    ('fixed', re.compile(r'^result\s*=\s*%s$' % _TAX_NUMBER)),
+]
+
 class account_tax(osv.osv):
     _inherit = 'account.tax'
     
+    def __init__(self, pool, cr):
+        super(account_tax, self).__init__(pool, cr)
+        self._code_counters = {}
+
+    def _code_counters_get(self, cr, uid, ids, field_names, arg, context=None):
+        res = {}
+        for id in ids:
+            counter = self._code_counters.get(id, {})
+            res[id] = {
+                'code_eval_count': counter.get('count', 0),
+                'code_fast_count': counter.get('fast_count', 0),
+                'code_eval_time': counter.get('time', 0.0),
+            }
+        return res
+
     _columns = {
         'tax_categ': fields.selection(TAX_TYPES, 'Tax Category'),
-        'is_form': fields.boolean('Form ?')
+        'is_form': fields.boolean('Form ?'),
+        'python_fast_path': fields.boolean('Fast Evaluation', help="Evaluate simple python code (result = price_unit * rate, result = amount) without running python interpreter."),
+        'code_eval_count': fields.function(_code_counters_get, type='integer', string='Evaluations', multi='code_counters', help="Number of python code evaluations of this tax since server start."),
+        'code_fast_count': fields.function(_code_counters_get, type='integer', string='Fast Evaluations', multi='code_counters', help="Number of evaluations done without running python interpreter."),
+        'code_eval_time': fields.function(_code_counters_get, type='float', string='Evaluation Time (s)', digits=(16, 6), multi='code_counters', help="Total time spent in python code of this tax since server start."),
     }
-    
-    def _unit_compute(self, cr, uid, taxes, price_unit, product=None, partner=None, quantity=0):
-        taxes = self._applicable(cr, uid, taxes, price_unit , product, partner)
+
+    _defaults = {
+        'python_fast_path': True,
+    }
+
+    def create(self, cr, uid, vals, context=None):
+        self.clear_caches()
+        return super(account_tax, self).create(cr, uid, vals, context=context)
+
+    def write(self, cr, uid, ids, vals, context=None):
+        self.clear_caches()
+        return super(account_tax, self).write(cr, uid, ids, vals, context=context)
+
+    def unlink(self, cr, uid, ids, context=None):
+        self.clear_caches()
+        return super(account_tax, self).unlink(cr, uid, ids, context=context)
+
+    @tools.ormcache(skiparg=2)
+    def _tax_code(self, cr, tax_id, python_compute, fast_path=True):
+        """
+        -Process
+            -Compile python_compute of tax once, cache key holds the source so
+             a written python_compute is never served from an old compilation.
+        -Return
+            -('percent', rate) or ('fixed', amount) for simple shapes when fast_path,
+            -('exec', code object) otherwise
+        """
+        lines = [line.strip() for line in (python_compute or '').splitlines()]
+        source = '\n'.join([line for line in lines if line and not line.startswith('#')])
+        if fast_path:
+            for shape, pattern in TAX_CODE_SHAPES:
+                match = pattern.match(source)
+                if match:
+                    return (shape, literal_eval(match.group(1)))
+        return ('exec', compile(python_compute or '', 'account.tax(%s).python_compute' % (tax_id,), 'exec'))
+
+    def _eval_tax_code_lines(self, node, price_units, products, partners):
+        """
+        -Process
+            -Evaluate a code tax of a plan on the current price unit of many lines,
+             simple shapes are computed on all lines at once, other code is run per line.
+        -Return
+            -list of tax amounts, in order of price_units
+        """
+        counter = self._code_counters.setdefault(node['id'], {'count': 0, 'fast_count': 0, 'time': 0.0})
+        start = time.time()
+        shape, code = node['code']
+        if shape == 'percent':
+            res = [price_unit * code for price_unit in price_units]
+        elif shape == 'fixed':
+            res = [code] * len(price_units)
+        else:
+            res = []
+            for price_unit, product, partner in zip(price_units, products, partners):
+                localdict = {'price_unit':price_unit, 'product':product, 'partner':partner}
+                exec code in localdict
+                res.append(localdict['result'])
+        counter['count'] += len(price_units)
+        if shape != 'exec':
+            counter['fast_count'] += len(price_units)
+        counter['time'] += time.time() - start
+        return res
+
+    def _tax_plan_version(self, cr):
+        """
+        -Process
+            -Fingerprint of account_tax rows read in the current transaction, part of
+             the cache key of _tax_plan so a plan built from values written by another
+             or a rolled back transaction is never served,
+            -resolved once per batch of lines: callers computing many lines pass it
+             down to _unit_compute_lines() and compute_all_lines().
+        """
+        cr.execute("SELECT count(*), max(write_date) FROM account_tax")
+        return tuple(cr.fetchone())
+
+    @tools.ormcache(skiparg=2)
+    def _tax_plan(self, cr, uid, tax_ids, version):
+        """
+        -Process
+            -Flatten taxes with their child taxes once, keeping everything _unit_compute
+             needs from the browse records, so lines only do arithmetic on it.
+            -Names are kept untranslated, _get_tax_plan translates them per call.
+        -Return
+            -list of plan nodes, one per tax in given order with their children nodes
+        """
+        plan = []
+        for tax in self.browse(cr, uid, list(tax_ids)):
+            plan.append({
+                'id': tax.id,
+                'type': tax.type,
+                'amount': tax.amount,
+                'code': tax.type == 'code' and self._tax_code(cr, tax.id, tax.python_compute, tax.python_fast_path) or False,
+                'applicable_type': tax.applicable_type,
+                'python_applicable': tax.python_applicable,
+                'child_depend': tax.child_depend,
+                'include_base_amount': tax.include_base_amount,
+                'parent_id': tax.parent_id.id,
+                'children': self._tax_plan(cr, uid, tuple([child.id for child in tax.child_ids]), version),
+                'description': tax.description,
+                'data': {
+                    'id':tax.id,
+                    'name':tax.description and tax.description + " - " + tax.name or tax.name,
+                    'account_collected_id':tax.account_collected_id.id,
+                    'account_paid_id':tax.account_paid_id.id,
+                    'account_analytic_collected_id': tax.account_analytic_collected_id.id,
+                    'account_analytic_paid_id': tax.account_analytic_paid_id.id,
+                    'base_code_id': tax.base_code_id.id,
+                    'ref_base_code_id': tax.ref_base_code_id.id,
+                    'sequence': tax.sequence,
+                    'base_sign': tax.base_sign,
+                    'tax_sign': tax.tax_sign,
+                    'ref_base_sign': tax.ref_base_sign,
+                    'ref_tax_sign': tax.ref_tax_sign,
+                    'tax_code_id': tax.tax_code_id.id,
+                    'ref_tax_code_id': tax.ref_tax_code_id.id,
+                    'include_base_amount': tax.include_base_amount,
+                },
+            })
+        return plan
+
+    def _plan_ids(self, plan):
         res = []
-        cur_price_unit = price_unit
-        for tax in taxes:
+        for node in plan:
+            res.append(node['id'])
+            res.extend(self._plan_ids(node['children']))
+        return res
+
+    def _translate_plan(self, plan, names):
+        """
+        -Process
+            -Copy of plan nodes with tax names of given {tax id: translated name}
+        """
+        res = []
+        for node in plan:
+            node = dict(node, children=self._translate_plan(node['children'], names))
+            if names.get(node['id']):
+                name = names[node['id']]
+                node['data'] = dict(node['data'], name=node['description'] and node['description'] + " - " + name or name)
+            res.append(node)
+        return res
+
+    def _plan_applicable(self, plan, price_unit, product=None, partner=None):
+        res = []
+        for node in plan:
+            if node['applicable_type'] == 'code':
+                localdict = {'price_unit':price_unit, 'product':product, 'partner':partner}
+                exec node['python_applicable'] in localdict
+                if localdict.get('result', False):
+                    res.append(node)
+            else:
+                res.append(node)
+        return res
+
+    def _compute_plan_lines(self, cr, uid, plan, price_units, products, partners, quantities):
+        """
+        -Process
+            -Same computation as _unit_compute used to do on browse records, on a tax plan
+             for many lines at once: lines applying the same taxes are evaluated together
+             by _compute_plan_steps.
+        -Return
+            -list of _unit_compute results, in order of price_units
+        """
+        if not [node for node in plan if node['applicable_type'] == 'code']:
+            return self._compute_plan_steps(cr, uid, plan, price_units, products, partners, quantities)
+        groups = {}
+        for index, price_unit in enumerate(price_units):
+            nodes = self._plan_applicable(plan, price_unit, products[index], partners[index])
+            groups.setdefault(tuple([id(node) for node in nodes]), (nodes, []))[1].append(index)
+        res = [None] * len(price_units)
+        for nodes, indexes in groups.values():
+            group_res = self._compute_plan_steps(cr, uid, nodes, [price_units[i] for i in indexes], [products[i] for i in indexes],
+                                                 [partners[i] for i in indexes], [quantities[i] for i in indexes])
+            for index, line_res in zip(indexes, group_res):
+                res[index] = line_res
+        return res
+
+    def _compute_plan_steps(self, cr, uid, plan, price_units, products, partners, quantities):
+        """
+        -Process
+            -Evaluate each step of plan (all applicable) on all lines before the next one,
+             keeping the arithmetic of each line in the same order as _unit_compute.
+        """
+        count = len(price_units)
+        res = [[] for i in xrange(count)]
+        cur_price_units = list(price_units)
+        for node in plan:
             # we compute the amount for the current tax object and append it to the result
-            data = {
-                'id':tax.id,
-                'name':tax.description and tax.description + " - " + tax.name or tax.name,
-                'account_collected_id':tax.account_collected_id.id,
-                'account_paid_id':tax.account_paid_id.id,
-                'account_analytic_collected_id': tax.account_analytic_collected_id.id,
-                'account_analytic_paid_id': tax.account_analytic_paid_id.id,
-                'base_code_id': tax.base_code_id.id,
-                'ref_base_code_id': tax.ref_base_code_id.id,
-                'sequence': tax.sequence,
-                'base_sign': tax.base_sign,
-                'tax_sign': tax.tax_sign,
-                'ref_base_sign': tax.ref_base_sign,
-                'ref_tax_sign': tax.ref_tax_sign,
-                'price_unit': cur_price_unit,
-                'tax_code_id': tax.tax_code_id.id,
-                'ref_tax_code_id': tax.ref_tax_code_id.id,
-                'include_base_amount': tax.include_base_amount,
-                'parent_id':tax.parent_id
-            }
-            res.append(data)
-            if tax.type == 'percent':
-                amount = cur_price_unit * tax.amount
-                data['amount'] = amount
-
-            elif tax.type == 'fixed':
-                data['amount'] = tax.amount
-                data['tax_amount'] = quantity
-                # data['amount'] = quantity
-            elif tax.type == 'code':
-                localdict = {'price_unit':cur_price_unit, 'product':product, 'partner':partner}
-                exec tax.python_compute in localdict
-                amount = localdict['result']
-                data['amount'] = amount
-            elif tax.type == 'balance':
-                data['amount'] = cur_price_unit - reduce(lambda x, y: y.get('amount', 0.0) + x, res, 0.0)
-                data['balance'] = cur_price_unit
-
-            amount2 = data.get('amount', 0.0)
-            if tax.child_ids:
-                if tax.child_depend:
-                    latest = res.pop()
-                amount = amount2
-                child_tax = self._unit_compute(cr, uid, tax.child_ids, amount, product, partner, quantity)
-                # Add Parent reference in child dictionary of tax so that we can inlcude tha amount of child ...
-                for ctax in child_tax:
-                    ctax['parent_tax'] = tax.id
-                
-                res.extend(child_tax)
-                if tax.child_depend:
-                    for r in res:
-                        for name in ('base', 'ref_base'):
-                            if latest[name + '_code_id'] and latest[name + '_sign'] and not r[name + '_code_id']:
-                                r[name + '_code_id'] = latest[name + '_code_id']
-                                r[name + '_sign'] = latest[name + '_sign']
-                                r['price_unit'] = latest['price_unit']
-                                latest[name + '_code_id'] = False
-                        for name in ('tax', 'ref_tax'):
-                            if latest[name + '_code_id'] and latest[name + '_sign'] and not r[name + '_code_id']:
-                                r[name + '_code_id'] = latest[name + '_code_id']
-                                r[name + '_sign'] = latest[name + '_sign']
-                                r['amount'] = data['amount']
-                                latest[name + '_code_id'] = False
-            
-            if tax.include_base_amount:
-                cur_price_unit += amount2
-                # Check for Child tax addition. If Tax has childrens and they have also set include in base amount we will add it for next tax calculation...
-                for r in res:
-                    if 'parent_tax' in r and r['parent_tax'] == tax.id:
-                        cur_price_unit += r['amount']
+            parent = node['parent_id'] and self.browse(cr, uid, node['parent_id']) or browse_null()
+            datas = []
+            for index in xrange(count):
+                data = dict(node['data'])
+                data.update({
+                    'price_unit': cur_price_units[index],
+                    'parent_id': parent,
+                })
+                res[index].append(data)
+                datas.append(data)
+            if node['type'] == 'percent':
+                for data, cur_price_unit in zip(datas, cur_price_units):
+                    data['amount'] = cur_price_unit * node['amount']
+
+            elif node['type'] == 'fixed':
+                for data, quantity in zip(datas, quantities):
+                    data['amount'] = node['amount']
+                    data['tax_amount'] = quantity
+            elif node['type'] == 'code':
+                for data, amount in zip(datas, self._eval_tax_code_lines(node, cur_price_units, products, partners)):
+                    data['amount'] = amount
+            elif node['type'] == 'balance':
+                for index, data in enumerate(datas):
+                    data['amount'] = cur_price_units[index] - reduce(lambda x, y: y.get('amount', 0.0) + x, res[index], 0.0)
+                    data['balance'] = cur_price_units[index]
+
+            amounts2 = [data.get('amount', 0.0) for data in datas]
+            if node['children']:
+                if node['child_depend']:
+                    latests = [line_res.pop() for line_res in res]
+                child_taxes = self._compute_plan_lines(cr, uid, node['children'], amounts2, products, partners, quantities)
+                for index in xrange(count):
+                    # Add Parent reference in child dictionary of tax so that we can inlcude tha amount of child ...
+                    for ctax in child_taxes[index]:
+                        ctax['parent_tax'] = node['id']
+                    res[index].extend(child_taxes[index])
+                    if node['child_depend']:
+                        self._child_depend_codes(res[index], latests[index], datas[index])
+
+            if node['include_base_amount']:
+                for index in xrange(count):
+                    cur_price_units[index] += amounts2[index]
+                    # Check for Child tax addition. If Tax has childrens and they have also set include in base amount we will add it for next tax calculation...
+                    for r in res[index]:
+                        if 'parent_tax' in r and r['parent_tax'] == node['id']:
+                            cur_price_units[index] += r['amount']
+        return res
+
+    def _child_depend_codes(self, res, latest, data):
+        """
+        -Process
+            -Move tax codes of a child_depend parent tax to the results of its children.
+        """
+        for r in res:
+            for name in ('base', 'ref_base'):
+                if latest[name + '_code_id'] and latest[name + '_sign'] and not r[name + '_code_id']:
+                    r[name + '_code_id'] = latest[name + '_code_id']
+                    r[name + '_sign'] = latest[name + '_sign']
+                    r['price_unit'] = latest['price_unit']
+                    latest[name + '_code_id'] = False
+            for name in ('tax', 'ref_tax'):
+                if latest[name + '_code_id'] and latest[name + '_sign'] and not r[name + '_code_id']:
+                    r[name + '_code_id'] = latest[name + '_code_id']
+                    r[name + '_sign'] = latest[name + '_sign']
+                    r['amount'] = data['amount']
+                    latest[name + '_code_id'] = False
+
+    def _get_tax_plan(self, cr, uid, taxes, version=None):
+        if not taxes:
+            return []
+        if version is None:
+            version = self._tax_plan_version(cr)
+        plan = self._tax_plan(cr, uid, tuple([tax.id for tax in taxes]), version)
+        lang = taxes and taxes[0]._context.get('lang') or None
+        if lang and plan:
+            names = self.pool.get('ir.translation')._get_ids(cr, uid, 'account.tax,name', 'model', lang, self._plan_ids(plan))
+            if [name for name in names.values() if name]:
+                plan = self._translate_plan(plan, names)
+        return plan
+
+    def _unit_compute(self, cr, uid, taxes, price_unit, product=None, partner=None, quantity=0):
+        return self._unit_compute_lines(cr, uid, taxes, [(price_unit, product, partner, quantity)])[0]
+
+    def _unit_compute_lines(self, cr, uid, taxes, lines, version=None):
+        """
+        -Process
+            -Compute many lines having same taxes on one tax plan, each step of the
+             plan is evaluated on all lines at once,
+            -lines are tuples of (price_unit, product, partner, quantity),
+            -version of _tax_plan_version() is resolved here when not given.
+        -Return
+            -list of _unit_compute results, in order of lines
+        """
+        if not lines:
+            return []
+        plan = self._get_tax_plan(cr, uid, taxes, version)
+        price_units, products, partners, quantities = [list(values) for values in zip(*lines)]
+        return self._compute_plan_lines(cr, uid, plan, price_units, products, partners, quantities)
+
+    def compute_all_lines(self, cr, uid, taxes, lines, force_excluded=False, version=None):
+        """
+        -Process
+            -Same as compute_all() for many lines having the same taxes, taxes excluded
+             from price are computed for all lines at once with _unit_compute_lines,
+            -lines are tuples of (price_unit, quantity, product, partner),
+            -callers computing several groups of lines give the version of
+             _tax_plan_version() they resolved once.
+        -Return
+            -list of compute_all() results, in order of lines
+        """
+        precision = self.pool.get('decimal.precision').precision_get(cr, uid, 'Account')
+        tax_compute_precision = precision
+        if taxes and taxes[0].company_id.tax_calculation_rounding_method == 'round_globally':
+            tax_compute_precision += 5
+        tin = []
+        tex = []
+        for tax in taxes:
+            if not tax.price_include or force_excluded:
+                tex.append(tax)
+            else:
+                tin.append(tax)
+        res = []
+        unit_lines = []
+        for price_unit, quantity, product, partner in lines:
+            totalin = totalex = round(price_unit * quantity, precision)
+            line_tin = tin and self.compute_inv(cr, uid, tin, price_unit, quantity, product=product, partner=partner, precision=tax_compute_precision) or []
+            for r in line_tin:
+                totalex -= r.get('amount', 0.0)
+            totlex_qty = 0.0
+            try:
+                totlex_qty = totalex/quantity
+            except:
+                pass
+            res.append({'total': totalex, 'total_included': totalin, 'taxes': line_tin})
+            unit_lines.append((totlex_qty, product, partner, quantity))
+        for line_res, line_tex, unit_line in zip(res, self._unit_compute_lines(cr, uid, tex, unit_lines, version), unit_lines):
+            quantity = unit_line[3]
+            # same rounding as _compute()
+            total = 0.0
+            for r in line_tex:
+                if r.get('balance',False):
+                    r['amount'] = round(r.get('balance', 0.0) * quantity, tax_compute_precision) - total
+                else:
+                    r['amount'] = round(r.get('amount', 0.0) * quantity, tax_compute_precision)
+                    total += r['amount']
+            for r in line_tex:
+                line_res['total_included'] += r.get('amount', 0.0)
+            line_res['taxes'] = line_res['taxes'] + line_tex
         return res
 
     def onchange_tax_type(self, cr, uid, ids, name, tax_type=False, context=None):
@@ -174,22 +463,302 @@ class account_invoice_tax(osv.osv):
         'date_iseeu': fields.date('Issue Date'),
         'is_form': fields.boolean('Inter-State Tax')
     }
-    
-    def compute(self, cr, uid, invoice_id, context=None):
-        res = super(account_invoice_tax, self).compute(cr, uid, invoice_id, context=None)
+
+    _contribution_key_columns = ['tax_code_id', 'base_code_id', 'account_id', 'account_analytic_id']
+    _contribution_amount_columns = ['base', 'amount', 'base_amount', 'tax_amount']
+
+    def _set_tax_categ(self, cr, uid, tax_grouped, context=None):
         account_tax_obj = self.pool.get('account.tax')
-        for key in res:
+        for key in tax_grouped:
             tax_code_id = key[0]
             base_code_id = key[1]
             tax_id = account_tax_obj.search(cr, uid, [('tax_code_id', '=', tax_code_id), ('base_code_id', '=', base_code_id)], context=context)
             for id in tax_id:
                 tax = account_tax_obj.browse(cr, uid, id, context=context)
-                res[key]['tax_categ'] = tax.tax_categ
-                res[key]['is_form'] = tax.is_form
+                tax_grouped[key]['tax_categ'] = tax.tax_categ
+                tax_grouped[key]['is_form'] = tax.is_form
+        return tax_grouped
+
+    def compute(self, cr, uid, invoice_id, context=None):
+        res = super(account_invoice_tax, self).compute(cr, uid, invoice_id, context=None)
+        return self._set_tax_categ(cr, uid, res, context=context)
+
+    def _lines_tax_values(self, cr, uid, inv, lines, context=None):
+        """
+        -Process
+            -Taxes of invoice lines, lines having the same taxes are computed
+             together with compute_all_lines(), on tax plans of one version.
+        -Return
+            -{line id: list of tax values of line, as _line_tax_values()}
+        """
+        tax_obj = self.pool.get('account.tax')
+        lines_by_taxes = {}
+        for line in lines:
+            lines_by_taxes.setdefault(tuple([tax.id for tax in line.invoice_line_tax_id]), []).append(line)
+        res = {}
+        version = tax_obj._tax_plan_version(cr)
+        for tax_lines in lines_by_taxes.values():
+            computed = tax_obj.compute_all_lines(cr, uid, tax_lines[0].invoice_line_tax_id,
+                                                 [((line.price_unit* (1-(line.discount or 0.0)/100.0)), line.quantity, line.product_id, inv.partner_id)
+                                                  for line in tax_lines], version=version)
+            for line, line_computed in zip(tax_lines, computed):
+                res[line.id] = self._line_tax_values(cr, uid, inv, line, line_computed['taxes'], context=context)
+        return res
+
+    def _line_tax_values(self, cr, uid, inv, line, taxes, context=None):
+        """
+        -Process
+            -Tax values of one invoice line from its compute_all() taxes, the same
+             way compute() does for each line before grouping them.
+        -Return
+            -list of tax values of line, not grouped and not rounded
+        """
+        cur_obj = self.pool.get('res.currency')
+        cur = inv.currency_id
+        company_currency = inv.company_id.currency_id.id
+        date_ctx = {'date': inv.date_invoice or time.strftime('%Y-%m-%d')}
+        res = []
+        for tax in taxes:
+            val = {}
+            val['invoice_id'] = inv.id
+            val['line_id'] = line.id
+            val['name'] = tax['name']
+            val['amount'] = tax['amount']
+            val['sequence'] = tax['sequence']
+            val['base'] = cur_obj.round(cr, uid, cur, tax['price_unit'] * line['quantity'])
+            if inv.type in ('out_invoice','in_invoice'):
+                val['base_code_id'] = tax['base_code_id']
+                val['tax_code_id'] = tax['tax_code_id']
+                val['base_amount'] = cur_obj.compute(cr, uid, cur.id, company_currency, val['base'] * tax['base_sign'], context=date_ctx, round=False)
+                val['tax_amount'] = cur_obj.compute(cr, uid, cur.id, company_currency, val['amount'] * tax['tax_sign'], context=date_ctx, round=False)
+                val['account_id'] = tax['account_collected_id'] or line.account_id.id
+                val['account_analytic_id'] = tax['account_analytic_collected_id']
+            else:
+                val['base_code_id'] = tax['ref_base_code_id']
+                val['tax_code_id'] = tax['ref_tax_code_id']
+                val['base_amount'] = cur_obj.compute(cr, uid, cur.id, company_currency, val['base'] * tax['ref_base_sign'], context=date_ctx, round=False)
+                val['tax_amount'] = cur_obj.compute(cr, uid, cur.id, company_currency, val['amount'] * tax['ref_tax_sign'], context=date_ctx, round=False)
+                val['account_id'] = tax['account_paid_id'] or line.account_id.id
+                val['account_analytic_id'] = tax['account_analytic_paid_id']
+            res.append(val)
+        return res
+
+    def _contribution_keys(self, cr, uid, line_ids):
+        if not line_ids:
+            return set()
+        cr.execute("SELECT DISTINCT " + ", ".join(self._contribution_key_columns) + " FROM account_invoice_tax_contribution WHERE line_id IN %s", (tuple(line_ids),))
+        return set([tuple([x or False for x in row]) for row in cr.fetchall()])
+
+    def _store_contributions(self, cr, uid, inv, lines, context=None):
+        """
+        -Process
+            -Replace stored tax contributions of given lines of invoice by new ones
+        -Return
+            -set of grouping keys of new contributions
+        """
+        columns = ['invoice_id', 'line_id', 'name', 'sequence'] + self._contribution_key_columns
+        if lines:
+            cr.execute("DELETE FROM account_invoice_tax_contribution WHERE line_id IN %s", (tuple([line.id for line in lines]),))
+        keys = set()
+        params = []
+        rows = 0
+        tax_values = self._lines_tax_values(cr, uid, inv, lines, context=context)
+        for line in lines:
+            for val in tax_values[line.id]:
+                keys.add(tuple([val[c] or False for c in self._contribution_key_columns]))
+                params.extend([val[c] or None for c in columns])
+                params.extend([val[c] or 0.0 for c in self._contribution_amount_columns])
+                params.extend([uid, uid])
+                rows += 1
+        if rows:
+            columns = columns + self._contribution_amount_columns
+            row = "(" + ", ".join(["%s"] * len(columns)) + ", %s, (now() at time zone 'UTC'), %s, (now() at time zone 'UTC'))"
+            cr.execute("INSERT INTO account_invoice_tax_contribution (" + ", ".join(columns) + ", create_uid, create_date, write_uid, write_date) "
+                       "VALUES " + ", ".join([row] * rows), params)
+        return keys
+
+    def _group_contributions(self, cr, uid, inv, keys=None, context=None):
+        """
+        -Process
+            -Group stored contributions of invoice like compute() does, lines are read
+             in invoice line order so amounts are summed in the same order.
+            -Only contributions of given keys when keys are given
+        -Return
+            -{(tax_code_id, base_code_id, account_id, account_analytic_id): values}
+        """
+        cur_obj = self.pool.get('res.currency')
+        cur = inv.currency_id
+        tax_grouped = {}
+        if keys is not None and not keys:
+            return tax_grouped
+        columns = ['name', 'sequence'] + self._contribution_key_columns + self._contribution_amount_columns
+        cr.execute("""  SELECT """ + ", ".join(['c.' + col for col in columns]) + """
+                        FROM account_invoice_tax_contribution c
+                        JOIN account_invoice_line l ON (l.id = c.line_id)
+                        WHERE c.invoice_id = %s
+                        ORDER BY l.sequence, l.id, c.id """, (inv.id,))
+        for row in cr.dictfetchall():
+            key = tuple([row[c] or False for c in self._contribution_key_columns])
+            if keys is not None and key not in keys:
+                continue
+            if not key in tax_grouped:
+                val = dict([(c, row[c] or False) for c in self._contribution_key_columns])
+                val.update({
+                    'invoice_id': inv.id,
+                    'name': row['name'],
+                    'manual': False,
+                    'sequence': row['sequence'],
+                })
+                val.update(dict([(c, row[c]) for c in self._contribution_amount_columns]))
+                tax_grouped[key] = val
+            else:
+                for c in self._contribution_amount_columns:
+                    tax_grouped[key][c] += row[c]
+        for t in tax_grouped.values():
+            for c in self._contribution_amount_columns:
+                t[c] = cur_obj.round(cr, uid, cur, t[c])
+        return self._set_tax_categ(cr, uid, tax_grouped, context=context)
+
+    def seed_contributions(self, cr, uid, invoice_ids, context=None):
+        """
+        -Process
+            -Store tax contributions of all lines of invoices, base of incremental mode.
+        """
+        for inv in self.pool.get('account.invoice').browse(cr, uid, invoice_ids, context=context):
+            cr.execute("DELETE FROM account_invoice_tax_contribution WHERE invoice_id = %s", (inv.id,))
+            self._store_contributions(cr, uid, inv, inv.invoice_line, context=context)
+        return True
+
+    def compute_incremental(self, cr, uid, invoice_id, line_ids, removed=False, context=None):
+        """
+        -Process
+            -Recompute contributions of changed lines only (drop them when removed),
+            -Regroup and update only computed tax rows whose keys were touched,
+             manual tax rows are never changed.
+        -Return
+            -set of touched keys
+        """
+        line_obj = self.pool.get('account.invoice.line')
+        inv = self.pool.get('account.invoice').browse(cr, uid, invoice_id, context=context)
+        keys = self._contribution_keys(cr, uid, line_ids)
+        if removed:
+            if line_ids:
+                cr.execute("DELETE FROM account_invoice_tax_contribution WHERE line_id IN %s", (tuple(line_ids),))
+        else:
+            lines = [line for line in line_obj.browse(cr, uid, line_ids, context=context) if line.invoice_id.id == invoice_id]
+            keys |= self._store_contributions(cr, uid, inv, lines, context=context)
+        if not keys:
+            return keys
+        tax_grouped = self._group_contributions(cr, uid, inv, keys, context=context)
+        existing = {}
+        tax_ids = self.search(cr, uid, [('invoice_id', '=', invoice_id), ('manual', '=', False)], context=context)
+        for tax in self.read(cr, uid, tax_ids, self._contribution_key_columns, context=context):
+            key = tuple([tax[c] and tax[c][0] or False for c in self._contribution_key_columns])
+            if key in keys:
+                existing.setdefault(key, []).append(tax['id'])
+        to_unlink = []
+        for key in keys:
+            ids = existing.get(key, [])
+            if key in tax_grouped:
+                if ids:
+                    self.write(cr, uid, ids[:1], tax_grouped[key], context=context)
+                    to_unlink.extend(ids[1:])
+                else:
+                    self.create(cr, uid, tax_grouped[key], context=context)
+            else:
+                to_unlink.extend(ids)
+        if to_unlink:
+            self.unlink(cr, uid, to_unlink, context=context)
+        return keys
+
+    def check_incremental(self, cr, uid, invoice_id, context=None):
+        """
+        -Process
+            -Compare taxes grouped from stored contributions with a full compute()
+        -Return
+            -list of keys which differ, empty when incremental taxes are consistent
+        """
+        inv = self.pool.get('account.invoice').browse(cr, uid, invoice_id, context=context)
+        full = self.compute(cr, uid, invoice_id, context=context)
+        incremental = self._group_contributions(cr, uid, inv, context=context)
+        res = []
+        for key in set(full.keys()) | set(incremental.keys()):
+            if key not in full or key not in incremental or \
+                    [full[key][c] for c in self._contribution_amount_columns] != [incremental[key][c] for c in self._contribution_amount_columns]:
+                res.append(key)
         return res
 
 account_invoice_tax()
 
+class account_invoice_tax_contribution(osv.osv):
+    _name = 'account.invoice.tax.contribution'
+    _description = 'Invoice Line Tax Contribution'
+    _columns = {
+        'invoice_id': fields.many2one('account.invoice', 'Invoice', required=True, ondelete='cascade', select=True),
+        'line_id': fields.many2one('account.invoice.line', 'Invoice Line', required=True, ondelete='cascade', select=True),
+        'name': fields.char('Tax Description', size=64),
+        'sequence': fields.integer('Sequence'),
+        'tax_code_id': fields.many2one('account.tax.code', 'Tax Code'),
+        'base_code_id': fields.many2one('account.tax.code', 'Base Code'),
+        'account_id': fields.many2one('account.account', 'Tax Account'),
+        'account_analytic_id': fields.many2one('account.analytic.account', 'Analytic account'),
+        'base': fields.float('Base'),
+        'amount': fields.float('Amount'),
+        'base_amount': fields.float('Base Code Amount'),
+        'tax_amount': fields.float('Tax Code Amount'),
+    }
+account_invoice_tax_contribution()
+
+class account_invoice_line(osv.osv):
+    _inherit = 'account.invoice.line'
+
+    _tax_fields = ['price_unit', 'discount', 'quantity', 'invoice_line_tax_id', 'product_id', 'account_id', 'invoice_id']
+
+    def _incremental_invoices(self, cr, uid, ids, context=None):
+        """
+        -Return
+            -{invoice_id: [line ids]} of draft invoices having incremental taxes
+        """
+        res = {}
+        if not ids:
+            return res
+        cr.execute("""  SELECT l.invoice_id, l.id FROM account_invoice_line l
+                        JOIN account_invoice i ON (i.id = l.invoice_id)
+                        WHERE l.id IN %s AND i.tax_incremental AND i.state = 'draft' """, (tuple(ids),))
+        for invoice_id, line_id in cr.fetchall():
+            res.setdefault(invoice_id, []).append(line_id)
+        return res
+
+    def _compute_incremental(self, cr, uid, ids, removed=False, context=None):
+        invoice_tax_obj = self.pool.get('account.invoice.tax')
+        for invoice_id, line_ids in self._incremental_invoices(cr, uid, ids, context=context).items():
+            invoice_tax_obj.compute_incremental(cr, uid, invoice_id, line_ids, removed=removed, context=context)
+        return True
+
+    def create(self, cr, uid, vals, context=None):
+        res = super(account_invoice_line, self).create(cr, uid, vals, context=context)
+        self._compute_incremental(cr, uid, [res], context=context)
+        return res
+
+    def write(self, cr, uid, ids, vals, context=None):
+        if isinstance(ids, (int, long)):
+            ids = [ids]
+        if not set(vals.keys()) & set(self._tax_fields):
+            return super(account_invoice_line, self).write(cr, uid, ids, vals, context=context)
+        if 'invoice_id' in vals:
+            self._compute_incremental(cr, uid, ids, removed=True, context=context)
+        res = super(account_invoice_line, self).write(cr, uid, ids, vals, context=context)
+        self._compute_incremental(cr, uid, ids, context=context)
+        return res
+
+    def unlink(self, cr, uid, ids, context=None):
+        if isinstance(ids, (int, long)):
+            ids = [ids]
+        self._compute_incremental(cr, uid, ids, removed=True, context=context)
+        return super(account_invoice_line, self).unlink(cr, uid, ids, context=context)
+
+account_invoice_line()
+
 class res_partner(osv.osv):
     
     _inherit = "res.partner"
@@ -251,8 +820,38 @@ class account_invoice(osv.osv):
     _inherit = 'account.invoice'
     
     _columns = {
-        'invoice_type_id': fields.many2one('account.invoice.type', 'Invoice')
+        'invoice_type_id': fields.many2one('account.invoice.type', 'Invoice'),
+        'tax_incremental': fields.boolean('Incremental Taxes', help="Keep tax lines up to date line by line when invoice lines are changed, instead of recomputing all taxes with Update."),
     }
+
+    # invoice fields every tax contribution of its lines depends on
+    _tax_header_fields = ['currency_id', 'date_invoice', 'partner_id', 'fiscal_position', 'type']
+
+    def write(self, cr, uid, ids, vals, context=None):
+        """
+        -Process
+            -Contributions are seeded when incremental taxes are enabled,
+            -a change of a field all contributions depend on recomputes all computed
+             taxes of incremental draft invoices, which seeds contributions again.
+        """
+        res = super(account_invoice, self).write(cr, uid, ids, vals, context=context)
+        if isinstance(ids, (int, long)):
+            ids = [ids]
+        if [name for name in self._tax_header_fields if name in vals]:
+            incremental_ids = [inv.id for inv in self.browse(cr, uid, ids, context=context) if inv.tax_incremental and inv.state == 'draft']
+            if incremental_ids:
+                self.button_reset_taxes(cr, uid, incremental_ids, context=context)
+            ids = [x for x in ids if x not in incremental_ids]
+        if vals.get('tax_incremental') and ids:
+            self.pool.get('account.invoice.tax').seed_contributions(cr, uid, ids, context=context)
+        return res
+
+    def button_reset_taxes(self, cr, uid, ids, context=None):
+        res = super(account_invoice, self).button_reset_taxes(cr, uid, ids, context=context)
+        incremental_ids = [inv.id for inv in self.browse(cr, uid, ids, context=context) if inv.tax_incremental]
+        if incremental_ids:
+            self.pool.get('account.invoice.tax').seed_contributions(cr, uid, incremental_ids, context=context)
+        return res
     
     def onchange_invoice_type(self, cr, uid, ids, invoice_type_id, context=None):
         res = {}
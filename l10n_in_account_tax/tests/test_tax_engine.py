@@ -0,0 +1,252 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+#    OpenERP, Open Source Management Solution
+#    Copyright (C) 2004-2013 Tiny SPRL (<http://tiny.be>).
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as
+#    published by the Free Software Foundation, either version 3 of the
+#    License, or (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+##############################################################################
+
+
+from openerp.tests import common
+
+PRICES = [100.0, 99.99, 0.0, -25.5, 1234.5678, 0.01, 150.0, 33.333]
+QUANTITIES = [1.0, 3.5, 0.0, 2.0, 7.0, 1000.0, 12.0, 0.333]
+
+def legacy_unit_compute(tax_obj, cr, uid, taxes, price_unit, product=None, partner=None, quantity=0):
+    """_unit_compute of l10n_in_account_tax before tax plans, kept as reference."""
+    taxes = tax_obj._applicable(cr, uid, taxes, price_unit , product, partner)
+    res = []
+    cur_price_unit = price_unit
+    for tax in taxes:
+        data = {
+            'id':tax.id,
+            'name':tax.description and tax.description + " - " + tax.name or tax.name,
+            'account_collected_id':tax.account_collected_id.id,
+            'account_paid_id':tax.account_paid_id.id,
+            'account_analytic_collected_id': tax.account_analytic_collected_id.id,
+            'account_analytic_paid_id': tax.account_analytic_paid_id.id,
+            'base_code_id': tax.base_code_id.id,
+            'ref_base_code_id': tax.ref_base_code_id.id,
+            'sequence': tax.sequence,
+            'base_sign': tax.base_sign,
+            'tax_sign': tax.tax_sign,
+            'ref_base_sign': tax.ref_base_sign,
+            'ref_tax_sign': tax.ref_tax_sign,
+            'price_unit': cur_price_unit,
+            'tax_code_id': tax.tax_code_id.id,
+            'ref_tax_code_id': tax.ref_tax_code_id.id,
+            'include_base_amount': tax.include_base_amount,
+            'parent_id':tax.parent_id
+        }
+        res.append(data)
+        if tax.type == 'percent':
+            amount = cur_price_unit * tax.amount
+            data['amount'] = amount
+
+        elif tax.type == 'fixed':
+            data['amount'] = tax.amount
+            data['tax_amount'] = quantity
+        elif tax.type == 'code':
+            localdict = {'price_unit':cur_price_unit, 'product':product, 'partner':partner}
+            exec tax.python_compute in localdict
+            amount = localdict['result']
+            data['amount'] = amount
+        elif tax.type == 'balance':
+            data['amount'] = cur_price_unit - reduce(lambda x, y: y.get('amount', 0.0) + x, res, 0.0)
+            data['balance'] = cur_price_unit
+
+        amount2 = data.get('amount', 0.0)
+        if tax.child_ids:
+            if tax.child_depend:
+                latest = res.pop()
+            amount = amount2
+            child_tax = legacy_unit_compute(tax_obj, cr, uid, tax.child_ids, amount, product, partner, quantity)
+            for ctax in child_tax:
+                ctax['parent_tax'] = tax.id
+
+            res.extend(child_tax)
+            if tax.child_depend:
+                for r in res:
+                    for name in ('base', 'ref_base'):
+                        if latest[name + '_code_id'] and latest[name + '_sign'] and not r[name + '_code_id']:
+                            r[name + '_code_id'] = latest[name + '_code_id']
+                            r[name + '_sign'] = latest[name + '_sign']
+                            r['price_unit'] = latest['price_unit']
+                            latest[name + '_code_id'] = False
+                    for name in ('tax', 'ref_tax'):
+                        if latest[name + '_code_id'] and latest[name + '_sign'] and not r[name + '_code_id']:
+                            r[name + '_code_id'] = latest[name + '_code_id']
+                            r[name + '_sign'] = latest[name + '_sign']
+                            r['amount'] = data['amount']
+                            latest[name + '_code_id'] = False
+
+        if tax.include_base_amount:
+            cur_price_unit += amount2
+            for r in res:
+                if 'parent_tax' in r and r['parent_tax'] == tax.id:
+                    cur_price_unit += r['amount']
+    return res
+
+class test_tax_engine(common.TransactionCase):
+    """compute_all() on tax plans and compute_all_lines() give exactly the
+    results of the browse record engine."""
+
+    def setUp(self):
+        super(test_tax_engine, self).setUp()
+        cr, uid = self.cr, self.uid
+        self.tax_obj = self.registry('account.tax')
+        code_obj = self.registry('account.tax.code')
+
+        def tax_code(name):
+            return code_obj.create(cr, uid, {'name': name})
+
+        excise_code = tax_code('Excise 12%')
+        cess_code = tax_code('Edu.cess 2% on Excise 12%')
+        self.excise_id = self.tax_obj.create(cr, uid, {
+            'name': 'Excise 12%',
+            'tax_categ': 'excise',
+            'sequence': 10,
+            'type': 'percent',
+            'amount': 0.12,
+            'include_base_amount': True,
+            'base_code_id': excise_code,
+            'tax_code_id': excise_code,
+            'child_ids': [(0, 0, {
+                'name': 'Edu.cess 2% on Excise 12%',
+                'tax_categ': 'cess',
+                'sequence': 11,
+                'type': 'percent',
+                'amount': 0.02,
+                'base_code_id': cess_code,
+                'tax_code_id': cess_code,
+            }), (0, 0, {
+                'name': 'H. Edu.cess 1% on Excise 12%',
+                'tax_categ': 'hedu_cess',
+                'sequence': 12,
+                'type': 'percent',
+                'amount': 0.01,
+                'base_code_id': cess_code,
+                'tax_code_id': cess_code,
+            })],
+        })
+        self.vat_id = self.tax_obj.create(cr, uid, {
+            'name': 'VAT 5%',
+            'description': 'VAT',
+            'tax_categ': 'vat',
+            'sequence': 20,
+            'type': 'percent',
+            'amount': 0.05,
+            'base_code_id': tax_code('VAT 5%'),
+        })
+        self.add_vat_id = self.tax_obj.create(cr, uid, {
+            'name': 'Additional VAT 1%',
+            'tax_categ': 'add_vat',
+            'sequence': 21,
+            'type': 'code',
+            'python_compute': 'result = price_unit * 0.01',
+        })
+        self.cst_id = self.tax_obj.create(cr, uid, {
+            'name': 'CST 2% + 0.5',
+            'tax_categ': 'cst',
+            'sequence': 22,
+            'type': 'code',
+            'python_compute': 'result = price_unit * 0.02 + 0.5',
+        })
+        self.service_id = self.tax_obj.create(cr, uid, {
+            'name': 'Service Tax',
+            'tax_categ': 'service',
+            'sequence': 30,
+            'type': 'percent',
+            'amount': 0.12,
+            'child_depend': True,
+            'base_code_id': tax_code('Service Tax'),
+            'tax_code_id': tax_code('Service Tax Amount'),
+            'child_ids': [(0, 0, {
+                'name': 'Service Tax Share',
+                'sequence': 31,
+                'type': 'percent',
+                'amount': 0.6,
+            }), (0, 0, {
+                'name': 'Service Tax Balance',
+                'sequence': 32,
+                'type': 'balance',
+            })],
+        })
+        self.fixed_id = self.tax_obj.create(cr, uid, {
+            'name': 'Octroi',
+            'tax_categ': 'other',
+            'sequence': 40,
+            'type': 'fixed',
+            'amount': 2.5,
+        })
+        self.applicable_id = self.tax_obj.create(cr, uid, {
+            'name': 'Surcharge over 100',
+            'tax_categ': 'other',
+            'sequence': 5,
+            'type': 'percent',
+            'amount': 0.015,
+            'include_base_amount': True,
+            'applicable_type': 'code',
+            'python_applicable': 'result = price_unit > 100',
+        })
+
+    def _normalize(self, res):
+        taxes = []
+        for tax in res['taxes']:
+            tax = dict(tax)
+            tax['parent_id'] = tax['parent_id'] and tax['parent_id'].id or False
+            taxes.append(tax)
+        return dict(res, taxes=taxes)
+
+    def _legacy_compute_all(self, taxes, price_unit, quantity):
+        tax_obj = self.tax_obj
+        tax_obj._unit_compute = lambda cr, uid, taxes, price_unit, product=None, partner=None, quantity=0: \
+            legacy_unit_compute(tax_obj, cr, uid, taxes, price_unit, product, partner, quantity)
+        try:
+            return tax_obj.compute_all(self.cr, self.uid, taxes, price_unit, quantity)
+        finally:
+            del tax_obj._unit_compute
+
+    def _check_chain(self, tax_ids):
+        cr, uid = self.cr, self.uid
+        taxes = self.tax_obj.browse(cr, uid, tax_ids)
+        legacy = [self._normalize(self._legacy_compute_all(taxes, price_unit, quantity))
+                  for price_unit, quantity in zip(PRICES, QUANTITIES)]
+        single = [self._normalize(self.tax_obj.compute_all(cr, uid, taxes, price_unit, quantity))
+                  for price_unit, quantity in zip(PRICES, QUANTITIES)]
+        lines = [self._normalize(res) for res in self.tax_obj.compute_all_lines(cr, uid, taxes,
+                 [(price_unit, quantity, None, None) for price_unit, quantity in zip(PRICES, QUANTITIES)])]
+        self.assertEqual(single, legacy)
+        self.assertEqual(lines, legacy)
+
+    def test_excise_cess_vat(self):
+        self._check_chain([self.excise_id, self.vat_id])
+
+    def test_excise_code_taxes(self):
+        self._check_chain([self.excise_id, self.vat_id, self.add_vat_id, self.cst_id])
+
+    def test_child_depend_balance(self):
+        self._check_chain([self.service_id, self.fixed_id])
+
+    def test_applicable_code(self):
+        self._check_chain([self.applicable_id, self.excise_id, self.vat_id, self.fixed_id])
+
+    def test_plan_follows_writes(self):
+        self._check_chain([self.excise_id, self.vat_id])
+        self.tax_obj.write(self.cr, self.uid, [self.vat_id], {'amount': 0.145, 'name': 'VAT 14.5%'})
+        self._check_chain([self.excise_id, self.vat_id])
+
+# vim:expandtab:smartindent:tabstop=4:softtabstop=4:shiftwidth=4:
@@ -20,6 +20,7 @@
 ##############################################################################
 
 import res_config
+import orm_bulk
 
 # vim:expandtab:smartindent:tabstop=4:softtabstop=4:shiftwidth=4:
 
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+#    OpenERP, Open Source Business Applications
+#    Copyright (C) 2004-2012 OpenERP S.A. (<http://openerp.com>).
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as
+#    published by the Free Software Foundation, either version 3 of the
+#    License, or (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+##############################################################################
+
+from openerp.osv import fields
+
+def insert_m2m_rows(cr, model, field_name, pairs):
+    """
+    -Process
+        -Link (record id, related id) pairs of a many2many field of model with one insert.
+    """
+    if not pairs:
+        return
+    table, col1, col2 = model._columns[field_name]._sql_names(model)
+    cr.execute('INSERT INTO "' + table + '" ("' + col1 + '", "' + col2 + '") VALUES ' + ", ".join(["(%s, %s)"] * len(pairs)),
+               [x for pair in pairs for x in pair])
+
+def bulk_insert(model, cr, uid, vals_list, context=None):
+    """
+    -Process
+        -Insert records of model with one statement, defaults of fields missing
+         from some values are read once,
+        -many2many values given as (6, 0, ids) or (4, id) are linked with one insert per field,
+        -stored function fields given in every values are inserted as is, other stored
+         fields and stored fields of other models depending on the new records are computed once,
+        -constraints of model are checked on all new records.
+      Unlike create(), no create() override, workflow or mail.thread hook is run,
+      so it is only used for models which do not need them.
+    -Return
+        -ids of created records, in order of vals_list
+    """
+    assert not model._inherits and not model._parent_store, 'bulk_insert() does not handle %s' % (model._name,)
+    if not vals_list:
+        return []
+    columns = model._columns
+    simple = [name for name, column in columns.items() if column._classic_write and not isinstance(column, fields.function)]
+    m2m = [name for name, column in columns.items() if isinstance(column, fields.many2many)]
+    given = [name for name, column in columns.items() if isinstance(column, fields.function) and column.store
+             and not [vals for vals in vals_list if name not in vals]]
+
+    missing = [name for name in simple + m2m if [vals for vals in vals_list if name not in vals]]
+    defaults = missing and model.default_get(cr, uid, missing, context=context) or {}
+    rows = []
+    for vals in vals_list:
+        row = dict(defaults)
+        row.update(vals)
+        rows.append(row)
+    insert = [name for name in simple + given if [row for row in rows if name in row]]
+
+    params = []
+    for row in rows:
+        for name in insert:
+            if name in row:
+                params.append(columns[name]._symbol_set[1](row[name]))
+            else:
+                params.append(None)
+        params.extend([uid, uid])
+    values = "(" + ", ".join(["%s"] * len(insert)) + ", %s, (now() at time zone 'UTC'), %s, (now() at time zone 'UTC'))"
+    cr.execute('INSERT INTO "' + model._table + '" (' + ", ".join(['"%s"' % name for name in insert]) + ', create_uid, create_date, write_uid, write_date) '
+               'VALUES ' + ", ".join([values] * len(rows)) + ' RETURNING id', params)
+    ids = [x[0] for x in cr.fetchall()]
+
+    for name in m2m:
+        pairs = []
+        for record_id, row in zip(ids, rows):
+            for command in row.get(name) or []:
+                if command[0] == 6:
+                    pairs.extend([(record_id, rel_id) for rel_id in command[2]])
+                elif command[0] == 4:
+                    pairs.append((record_id, command[1]))
+        insert_m2m_rows(cr, model, name, pairs)
+
+    recompute_stored(model, cr, uid, ids, columns.keys(), skip=given, context=context)
+    model._validate(cr, uid, ids, context)
+    return ids
+
+def recompute_stored(model, cr, uid, ids, field_names, skip=(), context=None):
+    """
+    -Process
+        -Compute stored function fields depending on given fields of records of model
+         written without the ORM, in priority order and once per (model, ids, fields)
+         like create() and write() do,
+        -stored fields of model listed in skip are left as they are.
+    """
+    result = model._store_get_values(cr, uid, ids, field_names, context)
+    result.sort()
+    done = []
+    for order, model_name, store_ids, store_fields in result:
+        if model_name == model._name:
+            store_fields = [name for name in store_fields if name not in skip]
+        if store_fields and (model_name, store_ids, store_fields) not in done:
+            model.pool.get(model_name)._store_set_values(cr, uid, store_ids, store_fields, context)
+            done.append((model_name, store_ids, store_fields))
+    return True
@@ -172,42 +172,42 @@ class stock_picking(osv.Model):
         return res
 
     def do_partial(self, cr, uid, ids, partial_datas, context=None):
+        """
+        -Process
+            -after partial processing, one excise receipt is created for each received
+             picking which is not free of cost, with copies of its done moves,
+            -warehouse locations are read once per warehouse for all pickings.
+        """
+        if context is None:
+            context = {}
         receipt_obj = self.pool.get('stock.picking.receipt')
         stock_move = self.pool.get('stock.move')
         warehouse_obj = self.pool.get('stock.warehouse')
 
         res = super(stock_picking, self).do_partial(cr, uid, ids, partial_datas, context=context)
 
-        vals = {}
         if context.get('default_type') == 'in':
-            move_line = []
+            warehouse_locations = {}
             for pick in self.browse(cr, uid, ids, context=context):
                 if pick.inward_type == 'foc':
                     continue
 
-                warehouse_dict = False
                 if pick.purchase_id:
-                    warehouse_dict = warehouse_obj.read(cr, uid, pick.warehouse_id.id, ['lot_input_id', 'lot_stock_id'], context=context)
+                    warehouse_id = pick.warehouse_id.id
                 else:
                     warehouse_ids = warehouse_obj.search(cr, uid, [('company_id','=',pick.company_id.id)])
-                    if warehouse_ids:
-                        warehouse_dict = warehouse_obj.read(cr, uid, warehouse_ids[0], ['lot_input_id', 'lot_stock_id'], context=context)
-                    else:
+                    if not warehouse_ids:
                         raise osv.except_osv(_('Configuration Error!'), _('Unable to locate warehouse from Order or Company !'))
-
-                if pick.state == 'done':
-                    
-                    for move in pick.move_lines:
-                        dict1 = dict(location_id = warehouse_dict.get('lot_input_id', False)[0], location_dest_id = warehouse_dict.get('lot_stock_id', False)[0])
-                        move_line.append(stock_move.copy(cr, uid, move.id, dict1, context=context))
-                    vals.update({'inward_id': pick.id or False})
-                else:
-                    for move in pick.backorder_id.move_lines:
-                        dict1 = dict(location_id = warehouse_dict.get('lot_input_id', False)[0], location_dest_id = warehouse_dict.get('lot_stock_id', False)[0])
-                        move_line.append(stock_move.copy(cr, uid, move.id, dict1, context=context))
-                    vals.update({'inward_id': pick.backorder_id and pick.backorder_id.id or False})
-
-                vals.update({'name': self.pool.get('ir.sequence').get(cr, uid, 'stock.picking.receipt'),
+                    warehouse_id = warehouse_ids[0]
+                if warehouse_id not in warehouse_locations:
+                    warehouse_dict = warehouse_obj.read(cr, uid, warehouse_id, ['lot_input_id', 'lot_stock_id'], context=context)
+                    warehouse_locations[warehouse_id] = dict(location_id = warehouse_dict.get('lot_input_id', False)[0], location_dest_id = warehouse_dict.get('lot_stock_id', False)[0])
+
+                inward = pick.state == 'done' and pick or pick.backorder_id
+                move_line = [stock_move.copy(cr, uid, move.id, warehouse_locations[warehouse_id], context=context) for move in inward.move_lines]
+                receipt_obj.create(cr, uid, {
+                    'inward_id': inward.id or False,
+                    'name': self.pool.get('ir.sequence').get(cr, uid, 'stock.picking.receipt'),
                     'partner_id': pick.partner_id.id,
                     'stock_journal_id': pick.stock_journal_id.id or False,
                     'origin': pick.origin or False,
@@ -217,8 +217,7 @@ class stock_picking(osv.Model):
                     'challan_no':pick.challan_no,
                     'date_done':pick.date_done,
                     'invoice_state': pick.invoice_state,
-                })
-            receipt_obj.create(cr, uid, vals, context=context)
+                }, context=context)
 
         return res
 
@@ -27,7 +27,7 @@
 		Extend the flow of manufacturing process
     ''',
     'author': 'OpenERP SA',
-    'depends': ['base','sale_stock','mrp_jit','mrp_operations','l10n_in_account_tax','hr'],
+    'depends': ['base','sale_stock','mrp_jit','mrp_operations','l10n_in_account_tax','l10n_in_purchase','hr'],
     'data': ['wizard/change_receiveddate_inward_view.xml','wizard/change_qcapproved_date_view.xml',
              'wizard/common_date_updation_view.xml','wizard/mrp_partially_close_view.xml',
              'wizard/qc2reject_view.xml','wizard/stock_return_picking_view.xml',
@@ -41,7 +41,8 @@
              'wizard/consignment_variation_po_view.xml','wizard/qc2xlocation_view.xml',
              'wizard/split_production_order_qty_view.xml','wizard/mrp_product_produce_view.xml',
              'wizard/costing_analysis_report_view.xml','report/report_view.xml',
-             'report/export_report_view.xml','report/export_sequence.xml'
+             'report/export_report_view.xml','report/export_sequence.xml',
+             'report/mrp_workcenter_capacity_view.xml','wizard/production_moves_to_workcenter_view.xml'
              ],
     'demo': [],
     'installable': True,
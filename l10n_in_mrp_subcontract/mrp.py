@@ -28,7 +28,9 @@ from openerp.tools.translate import _
 from openerp.tools import float_compare
 from openerp.tools import DEFAULT_SERVER_DATETIME_FORMAT
 from openerp import tools
+from openerp.addons.l10n_in_base.orm_bulk import bulk_insert, recompute_stored
 from datetime import datetime
+import re
 
 STATE_SELECTION = [
         ('draft', 'Draft'),
@@ -56,17 +58,46 @@ class mrp_production(osv.osv):
             -Find already Produce Qty from Manufacturing Order.
         """
         result = dict([(id, {'already_produced_qty': 0.0}) for id in ids])
-        for prod in self.browse(cr, uid, ids, context=context):
-            done = -(prod.scraped_qty)
-            for move in prod.move_created_ids2:
-                if move.product_id == prod.product_id:
-                    #ignore scrapped and extra consumed and cancel moves
-                    if move.state <> 'cancel':
-                        if (not move.scrapped) or (not move.extra_consumed):
-                            done += move.product_qty
-            result[prod.id]['already_produced_qty'] = done
+        if not ids:
+            return result
+        cr.execute(self._produced_qty_query + """ WHERE mp.id IN %s """, (tuple(ids),))
+        for production_id, done in cr.fetchall():
+            result[production_id]['already_produced_qty'] = done or 0.0
         return result
 
+    #ignore scrapped and extra consumed and cancel moves
+    _produced_qty_query = """
+        SELECT mp.id,
+            COALESCE((SELECT SUM(sm.product_qty) FROM stock_move sm
+                        WHERE sm.production_id = mp.id
+                        AND sm.product_id = mp.product_id
+                        AND sm.state = 'done'
+                        AND NOT (COALESCE(sm.scrapped, False) AND COALESCE(sm.extra_consumed, False))
+                    ), 0.0) - COALESCE(mp.scraped_qty, 0.0)
+        FROM mrp_production mp """
+
+    def _order_number_calc(self, cr, uid, ids, name, args, context=None):
+        """
+        Process
+            -Numeric part at end of order reference (MO/00123 => 123),
+             indexed for range search on costing analysis.
+        """
+        result = dict.fromkeys(ids, 0)
+        for prod in self.read(cr, uid, ids, ['name'], context=context):
+            number = re.search(r'(\d{1,9})\s*$', prod['name'] or '')
+            result[prod['id']] = number and int(number.group(1)) or 0
+        return result
+
+    def _get_production_from_finished_move(self, cr, uid, ids, context=None):
+        """
+        Process
+            -Store trigger, self is stock.move here.
+            -Only moves of a production matter for produced quantity.
+        """
+        cr.execute("""SELECT DISTINCT production_id FROM stock_move
+                        WHERE id IN %s AND production_id IS NOT NULL""", (tuple(ids),))
+        return [x[0] for x in cr.fetchall()]
+
     def _mrp_costing(self, cr, uid, ids, name, args, context=None):
         """
         Process
@@ -74,16 +105,44 @@ class mrp_production(osv.osv):
             -Actual Cost = cost hour * actual time
         """
         result = dict([(id, {'planned_cost': 0.0, 'actual_cost': 0.0}) for id in ids])
-        for order in self.browse(cr, uid, ids, context=context):
-            planned_cost = actual_cost = 0.0
-            for wo in order.workcenter_lines:
-                if wo.state == 'cancel': continue
-                planned_cost += wo.hour * wo.workcenter_id.costs_hour
-                actual_cost += wo.delay * wo.workcenter_id.costs_hour
-            result[order.id]['planned_cost'] = planned_cost
-            result[order.id]['actual_cost'] = actual_cost
+        if not ids:
+            return result
+        cr.execute("""  SELECT wo.production_id,
+                            SUM(COALESCE(wo.hour, 0.0) * COALESCE(wc.costs_hour, 0.0)),
+                            SUM(COALESCE(wo.delay, 0.0) * COALESCE(wc.costs_hour, 0.0))
+                        FROM mrp_production_workcenter_line wo
+                        JOIN mrp_workcenter wc ON (wc.id = wo.workcenter_id)
+                        WHERE wo.production_id IN %s
+                        AND COALESCE(wo.state, '') != 'cancel'
+                        GROUP BY wo.production_id """, (tuple(ids),))
+        for production_id, planned_cost, actual_cost in cr.fetchall():
+            result[production_id]['planned_cost'] = planned_cost or 0.0
+            result[production_id]['actual_cost'] = actual_cost or 0.0
         return result
 
+    def _get_production_from_workorder(self, cr, uid, ids, context=None):
+        """
+        Process
+            -Store trigger, self is mrp.production.workcenter.line here.
+        """
+        cr.execute("""SELECT DISTINCT production_id FROM mrp_production_workcenter_line
+                        WHERE id IN %s AND production_id IS NOT NULL""", (tuple(ids),))
+        return [x[0] for x in cr.fetchall()]
+
+    def _get_production_from_workcenter(self, cr, uid, ids, context=None):
+        """
+        Process
+            -Store trigger, self is mrp.workcenter here.
+        """
+        cr.execute("""SELECT DISTINCT production_id FROM mrp_production_workcenter_line
+                        WHERE workcenter_id IN %s AND production_id IS NOT NULL""", (tuple(ids),))
+        return [x[0] for x in cr.fetchall()]
+
+    _costing_store = {
+        'mrp.production.workcenter.line': (_get_production_from_workorder, ['hour', 'delay', 'state', 'workcenter_id', 'production_id'], 10),
+        'mrp.workcenter': (_get_production_from_workcenter, ['costs_hour'], 10),
+    }
+
     _columns = {
         'workcenter_lines': fields.one2many('mrp.production.workcenter.line', 'production_id', 'Work Centers Utilisation',
             readonly=False, states={'done':[('readonly', True)]}),
@@ -93,7 +152,13 @@ class mrp_production(osv.osv):
         'procurement_generated': fields.boolean('Procurement Generated?'),
         'parent_id': fields.many2one('mrp.production', 'Parent Order', readonly=True),
         'scrap_order_id': fields.many2one('stock.picking', 'Scrap Order', readonly=True),
-        'already_produced_qty': fields.function(_produced_qty_calc, multi='produced', type='float', string='Produced Qty',digits_compute=dp.get_precision('Product Unit of Measure')),
+        'already_produced_qty': fields.function(_produced_qty_calc, multi='produced', type='float', string='Produced Qty',digits_compute=dp.get_precision('Product Unit of Measure'),
+            store={
+                'mrp.production': (lambda self, cr, uid, ids, c=None: ids, ['scraped_qty', 'product_id'], 10),
+                'stock.move': (_get_production_from_finished_move, ['state', 'product_qty', 'scrapped', 'extra_consumed', 'production_id', 'product_id'], 10),
+            }),
+        'order_number': fields.function(_order_number_calc, type='integer', string='Order Number', select=True,
+            store={'mrp.production': (lambda self, cr, uid, ids, c=None: ids, ['name'], 10)}),
         'scraped_qty': fields.float('Scraped Quantity', digits_compute=dp.get_precision('Product Unit of Measure')),
         'backorder_ids': fields.one2many('mrp.production', 'parent_id','Split Orders', readonly=True),
         'date_planned': fields.datetime('Scheduled Date', required=True, select=1, readonly=False, states={'done':[('readonly',True)]}),
@@ -111,8 +176,8 @@ class mrp_production(osv.osv):
                 When the production is over, the status is set to 'Done'."),
 
         'currency_id': fields.related('company_id', 'currency_id', type="many2one", relation="res.currency", string="Currency", readonly=True),
-        'planned_cost': fields.function(_mrp_costing, multi='cost', type='float', string='Planned Cost'),
-        'actual_cost': fields.function(_mrp_costing, multi='cost', type='float', string='Actual Cost'),
+        'planned_cost': fields.function(_mrp_costing, multi='cost', type='float', string='Planned Cost', store=_costing_store),
+        'actual_cost': fields.function(_mrp_costing, multi='cost', type='float', string='Actual Cost', store=_costing_store),
 
     }
 
@@ -216,33 +281,60 @@ class mrp_production(osv.osv):
         """
         -Process
             -getting all moves to consume
-            -pass that moves to _update_workorder_lines() for create workorder process lines
+            -pass that moves to _moves_to_workcenter() for create workorder process lines
             -Update moves_to_workorder=True
         """
-
-        def _none_qty(production_rec):
-            """
-            -Process
-                getting total moves to consume
-            """
-            total_moves_to_consume = []
-            for raw_m in production_rec.move_lines:
-                total_moves_to_consume.append(raw_m.id)
-            if not total_moves_to_consume:
-                raise osv.except_osv(_('Raw material not found!'), _('Raw material not found for consume'))
-            return total_moves_to_consume
-
-        move_obj = self.pool.get('stock.move')
         production_rec = self.browse(cr, uid, ids[0], context=context)
         if production_rec.state <> 'ready':
             raise osv.except_osv(_('Production order not ready for start!'), _('You only put raw material into production department if production order must be into "ready to produce" state.'))
         if production_rec.moves_to_workorder:
             raise osv.except_osv(_('Warning!'), _('Raw materials already moved to workorder.'))
+        if not production_rec.move_lines:
+            raise osv.except_osv(_('Raw material not found!'), _('Raw material not found for consume'))
 
-        total_moves_to_consume = _none_qty(production_rec)
-        self._update_workorder_lines(cr, uid, total_moves_to_consume, ids[0], context=context)
-        production_rec.write({'moves_to_workorder':True})
-        move_obj.write(cr, uid, total_moves_to_consume, {'moves_to_workorder':True}, context=context)
+        self._moves_to_workcenter(cr, uid, [production_rec], context=context)
+        return True
+
+    def _check_moves_to_workcenter(self, cr, uid, production, context=None):
+        """
+        -Process
+            -Same checks as product_moves_to_workcenter() without raising
+        -Return
+            -Error message, False if production can be moved to workcenter
+        """
+        if production.state <> 'ready':
+            return _('Production order not in "ready to produce" state.')
+        if production.moves_to_workorder:
+            return _('Raw materials already moved to workorder.')
+        if not production.move_lines:
+            return _('Raw material not found for consume')
+        return False
+
+    def _moves_to_workcenter(self, cr, uid, productions, context=None):
+        """
+        -Process
+            -find shortest work-order of all productions in one query,
+            -create process lines of all raw materials at once,
+            -Update moves_to_workorder=True on productions and moves
+        """
+        move_obj = self.pool.get('stock.move')
+        process_move = self.pool.get('stock.moves.workorder')
+        if not productions:
+            return True
+        production_ids = [production.id for production in productions]
+        cr.execute("""  SELECT DISTINCT ON (production_id) production_id, id
+                        FROM mrp_production_workcenter_line
+                        WHERE production_id IN %s AND COALESCE(state, '') != 'cancel'
+                        ORDER BY production_id, sequence, id """, (tuple(production_ids),))
+        shortest_wrkorders = dict(cr.fetchall())
+        process_lines, move_ids = [], []
+        for production in productions:
+            for move in production.move_lines:
+                move_ids.append(move.id)
+                process_lines.append(self._create_process_dict(cr, uid, move, shortest_wrkorders.get(production.id, False)))
+        process_move.bulk_create(cr, uid, process_lines, context=context)
+        self.write(cr, uid, production_ids, {'moves_to_workorder':True}, context=context)
+        move_obj.write(cr, uid, move_ids, {'moves_to_workorder':True}, context=context)
         return True
 
     def action_produce(self, cr, uid, production_id, production_qty, production_mode, context=None):
@@ -358,16 +450,12 @@ class mrp_production(osv.osv):
         - return
             -shortest workorder
         """
-        short_key = {}
-        production = self.browse(cr, uid, production_id)
-        for wrkorder in production.workcenter_lines:
-            # need to check for not included done or cancel work-order
-            if wrkorder.state != 'cancel':
-                short_key.update({wrkorder.id: wrkorder.sequence})
-
-        # find shorted by values
-        shorted_wrkordr = sorted(short_key.items(), key=lambda x: x[1])
-        return shorted_wrkordr and shorted_wrkordr[0][0] or False
+        # need to check for not included done or cancel work-order
+        cr.execute("""  SELECT id FROM mrp_production_workcenter_line
+                        WHERE production_id = %s AND COALESCE(state, '') != 'cancel'
+                        ORDER BY sequence, id LIMIT 1 """, (production_id,))
+        res = cr.fetchone()
+        return res and res[0] or False
 
     def _create_process_dict(self, cr, uid, move, shortest_wrkorder):
         """
@@ -404,6 +492,7 @@ class mrp_production(osv.osv):
             - find shorted workorder,
             - browse all consume moves and attached it workorder processing,
             - find shortest workorder to attached all lines to it,
+            - create all process lines at once with bulk_create()
         @return: dictionaries for moves to generate workorders(moves)
         """
         context = context or {}
@@ -411,15 +500,14 @@ class mrp_production(osv.osv):
         process_move = self.pool.get('stock.moves.workorder')
 
         # process moves dictionaries, find shorted work-order by sequence.
-        process_lines = []
         shortest_wrkorder = self._to_find_shortestworkorder(cr, uid, production_id)
+        if not shortest_wrkorder:
+            return True
+        process_lines = []
         for c_moves in stock_move.browse(cr, uid, all_moves, context=context):
             process_lines.append(self._create_process_dict(cr, uid, c_moves, shortest_wrkorder))
-        # filter to any None dictionary.
-        process_lines = filter(None, process_lines)
         # create process moves for shorted work-order.
-        for dicts in process_lines:
-            process_move.create(cr, uid, dicts, context=context)
+        process_move.bulk_create(cr, uid, process_lines, context=context)
         return True
 
     def _check_for_routing(self, cr, uid, production, context=None):
@@ -505,38 +593,69 @@ class mrp_production(osv.osv):
         """
         return workorder.production_id.id
 
-    def to_find_next_wrkorder(self, cr, uid, production_id, last_workorder_id, last_workorder_seq, context=None):
+    def write(self, cr, uid, ids, vals, context=None, update=True):
+        """
+        -Process
+            -Estimated hours of work-orders follow qty to produce.
+        """
+        res = super(mrp_production, self).write(cr, uid, ids, vals, context=context, update=update)
+        if 'product_qty' in vals:
+            if isinstance(ids, (int, long)):
+                ids = [ids]
+            self.pool.get('mrp.production.workcenter.line')._refresh_rejection_hours(cr, uid, ids, context=context)
+        return res
+
+    def _routing_chains(self, cr, uid, production_ids, context=None):
+        """
+        -Process
+            -read routing chain of all productions in one query,
+             served by (production_id, sequence, state) index of work-orders,
+            -chains are shared by all lookups of a call rather than kept in an ormcache:
+             like _bom_explode_structure() such a cache would have to be checked against
+             work-orders of the database, which costs this same indexed query.
+        -Return
+            -{production_id: [(work-order id, sequence), ...]} without cancelled work-orders
+        """
+        chains = dict([(production_id, []) for production_id in production_ids])
+        if production_ids:
+            cr.execute("""  SELECT production_id, id, sequence FROM mrp_production_workcenter_line
+                            WHERE production_id IN %s AND COALESCE(state, '') != 'cancel'
+                            ORDER BY production_id, sequence, id """, (tuple(production_ids),))
+            for production_id, workorder_id, sequence in cr.fetchall():
+                chains[production_id].append((workorder_id, sequence))
+        return chains
+
+    def _next_in_chain(self, chain, last_workorder_id, last_workorder_seq):
+        for workorder_id, sequence in chain:
+            if sequence >= last_workorder_seq and workorder_id != last_workorder_id:
+                return workorder_id
+        return False
+
+    def to_find_next_wrkorder(self, cr, uid, production_id, last_workorder_id, last_workorder_seq, context=None, routing_chains=None):
         """
         -Process
             - find next stage of work-order by,
                 - Production_id
                 - sequence greater then equal from current work-order
                 - next order id not current work-order id ;)
+            - routing_chains of _routing_chains() can be given to share one lookup between many calls
         -Return
             -[Next work-order Id, production_id]
         """
-        context = context or {}
-        workorder_line_obj = self.pool.get('mrp.production.workcenter.line')
-        next_workorder_ids = workorder_line_obj.search(cr, uid, [('production_id', '=', production_id), ('sequence', '>=', last_workorder_seq), ('id', '!=', last_workorder_id),('state','!=','cancel')], order='sequence')
-        return [next_workorder_ids and next_workorder_ids[0] or False, production_id]
+        if routing_chains is None or production_id not in routing_chains:
+            routing_chains = self._routing_chains(cr, uid, [production_id], context=context)
+        return [self._next_in_chain(routing_chains[production_id], last_workorder_id, last_workorder_seq), production_id]
 
     def next_stage_workorder(self, cr, uid, workorder_processmove_id, context=None):
         """
         -Process
             -get current workorder move process Id,
-            -First find Workorder of that process move,
-            -call function to find production id then,
-            -call function to find next workorder
+            -find next workorder with batch API of process moves
         - Return
             - next work-order
         """
         process_moves_obj = self.pool.get('stock.moves.workorder')
-        # to find current work-order
-        wrkorder_id = process_moves_obj.browse(cr, uid, workorder_processmove_id, context=context).workorder_id
-        # to find production from that current work-order
-        production_id = self._find_production_id(cr, uid, wrkorder_id)
-        # to find next work-order
-        return self.to_find_next_wrkorder(cr, uid, production_id, wrkorder_id.id, wrkorder_id.sequence, context=context)
+        return process_moves_obj.next_stage_workorders(cr, uid, [workorder_processmove_id], context=context)[workorder_processmove_id]
 
     def _costs_generate(self, cr, uid, production):
         """ Calculates total costs at the end of the production.
@@ -598,34 +717,50 @@ mrp_production()
 class stock_moves_workorder(osv.osv):
     _name = 'stock.moves.workorder'
 
+    def _semiproduct_factor_map(self, cr, uid, production, context=None):
+        """
+        Process
+            -Compute production UoM factor once for BoM of production,
+            -multiply it with qty of each BoM line.
+        Return
+            -{raw material product id: factor}
+        """
+        uom_obj = self.pool.get('product.uom')
+        bom_point = production.bom_id
+        factor = uom_obj._compute_qty(cr, uid, production.product_uom.id, 1, bom_point.product_uom.id)
+        factor = factor / bom_point.product_qty
+        factor = factor / (bom_point.product_efficiency or 1.0)
+        factor = rounding(factor, bom_point.product_rounding)
+        if factor < bom_point.product_rounding:
+            factor = bom_point.product_rounding
+        factor_map = {}
+        for b in bom_point.bom_lines:
+            factor_map.setdefault(b.product_id.id, factor * b.product_qty)
+        return factor_map
+
     def _semiproduct_calc(self, cr, uid, ids, name, args, context=None):
+        """
+        Process
+            -Moves are grouped by production, factors are computed once per production BoM.
+            -Moves without factor (no production or product not in BoM) stay at 0.0
+        """
         result = dict([(id, {'product_factor': 0.0, 's_product_id':False,'s_total_qty': 0.0, 's_process_qty': 0.0, 's_accepted_qty': 0.0,'s_rejected_qty':0.0}) for id in ids])
-        uom_obj = self.pool.get('product.uom')
+        factor_maps = {}
         for smv in self.browse(cr, uid, ids, context=context):
-            factor = 0.0
-            if smv.workorder_id and smv.workorder_id.production_id:
-                production = smv.workorder_id.production_id
-                bom_point = smv.workorder_id.production_id.bom_id
-                factor = uom_obj._compute_qty(cr, uid, production.product_uom.id, 1, bom_point.product_uom.id)
-                factor = factor / bom_point.product_qty
-                factor = factor / (bom_point.product_efficiency or 1.0)
-                factor = rounding(factor, bom_point.product_rounding)
-                if factor < bom_point.product_rounding:
-                    factor = bom_point.product_rounding
-                r_qty = 0.0
-                for b in bom_point.bom_lines:
-                    if smv.product_id.id == b.product_id.id:
-                        r_qty = b.product_qty
-                        break
-                factor = factor * r_qty
-            if factor == 0.0: return result
+            if not (smv.workorder_id and smv.workorder_id.production_id):
+                continue
+            production = smv.workorder_id.production_id
+            if production.id not in factor_maps:
+                factor_maps[production.id] = self._semiproduct_factor_map(cr, uid, production, context=context)
+            factor = factor_maps[production.id].get(smv.product_id.id, 0.0)
+            if factor == 0.0: continue
             result[smv.id]['product_factor'] = factor
             result[smv.id]['s_product_id'] = production.product_id.id
             result[smv.id]['s_total_qty'] = smv.total_qty / factor
             result[smv.id]['s_process_qty'] = smv.process_qty / factor
             result[smv.id]['s_accepted_qty'] = smv.accepted_qty / factor
             result[smv.id]['s_rejected_qty'] = smv.rejected_qty / factor
-            result[smv.id]['s_uom_id'] = smv.workorder_id and smv.workorder_id.production_id and smv.workorder_id.production_id.product_uom.id or False
+            result[smv.id]['s_uom_id'] = production.product_uom.id
         return result
 
     _columns = {
@@ -666,6 +801,109 @@ class stock_moves_workorder(osv.osv):
         'state': 'draft'
         }
 
+    def bulk_create(self, cr, uid, vals_list, context=None):
+        """
+        -Process
+            -Insert all process lines with one statement, see bulk_insert() of l10n_in_base,
+            -stored semi-product fields and order type are computed before insert,
+             with one factor map per production.
+        -Return
+            -ids of created process lines, in order of vals_list
+        """
+        vals_list = filter(None, vals_list)
+        if not vals_list:
+            return []
+        workorder_ids = list(set([vals['workorder_id'] for vals in vals_list if vals.get('workorder_id')]))
+        workorders = dict([(wo.id, wo) for wo in self.pool.get('mrp.production.workcenter.line').browse(cr, uid, workorder_ids, context=context)])
+        factor_maps = {}
+        rows = []
+        for vals in vals_list:
+            vals = dict(vals)
+            vals.setdefault('state', 'draft')
+            wo = workorders.get(vals.get('workorder_id'))
+            factor = 0.0
+            vals['order_type'] = False
+            if wo:
+                vals['order_type'] = wo.order_type
+                if wo.production_id:
+                    production = wo.production_id
+                    if production.id not in factor_maps:
+                        factor_maps[production.id] = self._semiproduct_factor_map(cr, uid, production, context=context)
+                    factor = factor_maps[production.id].get(vals.get('product_id'), 0.0)
+            vals['product_factor'] = factor
+            for qty_field in ('total_qty', 'process_qty', 'accepted_qty', 'rejected_qty'):
+                vals['s_' + qty_field] = factor and (vals.get(qty_field) or 0.0) / factor or 0.0
+            rows.append(vals)
+        return bulk_insert(self, cr, uid, rows, context=context)
+
+    def next_stage_workorders(self, cr, uid, ids, context=None):
+        """
+        -Process
+            -find next stage of many process moves with one routing chain lookup
+             for all their productions.
+        -Return
+            -{process move id: [next work-order id, production id]}
+        """
+        production_obj = self.pool.get('mrp.production')
+        res = dict([(id, [False, False]) for id in ids])
+        if not ids:
+            return res
+        cr.execute("""  SELECT smw.id, wo.id, wo.sequence, wo.production_id
+                        FROM stock_moves_workorder smw
+                        JOIN mrp_production_workcenter_line wo ON (wo.id = smw.workorder_id)
+                        WHERE smw.id IN %s """, (tuple(ids),))
+        rows = cr.fetchall()
+        routing_chains = production_obj._routing_chains(cr, uid, list(set([row[3] for row in rows if row[3]])), context=context)
+        for process_move_id, workorder_id, sequence, production_id in rows:
+            if production_id:
+                res[process_move_id] = production_obj.to_find_next_wrkorder(cr, uid, production_id, workorder_id, sequence,
+                                                                            context=context, routing_chains=routing_chains)
+        return res
+
+    def advance_to_next_stage(self, cr, uid, ids, next_workorder_id=None, accepted_date=None, context=None):
+        """
+        -Process
+            -Finish in-progress process moves with their remaining quantity with one
+             update of accepted qty and one write of the finished state for all of them,
+             the write also recomputes the stored semi-product quantities,
+            -Remaining quantities are checked as the finished wizard does, including the
+             inward quantity of outsourced moves,
+            -Create their process lines into next stage of work-order at once, accepted on
+             accepted_date (now by default). Next stage is the next one of routing chain of
+             each production, or next_workorder_id when given (False: no next stage).
+        -Return
+            -ids of process lines created at next stages
+        """
+        production_obj = self.pool.get('mrp.production')
+        finished_wizard_obj = self.pool.get('process.qty.to.finished')
+        if next_workorder_id is None:
+            next_stages = self.next_stage_workorders(cr, uid, ids, context=context)
+        else:
+            next_stages = dict([(id, [next_workorder_id, False]) for id in ids])
+        accepted_date = accepted_date or time.strftime(DEFAULT_SERVER_DATETIME_FORMAT)
+        next_lines = []
+        finish_ids = []
+        for process_move in self.browse(cr, uid, ids, context=context):
+            if process_move.state not in ('in_progress', 'pending'):
+                continue
+            finish_ids.append(process_move.id)
+            remaining_qty = process_move.total_qty - (process_move.accepted_qty + process_move.rejected_qty)
+            if remaining_qty > 0.0:
+                production = process_move.workorder_id.production_id
+                finished_wizard_obj._check_validation_finished_qty(cr, uid, production, remaining_qty, remaining_qty, process_move.accepted_qty,
+                                                                   process_move.id, process_move.order_type or 'in',
+                                                                   production.product_id.property_stock_production.id, context=context)
+            if next_stages[process_move.id][0]:
+                res = production_obj._create_process_dict(cr, uid, process_move.move_id, next_stages[process_move.id][0])
+                res.update({'total_qty': remaining_qty, 'accepted_date': accepted_date})
+                next_lines.append(res)
+        if finish_ids:
+            cr.execute("""  UPDATE stock_moves_workorder
+                            SET accepted_qty = COALESCE(total_qty, 0.0) - COALESCE(rejected_qty, 0.0)
+                            WHERE id IN %s """, (tuple(finish_ids),))
+            self.write(cr, uid, finish_ids, {'state':'finished', 'process_qty':0.0}, context=context)
+        return self.bulk_create(cr, uid, next_lines, context=context)
+
     def button_to_draft(self, cr, uid, ids , context=None):
         return True
 
@@ -841,6 +1079,43 @@ class stock_moves_rejection(osv.osv):
         'is_reallocate':  fields.boolean('Re-Allocated?')
     }
 
+    def _rejected_productions(self, cr, uid, ids):
+        if not ids:
+            return []
+        cr.execute("""  SELECT DISTINCT wo.production_id FROM stock_moves_rejection r
+                        JOIN mrp_production_workcenter_line wo ON (wo.id = r.rejected_workorder_id)
+                        WHERE r.id IN %s AND wo.production_id IS NOT NULL """, (tuple(ids),))
+        return [x[0] for x in cr.fetchall()]
+
+    def create(self, cr, uid, vals, context=None):
+        """
+        -Process
+            -Estimated hours of work-orders of the production are recalculated on
+             the qty left after this rejection.
+        """
+        rejection_id = super(stock_moves_rejection, self).create(cr, uid, vals, context=context)
+        self.pool.get('mrp.production.workcenter.line')._refresh_rejection_hours(cr, uid, self._rejected_productions(cr, uid, [rejection_id]), context=context)
+        return rejection_id
+
+    def write(self, cr, uid, ids, vals, context=None):
+        if isinstance(ids, (int, long)):
+            ids = [ids]
+        if not ('s_rejected_qty' in vals or 'rejected_workorder_id' in vals):
+            return super(stock_moves_rejection, self).write(cr, uid, ids, vals, context=context)
+        production_ids = self._rejected_productions(cr, uid, ids)
+        res = super(stock_moves_rejection, self).write(cr, uid, ids, vals, context=context)
+        production_ids += self._rejected_productions(cr, uid, ids)
+        self.pool.get('mrp.production.workcenter.line')._refresh_rejection_hours(cr, uid, production_ids, context=context)
+        return res
+
+    def unlink(self, cr, uid, ids, context=None):
+        if isinstance(ids, (int, long)):
+            ids = [ids]
+        production_ids = self._rejected_productions(cr, uid, ids)
+        res = super(stock_moves_rejection, self).unlink(cr, uid, ids, context=context)
+        self.pool.get('mrp.production.workcenter.line')._refresh_rejection_hours(cr, uid, production_ids, context=context)
+        return res
+
     def button_to_reallocate(self, cr, uid, ids, context=None):
         """
         -Process
@@ -892,22 +1167,38 @@ class mrp_production_workcenter_line(osv.osv):
             return (factor * int(math.floor(val)), int(round((val % 1) * 60)))
 
         result = dict([(id, {'wo_planned_cost': 0.0, 'wo_actual_cost': 0.0,'operator_efficiency':0.0}) for id in ids])
-        for wo in self.browse(cr, uid, ids, context=context):
-            wo_planned_cost = wo_actual_cost = operator_efficiency = 0.0
+        if not ids:
+            return result
+        cr.execute("""  SELECT wo.id, COALESCE(wo.hour, 0.0), COALESCE(wo.delay, 0.0), COALESCE(wc.costs_hour, 0.0)
+                        FROM mrp_production_workcenter_line wo
+                        LEFT JOIN mrp_workcenter wc ON (wc.id = wo.workcenter_id)
+                        WHERE wo.id IN %s """, (tuple(ids),))
+        for wo_id, hour, delay, costs_hour in cr.fetchall():
+            operator_efficiency = 0.0
             #if wo.state == 'cancel': continue
-            wo_planned_cost += round(wo.hour,2) * wo.workcenter_id.costs_hour
-            wo_actual_cost += round(wo.delay,2) * wo.workcenter_id.costs_hour
-            p_hour,p_min = float_time_convert(wo.hour)
-            a_hour,a_min = float_time_convert(wo.delay)
+            p_hour,p_min = float_time_convert(hour)
+            a_hour,a_min = float_time_convert(delay)
             p_seconds = p_hour * 3600 + p_min * 60
             a_seconds = a_hour * 3600 + a_min * 60
             if a_seconds > 0:
                 operator_efficiency =  (float(p_seconds) / float(a_seconds)) * 100
-        result[wo.id]['wo_planned_cost'] = wo_planned_cost
-        result[wo.id]['wo_actual_cost'] = wo_actual_cost
-        result[wo.id]['operator_efficiency'] = int(operator_efficiency)
+            result[wo_id]['wo_planned_cost'] = round(hour,2) * costs_hour
+            result[wo_id]['wo_actual_cost'] = round(delay,2) * costs_hour
+            result[wo_id]['operator_efficiency'] = int(operator_efficiency)
         return result
 
+    def _get_workorder_from_workcenter(self, cr, uid, ids, context=None):
+        """
+        Process
+            -Store trigger, self is mrp.workcenter here.
+        """
+        return self.pool.get('mrp.production.workcenter.line').search(cr, uid, [('workcenter_id', 'in', ids)], context=context)
+
+    _wo_costing_store = {
+        'mrp.production.workcenter.line': (lambda self, cr, uid, ids, c=None: ids, ['hour', 'delay', 'workcenter_id'], 10),
+        'mrp.workcenter': (_get_workorder_from_workcenter, ['costs_hour'], 10),
+    }
+
 #    def onchange_log_entry(self,cr, uid, ids, log_entry_ids, context=None):
 #        res = {'value':{'delay':0.0}}
 #        diff_list = []
@@ -923,58 +1214,128 @@ class mrp_production_workcenter_line(osv.osv):
     def _count_log_delay(self, cr, uid, ids, name, args, context=None):
         """
         Process
-            -count log entry delay and set to actual time
+            -count log entry delay and set to actual time,
+            -durations are summed in SQL for all work-orders at once and
+             written back with one update.
         """
 
         result = dict([(id, {'log_delay': 0.0}) for id in ids])
-        for wo in self.browse(cr, uid, ids, context=context):
-            delay = 0.0
-            for rec in wo.log_entry_ids:
-                dt_df = datetime.strptime(rec.end_date,'%Y-%m-%d %H:%M:%S') - datetime.strptime(rec.start_date,'%Y-%m-%d %H:%M:%S')
-                delay += dt_df.days * 24
-                delay += dt_df.seconds / float(60*60)
-            result[wo.id]['log_delay'] = delay
-            cr.execute(""" UPDATE mrp_production_workcenter_line SET delay = %s WHERE id = %s"""%(delay, wo.id))
+        if not ids:
+            return result
+        cr.execute("""  SELECT workorder_id, SUM(EXTRACT(EPOCH FROM end_date - start_date)) / 3600.0
+                        FROM log_entry
+                        WHERE workorder_id IN %s
+                        GROUP BY workorder_id """, (tuple(ids),))
+        for wo_id, delay in cr.fetchall():
+            result[wo_id]['log_delay'] = float(delay or 0.0)
+        cr.execute("""  UPDATE mrp_production_workcenter_line wo SET delay = new.delay, write_date = (now() at time zone 'UTC')
+                        FROM (VALUES """ + ', '.join(['(%s, %s)'] * len(ids)) + """) AS new(id, delay)
+                        WHERE wo.id = new.id AND wo.delay IS DISTINCT FROM new.delay """, [x for wo_id in ids for x in (wo_id, result[wo_id]['log_delay'])])
+        self._refresh_costing(cr, uid, ids, context=context)
         return result
 
+    def _get_workorder_from_log_entry(self, cr, uid, ids, context=None):
+        """
+        Process
+            -Store trigger, self is log.entry here.
+        """
+        cr.execute("""SELECT DISTINCT workorder_id FROM log_entry
+                        WHERE id IN %s AND workorder_id IS NOT NULL""", (tuple(ids),))
+        return [x[0] for x in cr.fetchall()]
+
+    def _refresh_costing(self, cr, uid, ids, context=None):
+        """
+        Process
+            -hour and delay are also updated by direct SQL, which bypasses
+             store triggers, so refresh stored costs of work-orders and productions.
+        """
+        if not ids:
+            return True
+        return recompute_stored(self, cr, uid, ids, ['hour', 'delay'], context=context)
+
     def _calculated_hour(self, cr, uid, wo, qty, context=None):
         wc = wo.workcenter_id
-        hour = float((wo.hour_nbr * qty + ((wc.time_start or 0.0)+(wc.time_stop or 0.0))) / float(wc.time_efficiency or 1.0))
+        return self._compute_hour(wo.hour_nbr, qty, wc.time_start, wc.time_stop, wc.time_efficiency)
+
+    def _compute_hour(self, hour_nbr, qty, time_start, time_stop, time_efficiency):
+        hour = float((hour_nbr * qty + ((time_start or 0.0)+(time_stop or 0.0))) / float(time_efficiency or 1.0))
         return hour
 
+    def _upstream_rejection_sql(self, where):
+        """
+        Process
+            -Query of (id, qty) of work-orders matched by where (on alias rwo), qty is
+             rejected qty of all previous work-orders(by sequence) of same production,
+             where has to match whole productions for the running sum to be complete.
+        """
+        return """  SELECT rwo.id,
+                        CASE WHEN rwo.production_id IS NULL THEN 0.0 ELSE
+                            SUM(COALESCE(rj.qty, 0.0)) OVER (PARTITION BY rwo.production_id ORDER BY rwo.sequence)
+                            - SUM(COALESCE(rj.qty, 0.0)) OVER (PARTITION BY rwo.production_id, rwo.sequence)
+                        END AS qty
+                    FROM mrp_production_workcenter_line rwo
+                    LEFT JOIN (SELECT rejected_workorder_id, SUM(s_rejected_qty) AS qty
+                                FROM stock_moves_rejection GROUP BY rejected_workorder_id
+                              ) rj ON (rj.rejected_workorder_id = rwo.id)
+                    WHERE """ + where
+
     def _mrp_rejctd_qty(self, cr, uid, ids, name, args, context=None):
         """
         Process
-            -count log entry delay and set to actual time
+            -Rejected qty of all previous work-orders(by sequence) of same production,
+             computed with a running sum over sequence for every work-order of the
+             productions at once,
+            -Read only, estimated hours follow rejections through _refresh_rejection_hours().
         """
 
         result = dict([(id, {'t_rejection_qty': 0.0}) for id in ids])
-        for wo in self.browse(cr, uid, ids, context=context):
-            qty = 0.0
-            if wo.production_id:
-                cr.execute("""  SELECT sum(s_rejected_qty) FROM stock_moves_rejection 
-                                WHERE rejected_workorder_id in 
-                                (SELECT id FROM mrp_production_workcenter_line 
-                                WHERE sequence < %s 
-                                AND production_id = %s
-                                ) """%(wo.sequence, wo.production_id.id))
-                qty = cr.fetchone()[0]
-            rejected_qty = qty or 0.0
-            result[wo.id]['t_rejection_qty'] = rejected_qty
-            planned_qty = wo.production_id.product_qty - rejected_qty
-            hour = self._calculated_hour(cr, uid, wo, planned_qty, context=context)
-            planned_cost = round(wo.hour,2) * wo.workcenter_id.costs_hour
-            cr.execute(""" UPDATE mrp_production_workcenter_line SET hour = %s WHERE id = %s"""%(hour, wo.id))
-            
-            #Here we cannot call write method to update auto next workorder.
-#            cr.execute(""" SELECT id FROM mrp_production_workcenter_line 
-#                            WHERE sequence > %s 
-#                            AND production_id = %s """%(wo.sequence, wo.production_id.id)
-#                                )
-#            update_all = [x[0] for x in cr.fetchall() if x]
-#            self.dummy_button(cr, uid, update_all, context)
+        if not ids:
+            return result
+        cr.execute(self._upstream_rejection_sql("""rwo.id IN %s
+                        OR rwo.production_id IN (SELECT production_id FROM mrp_production_workcenter_line WHERE id IN %s)"""),
+                   (tuple(ids), tuple(ids)))
+        for wo_id, rejected_qty in cr.fetchall():
+            if wo_id in result:
+                result[wo_id]['t_rejection_qty'] = rejected_qty or 0.0
         return result
 
+    def _refresh_rejection_hours(self, cr, uid, production_ids, context=None):
+        """
+        Process
+            -Estimated hour of all work-orders of productions recalculated on qty
+             remaining after rejections of previous work-orders, changed hours written
+             back with one update and stored costs of them refreshed,
+            -Called where rejections, qty to produce or work-orders change.
+        """
+        production_ids = list(set([x for x in production_ids if x]))
+        if not production_ids:
+            return True
+        cr.execute("""  SELECT wo.id, wo.hour, wo.hour_nbr, COALESCE(mp.product_qty, 0.0),
+                            wc.time_start, wc.time_stop, wc.time_efficiency, rejection.qty
+                        FROM (""" + self._upstream_rejection_sql("rwo.production_id IN %s") + """) rejection
+                        JOIN mrp_production_workcenter_line wo ON (wo.id = rejection.id)
+                        JOIN mrp_production mp ON (mp.id = wo.production_id)
+                        LEFT JOIN mrp_workcenter wc ON (wc.id = wo.workcenter_id)
+                        """, (tuple(production_ids),))
+        changed = []
+        for wo_id, old_hour, hour_nbr, product_qty, time_start, time_stop, time_efficiency, rejected_qty in cr.fetchall():
+            hour = self._compute_hour(hour_nbr or 0.0, product_qty - (rejected_qty or 0.0), time_start, time_stop, time_efficiency)
+            #Here we cannot call write method to update auto next workorder.
+            if hour != old_hour:
+                changed.append((wo_id, hour))
+        if changed:
+            cr.execute("""  UPDATE mrp_production_workcenter_line wo SET hour = new.hour, write_date = (now() at time zone 'UTC')
+                            FROM (VALUES """ + ', '.join(['(%s, %s)'] * len(changed)) + """) AS new(id, hour)
+                            WHERE wo.id = new.id """, [x for pair in changed for x in pair])
+            self._refresh_costing(cr, uid, [x[0] for x in changed], context=context)
+        return True
+
+    def _workorder_productions(self, cr, uid, ids):
+        if not ids:
+            return []
+        cr.execute("""SELECT DISTINCT production_id FROM mrp_production_workcenter_line
+                        WHERE id IN %s AND production_id IS NOT NULL""", (tuple(ids),))
+        return [x[0] for x in cr.fetchall()]
 
     _inherit = 'mrp.production.workcenter.line'
     _columns = {
@@ -987,7 +1348,11 @@ class mrp_production_workcenter_line(osv.osv):
 
         'hour': fields.float('Est.Time(HH:MM)', digits=(16,2),readonly=True, states={'draft':[('readonly', False)]}),
         'delay': fields.float('Actual Time(HH:MM)',help="The elapsed time between day to day log entry by user",readonly=True),
-        'log_delay': fields.function(_count_log_delay, method=True, multi='log', type='float', string='Workorder Actual Cost',store=True),
+        'log_delay': fields.function(_count_log_delay, method=True, multi='log', type='float', string='Workorder Actual Cost',
+            store={
+                'mrp.production.workcenter.line': (lambda self, cr, uid, ids, c=None: ids, None, 10),
+                'log.entry': (_get_workorder_from_log_entry, ['start_date', 'end_date', 'workorder_id'], 10),
+            }),
         #'service_product_id': fields.many2one('product.product', 'Service Product'),
         #'service_supplier_id': fields.many2one('res.partner', 'Partner',domain=[('supplier','=',True)]),
         #'service_description': fields.text('Description'),
@@ -997,8 +1362,8 @@ class mrp_production_workcenter_line(osv.osv):
         'temp_date_finished':fields.related('date_finished', type="datetime",store=True),
 
         'currency_id': fields.related('production_id', 'currency_id', type="many2one", relation="res.currency", string="Currency", readonly=True),
-        'wo_planned_cost': fields.function(_mrp_wo_costing, multi='cost', type='float', string='Workorder Planned Cost'),
-        'wo_actual_cost': fields.function(_mrp_wo_costing, multi='cost', type='float', string='Workorder Actual Cost',store=True),
+        'wo_planned_cost': fields.function(_mrp_wo_costing, multi='cost', type='float', string='Workorder Planned Cost', store=_wo_costing_store),
+        'wo_actual_cost': fields.function(_mrp_wo_costing, multi='cost', type='float', string='Workorder Actual Cost', store=_wo_costing_store),
         'operator_efficiency': fields.function(_mrp_wo_costing, multi='cost', type='integer', string='Operator Efficiency(%)',group_operator="avg"),
         't_rejection_qty': fields.function(_mrp_rejctd_qty, multi='rj', type='float', string='Rejection Qty'),
         'hour_nbr': fields.float('Line Hour'),
@@ -1011,6 +1376,18 @@ class mrp_production_workcenter_line(osv.osv):
         'hour_nbr':0.0
         }
 
+    def _auto_init(self, cr, context=None):
+        """
+        Process
+            -composite index used by next work-order lookups
+        """
+        res = super(mrp_production_workcenter_line, self)._auto_init(cr, context=context)
+        cr.execute("""SELECT indexname FROM pg_indexes WHERE indexname = 'mrp_production_workcenter_line_prod_seq_state_index'""")
+        if not cr.fetchone():
+            cr.execute("""CREATE INDEX mrp_production_workcenter_line_prod_seq_state_index
+                            ON mrp_production_workcenter_line (production_id, sequence, state)""")
+        return res
+
     def onchange_planned_cost(self,cr, uid, ids, planned_hour, actual_hour, actual_cost, workcenter_id, context=None):
         """
         Process
@@ -1084,7 +1461,12 @@ class mrp_production_workcenter_line(osv.osv):
         for wrkorder in self.browse(cr, uid, ids, context=context):
             if wrkorder.moves_workorder or wrkorder.moves_rejection:
                 raise osv.except_osv(_('Invalid Action!'), _('Cannot delete a work-order if they have raw material in-process or rejected quantity assigned to it.'))
-        return super(mrp_production_workcenter_line, self).unlink(cr, uid, ids, context=context)
+        if isinstance(ids, (int, long)):
+            ids = [ids]
+        production_ids = self._workorder_productions(cr, uid, ids)
+        res = super(mrp_production_workcenter_line, self).unlink(cr, uid, ids, context=context)
+        self._refresh_rejection_hours(cr, uid, production_ids, context=context)
+        return res
 
     def _check_for_process_none_qty(self, cr, uid, ids, process='start', context=None):
         """
@@ -1354,7 +1736,21 @@ class mrp_production_workcenter_line(osv.osv):
 #                days = ((finished-start).days * 24) + ((finished-start).seconds) // 3600
 #                minite = (((finished-start).seconds%3600) / float(60))/100
                 #vals.update({'delay': delay})
-        return super(mrp_production_workcenter_line, self).write(cr, uid, ids, vals, context=context)
+        res = super(mrp_production_workcenter_line, self).write(cr, uid, ids, vals, context=context)
+        if [name for name in ('hour_nbr', 'sequence', 'production_id', 'workcenter_id') if name in vals]:
+            if isinstance(ids, (int, long)):
+                ids = [ids]
+            self._refresh_rejection_hours(cr, uid, self._workorder_productions(cr, uid, ids), context=context)
+        return res
+
+    def create(self, cr, uid, vals, context=None):
+        """
+        -Process
+            -Estimated hour of new work-order follows qty to produce and rejections.
+        """
+        workorder_id = super(mrp_production_workcenter_line, self).create(cr, uid, vals, context=context)
+        self._refresh_rejection_hours(cr, uid, [vals.get('production_id')], context=context)
+        return workorder_id
 
     def action_done(self, cr, uid, ids, context=None):
         """ 
@@ -1396,11 +1792,34 @@ class mrp_routing_workcenter(osv.osv):
     }
     _defaults = {'order_type':'in'}
 
+    def create(self, cr, uid, vals, context=None):
+        self.pool.get('mrp.bom').clear_caches()
+        return super(mrp_routing_workcenter, self).create(cr, uid, vals, context=context)
+
+    def write(self, cr, uid, ids, vals, context=None):
+        self.pool.get('mrp.bom').clear_caches()
+        return super(mrp_routing_workcenter, self).write(cr, uid, ids, vals, context=context)
+
+    def unlink(self, cr, uid, ids, context=None):
+        self.pool.get('mrp.bom').clear_caches()
+        return super(mrp_routing_workcenter, self).unlink(cr, uid, ids, context=context)
+
 mrp_routing_workcenter()
 
 class mrp_bom(osv.osv):
     _inherit = 'mrp.bom'
 
+    def create(self, cr, uid, vals, context=None):
+        self.clear_caches()
+        return super(mrp_bom, self).create(cr, uid, vals, context=context)
+
+    def write(self, cr, uid, ids, vals, context=None):
+        self.clear_caches()
+        return super(mrp_bom, self).write(cr, uid, ids, vals, context=context)
+
+    def unlink(self, cr, uid, ids, context=None):
+        self.clear_caches()
+        return super(mrp_bom, self).unlink(cr, uid, ids, context=context)
 
     def _bom_explode(self, cr, uid, bom, factor, properties=None, addthis=False, level=0, routing_id=False):
         """ Finds Products and Work Centers for related BoM for manufacturing order.
@@ -1411,63 +1830,153 @@ class mrp_bom(osv.osv):
         @param level: Depth level to find BoM lines starts from 10.
         @return: result: List of dictionaries containing product details.
                  result2: List of dictionaries containing Work Center details.
+        -Process
+            -Structure of the BoM tree (BoM lines and phantom BoMs) is memoized by
+             (bom, properties), cache is cleared on any BoM or routing change,
+            -Quantities, roundings, names, routings and work center times are read
+             on each call, one read per model for the whole tree.
         """
+        return self._bom_explode_compute(cr, uid, bom, factor, properties, addthis=addthis, level=level, routing_id=routing_id)
 
-        routing_obj = self.pool.get('mrp.routing')
-        factor = factor / (bom.product_efficiency or 1.0)
-        max_rounding = max(bom.product_rounding, bom.product_uom.rounding)
-        factor = rounding(factor, max_rounding)
-        if factor < max_rounding:
-            factor = max_rounding
+    @tools.ormcache(skiparg=2)
+    def _bom_explode_structure(self, cr, uid, bom_id, properties):
+        """
+        Process
+            -Read the whole BoM tree level by level, one read per level,
+            -Phantom BoMs without lines are resolved to the BoM of their product.
+        Return
+            -({bom id: bom line ids}, ids of phantom BoMs without lines, {phantom bom id: bom id})
+        """
+        lines, phantom_ids, phantoms = {}, [], {}
+        frontier = [bom_id]
+        while frontier:
+            next_frontier = []
+            for bom in self.read(cr, uid, frontier, ['type', 'bom_lines', 'product_id', 'product_uom']):
+                lines[bom['id']] = bom['bom_lines']
+                children = list(bom['bom_lines'])
+                if bom['type'] == 'phantom' and not bom['bom_lines']:
+                    phantom_ids.append(bom['id'])
+                    newbom = self._bom_find(cr, uid, bom['product_id'][0], bom['product_uom'][0], list(properties) or None)
+                    if newbom:
+                        phantoms[bom['id']] = newbom
+                        children.append(newbom)
+                next_frontier.extend([x for x in children if x not in lines])
+            frontier = list(set(next_frontier))
+        return lines, phantom_ids, phantoms
+
+    def _bom_explode_prefetch(self, cr, uid, bom_id, properties=None, routing_id=False):
+        """
+        Process
+            -BoM ids of the tree come from the cached _bom_explode_structure(),
+            -BoMs are read at once and checked against the cached structure, a structure
+             not matching the database any more (filled in a transaction rolled back later)
+             is rebuilt,
+            -one read each for products, UoMs, routings, routing lines and work centers of the tree.
+        Return
+            -dictionaries of read values by model and the phantom BoM mapping
+        """
+        bom_fields = ['type', 'bom_lines', 'product_id', 'product_qty', 'product_uom', 'product_uos', 'product_uos_qty',
+                      'product_efficiency', 'product_rounding', 'routing_id']
+        properties = tuple(properties or ())
+        for retry in (False, True):
+            lines, phantom_ids, phantoms = self._bom_explode_structure(cr, uid, bom_id, properties)
+            boms = dict((x['id'], x) for x in self.read(cr, uid, lines.keys(), bom_fields))
+            if len(boms) == len(lines) and not [bom for bom in boms.values()
+                    if bom['bom_lines'] != lines[bom['id']]
+                    or (bom['type'] == 'phantom' and not bom['bom_lines']) != (bom['id'] in phantom_ids)]:
+                break
+            self.clear_caches()
+
+        product_ids = set(x['product_id'][0] for x in boms.values())
+        uom_ids = set(x['product_uom'][0] for x in boms.values())
+        routing_ids = set(x['routing_id'][0] for x in boms.values() if x['routing_id'])
+        if routing_id:
+            routing_ids.add(routing_id)
+
+        products = dict((x['id'], x) for x in self.pool.get('product.product').read(cr, uid, list(product_ids), ['name']))
+        uoms = dict((x['id'], x) for x in self.pool.get('product.uom').read(cr, uid, list(uom_ids), ['rounding']))
+        routings = dict((x['id'], x) for x in self.pool.get('mrp.routing').read(cr, uid, list(routing_ids), ['workcenter_lines']))
+        wc_use_ids = set()
+        for routing in routings.values():
+            wc_use_ids.update(routing['workcenter_lines'])
+        wc_uses = dict((x['id'], x) for x in self.pool.get('mrp.routing.workcenter').read(cr, uid, list(wc_use_ids),
+                        ['name', 'workcenter_id', 'order_type', 'sequence', 'cycle_nbr', 'hour_nbr']))
+        workcenter_ids = set(x['workcenter_id'][0] for x in wc_uses.values())
+        workcenters = dict((x['id'], x) for x in self.pool.get('mrp.workcenter').read(cr, uid, list(workcenter_ids),
+                        ['capacity_per_cycle', 'time_start', 'time_stop', 'time_efficiency']))
+        return {
+            'boms': boms,
+            'phantoms': phantoms,
+            'products': products,
+            'uoms': uoms,
+            'routings': routings,
+            'wc_uses': wc_uses,
+            'workcenters': workcenters,
+        }
+
+    def _bom_explode_compute(self, cr, uid, bom, factor, properties=None, addthis=False, level=0, routing_id=False):
+        """ Explosion of _bom_explode()
+        -Process
+            -Whole tree is prefetched by _bom_explode_prefetch(),
+            -Tree is then walked with an explicit stack in the same depth first
+             order as the former recursion, appending to the result lists,
+            -each entry keeps the BoMs reached through phantom BoMs above it, a BoM
+             found again below itself is a cycle and raises instead of looping forever.
+        """
+        data = self._bom_explode_prefetch(cr, uid, bom.id, properties, routing_id)
+        boms, phantoms, products = data['boms'], data['phantoms'], data['products']
         result = []
         result2 = []
-        phantom = False
-        if bom.type == 'phantom' and not bom.bom_lines:
-            newbom = self._bom_find(cr, uid, bom.product_id.id, bom.product_uom.id, properties)
-
-            if newbom:
-                res = self._bom_explode(cr, uid, self.browse(cr, uid, [newbom])[0], factor*bom.product_qty, properties, addthis=True, level=level+10)
-                result = result + res[0]
-                result2 = result2 + res[1]
-                phantom = True
-            else:
-                phantom = False
-        if not phantom:
-            if addthis and not bom.bom_lines:
+        stack = [(bom.id, factor, addthis, level, routing_id, frozenset([bom.id]))]
+        while stack:
+            bom_id, factor, addthis, level, routing_id, path = stack.pop()
+            bom = boms[bom_id]
+            factor = factor / (bom['product_efficiency'] or 1.0)
+            max_rounding = max(bom['product_rounding'], data['uoms'][bom['product_uom'][0]]['rounding'])
+            factor = rounding(factor, max_rounding)
+            if factor < max_rounding:
+                factor = max_rounding
+            if bom_id in phantoms:
+                newbom_id = phantoms[bom_id]
+                if newbom_id in path:
+                    raise osv.except_osv(_('Error!'),
+                        _('The phantom BoM of product "%s" contains itself, it cannot be exploded.') % (products[bom['product_id'][0]]['name'],))
+                stack.append((newbom_id, factor*bom['product_qty'], True, level+10, False, path | frozenset([newbom_id])))
+                continue
+            product_name = products[bom['product_id'][0]]['name']
+            if addthis and not bom['bom_lines']:
                 result.append(
                 {
-                    'name': bom.product_id.name,
-                    'product_id': bom.product_id.id,
-                    'product_qty': bom.product_qty * factor,
-                    'product_uom': bom.product_uom.id,
-                    'product_uos_qty': bom.product_uos and bom.product_uos_qty * factor or False,
-                    'product_uos': bom.product_uos and bom.product_uos.id or False,
+                    'name': product_name,
+                    'product_id': bom['product_id'][0],
+                    'product_qty': bom['product_qty'] * factor,
+                    'product_uom': bom['product_uom'][0],
+                    'product_uos_qty': bom['product_uos'] and bom['product_uos_qty'] * factor or False,
+                    'product_uos': bom['product_uos'] and bom['product_uos'][0] or False,
                 })
-            routing = (routing_id and routing_obj.browse(cr, uid, routing_id)) or bom.routing_id or False
+            routing = (routing_id and data['routings'].get(routing_id)) or (bom['routing_id'] and data['routings'][bom['routing_id'][0]]) or False
             if routing:
-                for wc_use in routing.workcenter_lines:
-                    wc = wc_use.workcenter_id
+                for wc_use_id in routing['workcenter_lines']:
+                    wc_use = data['wc_uses'][wc_use_id]
+                    wc = data['workcenters'][wc_use['workcenter_id'][0]]
                     #change here , suppose workcentere put 0.0 capicity then ?
-                    #d, m = divmod(factor, wc_use.workcenter_id.capacity_per_cycle)
-                    d, m = divmod(factor, wc_use.workcenter_id.capacity_per_cycle or 1.0)
+                    d, m = divmod(factor, wc['capacity_per_cycle'] or 1.0)
                     mult = (d + (m and 1.0 or 0.0))
-                    cycle = mult * wc_use.cycle_nbr
+                    cycle = mult * wc_use['cycle_nbr']
                     result2.append({
-                        'name': tools.ustr(wc_use.name) + ' - '  + tools.ustr(bom.product_id.name),
-                        'workcenter_id': wc.id,
-                        'order_type':wc_use.order_type,
-                        'sequence': level+(wc_use.sequence or 0),
+                        'name': tools.ustr(wc_use['name']) + ' - '  + tools.ustr(product_name),
+                        'workcenter_id': wc['id'],
+                        'order_type':wc_use['order_type'],
+                        'sequence': level+(wc_use['sequence'] or 0),
                         'cycle': cycle,
-                        'hour_nbr':wc_use.hour_nbr,
-                        #'hour': float(wc_use.hour_nbr*mult + ((wc.time_start or 0.0)+(wc.time_stop or 0.0)+cycle*(wc.time_cycle or 0.0)) * (wc.time_efficiency or 1.0)),
+                        'hour_nbr':wc_use['hour_nbr'],
                         #Estimatated Hours = (Before P Stat+Before P Stop + total hours(define in routing) ) / effieciency
                         #Engineering manufacturing company dosent consider cycle loop, Its alwys work on hours basis.
-                        'hour': float((wc_use.hour_nbr*mult + ((wc.time_start or 0.0)+(wc.time_stop or 0.0))) / float(wc.time_efficiency or 1.0))
+                        'hour': float((wc_use['hour_nbr']*mult + ((wc['time_start'] or 0.0)+(wc['time_stop'] or 0.0))) / float(wc['time_efficiency'] or 1.0))
                     })
-            for bom2 in bom.bom_lines:
-                res = self._bom_explode(cr, uid, bom2, factor, properties, addthis=True, level=level+10)
-                result = result + res[0]
-                result2 = result2 + res[1]
+            # children are pushed in reverse to be exploded in BoM line order
+            for child_id in reversed(bom['bom_lines']):
+                stack.append((child_id, factor, True, level+10, False, path))
         return result, result2
 
 mrp_bom()
@@ -1545,5 +2054,15 @@ class mrp_routing(osv.osv):
     _columns = {
         'code': fields.char('Code', size=256),
     }
+
+    def write(self, cr, uid, ids, vals, context=None):
+        self.pool.get('mrp.bom').clear_caches()
+        return super(mrp_routing, self).write(cr, uid, ids, vals, context=context)
+
+    def unlink(self, cr, uid, ids, context=None):
+        self.pool.get('mrp.bom').clear_caches()
+        return super(mrp_routing, self).unlink(cr, uid, ids, context=context)
+
 mrp_routing()
+
 # vim:expandtab:smartindent:tabstop=4:softtabstop=4:shiftwidth=4:
@@ -111,99 +111,8 @@ class purchase_order(osv.osv):
                 po_expd_obj.create(cr, uid, c_line,context=context)
         return True
 
-    def _amount_all(self, cr, uid, ids, field_name, arg, context=None):
-        cur_obj=self.pool.get('res.currency')
-        tax_obj = self.pool.get('account.tax')
-        
-        res = {}
-        untax_amount = 0
-        
-        for order in self.browse(cr, uid, ids, context=context):
-            res[order.id] = {
-                'amount_untaxed': 0.0,
-                'amount_tax': 0.0,
-                'amount_total': 0.0,
-                'other_charges':0.0,
-            }
-            order_total = val = val1 = tax_total = other_charges = included_price = 0.0
-            cur = order.pricelist_id.currency_id
-            for line in order.order_line:
-                order_total += line.price_subtotal
-
-            for line in order.order_line:
-                #price = line.price_unit * (1 - (line.discount or 0.0) / 100.0)
-                price = line.purchase_unit_rate * (1 - (line.discount or 0.0) / 100.0)
-                val1 += (price * line.line_qty)
-                untax_amount += line.price_subtotal
-                if order.package_and_forwording_type == 'per_unit' and order.package_and_forwording:
-                    other_charges += (order.package_and_forwording * line.line_qty)
-                if order.freight_type == 'per_unit' and order.freight:
-                    other_charges += (order.freight * line.line_qty)
-                if order_total > 0:
-                    #Add fixed amount to order included in price
-                    pre_line = round((price * 100) / order_total,2)
-                    line_part = 0.0
-                    if order.package_and_forwording_type == 'include' and order.package_and_forwording:
-                        line_part = order.package_and_forwording * (pre_line / 100)
-                        price -= line_part
-                        
-                    if order.freight_type == 'include' and order.freight:
-                        line_part = order.freight  * (pre_line / 100)
-                        price -= line_part
-                        
-                    if order.insurance_type == 'include' and order.insurance:
-                        line_part = order.insurance  * (pre_line / 100)
-                        price -= line_part
-
-                taxes = tax_obj.compute_all(cr, uid, line.taxes_id, price, line.line_qty, line.product_id, line.order_id.partner_id)
-                tax_total += taxes.get('total_included', 0.0) - taxes.get('total', 0.0)
-            
-            #Add fixed amount to order included in price
-            if order.package_and_forwording_type == 'include' and order.package_and_forwording:
-                included_price += order.package_and_forwording
-                order_total -= order.package_and_forwording
-                
-            if order.freight_type == 'include' and order.freight:
-                included_price += order.freight
-                order_total -= order.freight
-                
-            if order.insurance_type == 'include' and order.insurance:
-                included_price += order.insurance
-                order_total -= order.insurance
-            
-            if order_total > 0:
-                #Add fixed amount to order percentage
-                if order.package_and_forwording_type == 'percentage' and order.package_and_forwording:
-                    other_charges += order_total * (order.package_and_forwording / 100)
-                
-                if order.freight_type == 'percentage' and order.freight:
-                    other_charges += order_total * (order.freight / 100)
-                    
-                if order.insurance_type == 'percentage' and order.insurance:
-                    other_charges += order_total * (order.insurance/100)
-
-            #Add fixed amount to order untax_amount
-            if order.package_and_forwording_type in ('fix', 'include') and order.package_and_forwording:
-                other_charges += order.package_and_forwording
-            if order.freight_type in ('fix', 'include') and order.freight:
-                other_charges += order.freight
-            if order.insurance_type in ('fix', 'include') and order.insurance:
-                other_charges += order.insurance
-
-            tax_total = cur_obj.round(cr, uid, cur, tax_total)
-            untax_amount = cur_obj.round(cr, uid, cur, untax_amount)  - included_price
-            order_total = other_charges + tax_total + untax_amount + order.round_off
-            res[order.id]['amount_tax'] = tax_total
-            res[order.id]['amount_untaxed'] = untax_amount
-            res[order.id]['other_charges'] = other_charges
-            res[order.id]['amount_total'] = order_total
-        return res
-
-    def _get_order(self, cr, uid, ids, context=None):
-        result = {}
-        for line in self.pool.get('purchase.order.line').browse(cr, uid, ids, context=context):
-            result[line.order_id.id] = True
-        return result.keys()
+    #: per unit charges apply to the purchase quantity
+    _line_qty_column = 'line_qty'
 
     def action_po_amendment(self, cr, uid, ids, context=None):
         """
@@ -240,26 +149,6 @@ class purchase_order(osv.osv):
         'service_delivery_order':  fields.many2one('stock.picking', 'Service Delivery Order'),
         'expected_date_by_production_order': fields.one2many('purchase.expected.date', 'order_id',string='Expected Dates By Production Order',readonly=True),
 
-        'amount_untaxed': fields.function(_amount_all, digits_compute= dp.get_precision('Account'), string='Untaxed Amount',
-            store={
-                   'purchase.order': (lambda self, cr, uid, ids, c={}: ids, ['round_off','insurance', 'insurance_type', 'freight_type', 'freight', 'package_and_forwording_type', 'package_and_forwording', 'order_line'], 11),
-                   'purchase.order.line': (_get_order, None, 10),
-            }, multi="sums", help="The amount without tax", track_visibility='always'),
-        'amount_tax': fields.function(_amount_all, digits_compute= dp.get_precision('Account'), string='Taxes',
-            store={
-                'purchase.order': (lambda self, cr, uid, ids, c={}: ids, ['round_off','insurance', 'insurance_type', 'freight_type', 'freight', 'package_and_forwording_type', 'package_and_forwording', 'order_line'], 11),
-                'purchase.order.line': (_get_order, None, 10),
-            }, multi="sums", help="The tax amount"),
-        'amount_total': fields.function(_amount_all, digits_compute= dp.get_precision('Account'), string='Total',
-            store={
-                'purchase.order': (lambda self, cr, uid, ids, c={}: ids, ['round_off','insurance', 'insurance_type', 'freight_type', 'freight', 'package_and_forwording_type', 'package_and_forwording', 'order_line'], 11),
-                'purchase.order.line': (_get_order, None, 10),
-            }, multi="sums",help="The total amount"),
-        'other_charges': fields.function(_amount_all, digits_compute=dp.get_precision('Account'), string='Other Charges',
-            store={
-                'purchase.order': (lambda self, cr, uid, ids, c={}: ids, ['round_off','insurance', 'insurance_type', 'freight_type', 'freight', 'package_and_forwording_type', 'package_and_forwording', 'order_line'], 11),
-                'purchase.order.line': (_get_order, None, 10),
-            }, multi="sums", help="Computed as Packing & Forwarding + Freight + Insurance"),
 
     }
 
@@ -550,78 +439,34 @@ class purchase_order(osv.osv):
 
         return pkg_frwrd,freight,insurance
 
-    def action_invoice_create(self, cr, uid, ids, context=None):
-        """Generates invoice for given ids of purchase orders and links that invoice ID to purchase order.
-        :param ids: list of ids of purchase orders.
-        :return: ID of created invoice.
-        :rtype: int
+    def _prepare_invoice_vals(self, cr, uid, order, pay_acc_id, journal_id, context=None):
+        """
         Process:
-            This function overwrite only to find GRN Document No. and attached with related invoice.
+            -call super()
+            -find GRN Document No. and attached with related invoice,
+            -get all extra charges individualy
         """
-        if context is None:
-            context = {}
-        journal_obj = self.pool.get('account.journal')
-        inv_obj = self.pool.get('account.invoice')
-        inv_line_obj = self.pool.get('account.invoice.line')
-
-        res = False
-        uid_company_id = self.pool.get('res.users').browse(cr, uid, uid, context=context).company_id.id
-        for order in self.browse(cr, uid, ids, context=context):
-            payment_ref = ''#Added payment refenrece as GRN DOCUMENT NO.
-            if order.picking_ids: payment_ref = order.picking_ids[0].name
-            context.pop('force_company', None)
-            if order.company_id.id != uid_company_id:
-                #if the company of the document is different than the current user company, force the company in the context
-                #then re-do a browse to read the property fields for the good company.
-                context['force_company'] = order.company_id.id
-                order = self.browse(cr, uid, order.id, context=context)
-            pay_acc_id = order.partner_id.property_account_payable.id
-            journal_ids = journal_obj.search(cr, uid, [('type', '=', 'purchase'), ('company_id', '=', order.company_id.id)], limit=1)
-            if not journal_ids:
-                raise osv.except_osv(_('Error!'),
-                    _('Define purchase journal for this company: "%s" (id:%d).') % (order.company_id.name, order.company_id.id))
-
-            # generate invoice line correspond to PO line and link that to created invoice (inv_id) and PO line
-            inv_lines = []
-            for po_line in order.order_line:
-                acc_id = self._choose_account_from_po_line(cr, uid, po_line, context=context)
-                inv_line_data = self._prepare_inv_line(cr, uid, acc_id, po_line, context=context)
-                inv_line_id = inv_line_obj.create(cr, uid, inv_line_data, context=context)
-                inv_lines.append(inv_line_id)
-
-                po_line.write({'invoice_lines': [(4, inv_line_id)]}, context=context)
-
-            #method to get all extra charges individualy
-            pkg_frwrd, freight, insurance = self.other_charges(cr, uid, order)
-
-            # get invoice data and create invoice
-            inv_data = {
-                'name': order.partner_ref or order.name,
-                'reference': payment_ref or '',
-                'account_id': pay_acc_id,
-                'type': 'in_invoice',
-                'partner_id': order.partner_id.id,
-                'currency_id': order.pricelist_id.currency_id.id,
-                'journal_id': len(journal_ids) and journal_ids[0] or False,
-                'invoice_line': [(6, 0, inv_lines)],
-                'origin': order.name,
-                'fiscal_position': order.fiscal_position.id or False,
-                'payment_term': order.payment_term_id.id or False,
-                'company_id': order.company_id.id,
-                'package_and_forwording':pkg_frwrd or 0.0,
-                'insurance':insurance or 0.0,
-                'freight':freight or 0.0,
-            }
-            inv_id = inv_obj.create(cr, uid, inv_data, context=context)
-
-            # compute the invoice
-            inv_obj.button_compute(cr, uid, [inv_id], context=context, set_total=True)
-
-            # Link this new invoice to related purchase order
-            order.write({'invoice_ids': [(4, inv_id)]}, context=context)
-            res = inv_id
+        res = super(purchase_order, self)._prepare_invoice_vals(cr, uid, order, pay_acc_id, journal_id, context=context)
+        payment_ref = ''#Added payment refenrece as GRN DOCUMENT NO.
+        if order.picking_ids: payment_ref = order.picking_ids[0].name
+        #method to get all extra charges individualy
+        pkg_frwrd, freight, insurance = self.other_charges(cr, uid, order)
+        res.pop('round_off', None)
+        res.update({
+            'reference': payment_ref or '',
+            'package_and_forwording':pkg_frwrd or 0.0,
+            'insurance':insurance or 0.0,
+            'freight':freight or 0.0,
+        })
         return res
 
+    def _po_line_invoice_vals(self, cr, uid, context=None):
+        """
+        Process:
+            -purchase order lines are only linked with invoice lines, not flagged as invoiced
+        """
+        return {}
+
 purchase_order()
 
 class purchase_order_line(osv.osv):
@@ -660,6 +505,29 @@ class purchase_order_line(osv.osv):
 
         return res
 
+    def _line_price_qty(self, line):
+        """
+        -Return
+            -Purchase Rate and Purchase Qty, order totals follow price_subtotal
+        """
+        return line.purchase_unit_rate, line.line_qty
+
+    def _line_breakdown(self, cr, uid, ids, field_names, arg, context=None):
+        return super(purchase_order_line, self)._line_breakdown(cr, uid, ids, field_names, arg, context=context)
+
+    def _get_breakdown_lines(self, cr, uid, ids, context=None):
+        return super(purchase_order_line, self)._get_breakdown_lines(cr, uid, ids, context=context)
+
+    def _get_lines_from_order(self, cr, uid, ids, context=None):
+        return self.pool.get('purchase.order.line').search(cr, uid, [('order_id', 'in', ids)], context=context)
+
+    #Breakdown of l10n_in_purchase, also recomputed on purchase rate and qty
+    _line_breakdown_store = {
+        'purchase.order.line': (_get_breakdown_lines, ['price_unit', 'purchase_unit_rate', 'discount', 'product_qty', 'line_qty', 'taxes_id', 'product_id', 'order_id'], 5),
+        'purchase.order': (_get_lines_from_order, ['partner_id', 'pricelist_id', 'package_and_forwording_type', 'package_and_forwording',
+                                                   'freight_type', 'freight', 'insurance_type', 'insurance'], 5),
+    }
+
     _columns = {
         'product_qty': fields.float('Required Qty', digits_compute=dp.get_precision('Product Unit of Measure'), required=True),
         'line_qty': fields.float('Purchase Qty'),
@@ -672,6 +540,12 @@ class purchase_order_line(osv.osv):
         'date_planned': fields.date('Required Date', required=True),#just overwrited for string
         'price_subtotal': fields.function(_amount_line, multi="subt",string='Subtotal', digits_compute= dp.get_precision('Account')),
         'base_price_subtotal': fields.function(_amount_line, multi="subt", string='Base Subtotal', digits_compute= dp.get_precision('Account')),
+        'line_untaxed': fields.function(_line_breakdown, multi='breakdown', string='Untaxed Contribution', digits_compute= dp.get_precision('Account'),
+            store=_line_breakdown_store),
+        'line_included_charges': fields.function(_line_breakdown, multi='breakdown', string='Included Charges', digits_compute= dp.get_precision('Account'),
+            store=_line_breakdown_store, help="Part of the charges included in price of the order allocated to the line, deducted from the price before computing its taxes."),
+        'line_tax': fields.function(_line_breakdown, multi='breakdown', string='Tax Contribution',
+            store=_line_breakdown_store, help="Tax of line, not rounded, summed into order tax amount."),
     }
 
     _defaults = {
@@ -27,4 +27,5 @@ import purchase_order
 import picking
 import export_report
 import export_print
+import mrp_workcenter_capacity
 # vim:expandtab:smartindent:tabstop=4:softtabstop=4:shiftwidth=4:
@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+#    OpenERP, Open Source Management Solution
+#    Copyright (C) 2004-2010 Tiny SPRL (<http://tiny.be>).
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as
+#    published by the Free Software Foundation, either version 3 of the
+#    License, or (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+##############################################################################
+
+from openerp import SUPERUSER_ID
+from openerp.osv import fields, osv
+import openerp.addons.decimal_precision as dp
+
+LAST_REFRESH_PARAM = 'l10n_in_mrp_subcontract.capacity_last_refresh'
+# seconds scanned again before the last refresh: write_date is the start time of
+# the writing transaction, which may commit after a refresh started later
+REFRESH_OVERLAP = 3600
+
+class mrp_workcenter_capacity(osv.osv):
+    """
+    Work center load per day, materialised from work-orders, log entries
+    and rejections. Rows are only rebuilt for the (work center, day) keys
+    touched since the last refresh, see refresh_capacity().
+    """
+    _name = "mrp.workcenter.capacity"
+    _description = "Work Center Capacity"
+    _order = "day desc, workcenter_id"
+
+    _columns = {
+        'workcenter_id': fields.many2one('mrp.workcenter', 'Work Center', readonly=True, select=True),
+        'day': fields.date('Day', readonly=True, select=True),
+        'workorder_count': fields.integer('Work Orders', readonly=True),
+        'planned_hours': fields.float('Planned Time(HH:MM)', readonly=True),
+        'actual_hours': fields.float('Actual Time(HH:MM)', readonly=True),
+        'paused_hours': fields.float('Paused Time(HH:MM)', readonly=True,
+            help="Time between consecutive log entries of the work-orders."),
+        'rejected_qty': fields.float('Rejected Qty', readonly=True, digits_compute=dp.get_precision('Product Unit of Measure'),
+            help="Quantity rejected by previous work-orders of the productions (Rejection Qty of work-orders)."),
+    }
+
+    _sql_constraints = [('workcenter_day_uniq', 'unique(workcenter_id, day)', 'Capacity is computed once per work center and day!')]
+
+    def init(self, cr):
+        """
+        Process
+            -Keep (work center, day) each work-order was last counted in,
+             so a work-order moved to another day also refreshes its former day.
+        """
+        cr.execute("""SELECT 1 FROM pg_class WHERE relname = 'mrp_workcenter_capacity_workorder'""")
+        if not cr.fetchone():
+            cr.execute("""CREATE TABLE mrp_workcenter_capacity_workorder (
+                            workorder_id integer PRIMARY KEY,
+                            workcenter_id integer,
+                            day date)""")
+        cr.execute("""SELECT 1 FROM pg_class WHERE relname = 'mrp_workcenter_capacity_dirty'""")
+        if not cr.fetchone():
+            cr.execute("""CREATE TABLE mrp_workcenter_capacity_dirty (workorder_id integer)""")
+
+    # (work center, day) key of a work-order
+    _workorder_key = """ mpwl.workcenter_id, COALESCE(mpwl.date_start, mpwl.date_planned)::date """
+
+    def mark_dirty(self, cr, uid, workorder_ids, context=None):
+        """
+        Process
+            -Remember work-orders to refresh on next refresh, for changes leaving
+             no write_date behind like deleted log entries and rejections.
+        """
+        workorder_ids = list(set(filter(None, workorder_ids)))
+        if workorder_ids:
+            cr.execute("""INSERT INTO mrp_workcenter_capacity_dirty (workorder_id) VALUES """ + ", ".join(["(%s)"] * len(workorder_ids)), workorder_ids)
+        return True
+
+    def _production_workorders(self, cr, uid, workorder_ids, context=None):
+        """
+        Return
+            -work-orders of the productions of given work-orders, rejected qty of a
+             work-order counts on all next work-orders of its production
+        """
+        if not workorder_ids:
+            return []
+        cr.execute("""  SELECT id FROM mrp_production_workcenter_line WHERE id IN %s
+                        UNION
+                        SELECT wo.id FROM mrp_production_workcenter_line wo
+                        JOIN mrp_production_workcenter_line rwo ON (rwo.production_id = wo.production_id)
+                        WHERE rwo.id IN %s """, (tuple(workorder_ids), tuple(workorder_ids)))
+        return [x[0] for x in cr.fetchall()]
+
+    def _touched_workorders(self, cr, uid, since, context=None):
+        """
+        Return
+            -work-orders changed themselves, or by their log entries or rejections, after since,
+            -work-orders marked dirty and deleted work-orders still counted in a day.
+        """
+        cr.execute("""  SELECT id FROM mrp_production_workcenter_line WHERE write_date > %s
+                        UNION
+                        SELECT workorder_id FROM log_entry WHERE write_date > %s AND workorder_id IS NOT NULL
+                        UNION
+                        SELECT workorder_id FROM mrp_workcenter_capacity_workorder c
+                        WHERE NOT EXISTS (SELECT 1 FROM mrp_production_workcenter_line WHERE id = c.workorder_id)
+                        """, (since, since))
+        workorder_ids = [x[0] for x in cr.fetchall()]
+        cr.execute("""SELECT rejected_workorder_id FROM stock_moves_rejection WHERE write_date > %s AND rejected_workorder_id IS NOT NULL""", (since,))
+        workorder_ids += self._production_workorders(cr, uid, [x[0] for x in cr.fetchall()], context=context)
+        cr.execute("""DELETE FROM mrp_workcenter_capacity_dirty RETURNING workorder_id""")
+        workorder_ids += [x[0] for x in cr.fetchall()]
+        return list(set(workorder_ids))
+
+    def refresh_capacity(self, cr, uid, full=False, context=None):
+        """
+        Process
+            -Find work-orders touched since last refresh (all of them on full refresh),
+             writes up to REFRESH_OVERLAP seconds older are scanned again so a transaction
+             committed after the last refresh started is not missed,
+            -Rebuild capacity rows of their current and former (work center, day),
+            -Remember refresh time.
+        """
+        param_obj = self.pool.get('ir.config_parameter')
+        cr.execute("""SELECT (now() at time zone 'UTC')""")
+        refresh_time = cr.fetchone()[0]
+        last_refresh = param_obj.get_param(cr, SUPERUSER_ID, LAST_REFRESH_PARAM)
+
+        if full or not last_refresh:
+            cr.execute("""DELETE FROM mrp_workcenter_capacity""")
+            cr.execute("""DELETE FROM mrp_workcenter_capacity_workorder""")
+            cr.execute("""DELETE FROM mrp_workcenter_capacity_dirty""")
+            cr.execute("""SELECT id FROM mrp_production_workcenter_line""")
+            workorder_ids = [x[0] for x in cr.fetchall()]
+        else:
+            cr.execute("""SELECT %s::timestamp - interval '1 second' * %s""", (last_refresh, REFRESH_OVERLAP))
+            workorder_ids = self._touched_workorders(cr, uid, cr.fetchone()[0], context=context)
+
+        if workorder_ids:
+            cr.execute("""  SELECT DISTINCT """ + self._workorder_key + """ FROM mrp_production_workcenter_line mpwl
+                            WHERE mpwl.id IN %s
+                            UNION
+                            SELECT workcenter_id, day FROM mrp_workcenter_capacity_workorder
+                            WHERE workorder_id IN %s """, (tuple(workorder_ids), tuple(workorder_ids)))
+            keys = [key for key in cr.fetchall() if key[0] and key[1]]
+            if keys:
+                self._rebuild_days(cr, uid, keys, context=context)
+            cr.execute("""DELETE FROM mrp_workcenter_capacity_workorder WHERE workorder_id IN %s""", (tuple(workorder_ids),))
+            cr.execute("""  INSERT INTO mrp_workcenter_capacity_workorder (workorder_id, workcenter_id, day)
+                            SELECT mpwl.id, """ + self._workorder_key + """ FROM mrp_production_workcenter_line mpwl
+                            WHERE mpwl.id IN %s """, (tuple(workorder_ids),))
+
+        param_obj.set_param(cr, SUPERUSER_ID, LAST_REFRESH_PARAM, refresh_time)
+        return True
+
+    def _rebuild_days(self, cr, uid, keys, context=None):
+        """
+        Process
+            -Recompute capacity of given (work center, day) keys in one grouped query,
+             rejected qty is t_rejection_qty of work-orders, see _upstream_rejection_sql().
+        """
+        workorder_obj = self.pool.get('mrp.production.workcenter.line')
+        cr.execute("""DELETE FROM mrp_workcenter_capacity WHERE (workcenter_id, day) IN %s""", (tuple(keys),))
+        cr.execute("""
+            INSERT INTO mrp_workcenter_capacity
+                (workcenter_id, day, workorder_count, planned_hours, actual_hours, paused_hours, rejected_qty,
+                 create_uid, create_date, write_uid, write_date)
+            WITH wo AS (
+                SELECT mpwl.id, COALESCE(mpwl.hour, 0.0) AS hour, COALESCE(mpwl.delay, 0.0) AS delay,
+                    """ + self._workorder_key + """ AS day, mpwl.workcenter_id, mpwl.production_id
+                FROM mrp_production_workcenter_line mpwl
+                WHERE COALESCE(mpwl.state, '') != 'cancel'
+                AND (""" + self._workorder_key + """) IN %s
+            )
+            SELECT wo.workcenter_id, wo.day, COUNT(wo.id),
+                SUM(wo.hour), SUM(wo.delay), SUM(COALESCE(pause.hours, 0.0)), SUM(COALESCE(rejection.qty, 0.0)),
+                %s, (now() at time zone 'UTC'), %s, (now() at time zone 'UTC')
+            FROM wo
+            LEFT JOIN (
+                SELECT gap.workorder_id, SUM(EXTRACT(EPOCH FROM gap.start_date - gap.previous_end) / 3600.0) AS hours
+                FROM (
+                    SELECT workorder_id, start_date,
+                        LAG(end_date) OVER (PARTITION BY workorder_id ORDER BY start_date, id) AS previous_end
+                    FROM log_entry
+                    WHERE workorder_id IN (SELECT id FROM wo)
+                ) gap
+                WHERE gap.previous_end IS NOT NULL AND gap.start_date > gap.previous_end
+                GROUP BY gap.workorder_id
+            ) pause ON (pause.workorder_id = wo.id)
+            LEFT JOIN (""" + workorder_obj._upstream_rejection_sql("""rwo.production_id IN (SELECT production_id FROM wo)""") + """
+            ) rejection ON (rejection.id = wo.id)
+            GROUP BY wo.workcenter_id, wo.day
+            """, (tuple(keys), uid, uid))
+        return True
+
+    def _cron_refresh_capacity(self, cr, uid, context=None):
+        return self.refresh_capacity(cr, uid, context=context)
+
+mrp_workcenter_capacity()
+
+class log_entry(osv.osv):
+    _inherit = 'log.entry'
+
+    def unlink(self, cr, uid, ids, context=None):
+        """
+        Process
+            -Deleted log entries leave no write_date, mark their work-orders for capacity refresh.
+        """
+        workorder_ids = [log.workorder_id.id for log in self.browse(cr, uid, ids, context=context)]
+        self.pool.get('mrp.workcenter.capacity').mark_dirty(cr, uid, workorder_ids, context=context)
+        return super(log_entry, self).unlink(cr, uid, ids, context=context)
+
+log_entry()
+
+class stock_moves_rejection(osv.osv):
+    _inherit = 'stock.moves.rejection'
+
+    def unlink(self, cr, uid, ids, context=None):
+        """
+        Process
+            -Deleted rejections leave no write_date, mark work-orders of their productions
+             for capacity refresh.
+        """
+        capacity_obj = self.pool.get('mrp.workcenter.capacity')
+        workorder_ids = [rejection.rejected_workorder_id.id for rejection in self.browse(cr, uid, ids, context=context) if rejection.rejected_workorder_id]
+        capacity_obj.mark_dirty(cr, uid, capacity_obj._production_workorders(cr, uid, workorder_ids, context=context), context=context)
+        return super(stock_moves_rejection, self).unlink(cr, uid, ids, context=context)
+
+stock_moves_rejection()
+
+# vim:expandtab:smartindent:tabstop=4:softtabstop=4:shiftwidth=4:
@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+#    OpenERP, Open Source Management Solution
+#    Copyright (C) 2004-2010 Tiny SPRL (<http://tiny.be>).
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as
+#    published by the Free Software Foundation, either version 3 of the
+#    License, or (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+##############################################################################
+
+"""Compare the BoM explosion of l10n_in_mrp_subcontract with the recursion of mrp.
+
+Two BoM trees are created on a database where l10n_in_mrp_subcontract is
+installed:
+
+ - deep: a chain of --depth phantom BoMs, each one using the next, the
+   last one made of --leaves raw materials,
+ - wide: one BoM of --width phantom lines, each one made of --leaves raw
+   materials.
+
+Each tree is exploded --repeat times by mrp.bom._bom_explode() of this
+module (structure cached, explicit stack) and by the recursive
+_bom_explode() of mrp, and both results are checked to be the same. The
+first explosion of this module is timed separately as it fills the cache.
+A recursion going deeper than the Python limit is reported as failed.
+
+Everything is rolled back at the end, the database is left as it was.
+
+Usage: python benchmark_bom_explode.py -d DATABASE [-c openerp-server.conf]
+       [--depth 100] [--width 500] [--leaves 5] [--repeat 10]
+"""
+
+import optparse
+import time
+
+import openerp
+from openerp import SUPERUSER_ID
+from openerp.addons.l10n_in_mrp_subcontract.mrp import mrp_bom
+
+def create_products(cr, registry, prefix, count):
+    """
+    -Return
+        -[(product id, uom id)] of count new products
+    """
+    product_obj = registry.get('product.product')
+    product_ids = [product_obj.create(cr, SUPERUSER_ID, {'name': '%s %04d' % (prefix, index + 1), 'type': 'product'})
+                   for index in xrange(count)]
+    return [(product.id, product.uom_id.id) for product in product_obj.browse(cr, SUPERUSER_ID, product_ids)]
+
+def create_bom(cr, registry, product, lines, bom_type='normal'):
+    """
+    -Process
+        -Create a BoM of product, lines are [(product, line type)].
+    -Return
+        -id of the BoM
+    """
+    return registry.get('mrp.bom').create(cr, SUPERUSER_ID, {
+        'name': 'Benchmark BoM',
+        'product_id': product[0],
+        'product_uom': product[1],
+        'product_qty': 1.0,
+        'type': bom_type,
+        'bom_lines': [(0, 0, {
+            'name': 'Benchmark BoM line',
+            'product_id': line_product[0],
+            'product_uom': line_product[1],
+            'product_qty': 2.0,
+            'type': line_type,
+        }) for line_product, line_type in lines],
+    })
+
+def create_deep(cr, registry, depth, leaves):
+    chain = create_products(cr, registry, 'Benchmark Deep', depth + 1)
+    raw = create_products(cr, registry, 'Benchmark Deep Raw', leaves)
+    create_bom(cr, registry, chain[depth], [(product, 'normal') for product in raw], 'phantom')
+    for index in reversed(xrange(1, depth)):
+        create_bom(cr, registry, chain[index], [(chain[index + 1], 'phantom')], 'phantom')
+    return create_bom(cr, registry, chain[0], [(chain[1], 'phantom')])
+
+def create_wide(cr, registry, width, leaves):
+    parts = create_products(cr, registry, 'Benchmark Wide', width + 1)
+    raw = create_products(cr, registry, 'Benchmark Wide Raw', leaves)
+    for product in parts[1:]:
+        create_bom(cr, registry, product, [(line_product, 'normal') for line_product in raw], 'phantom')
+    return create_bom(cr, registry, parts[0], [(product, 'phantom') for product in parts[1:]])
+
+def explode(cr, bom_obj, bom_id, legacy=False):
+    """
+    -Process
+        -Explode the BoM with _bom_explode() of this module or, with legacy, with the
+         recursive one of mrp: its recursive calls go through the instance attribute
+         set here, so they stay in mrp code.
+    """
+    bom = bom_obj.browse(cr, SUPERUSER_ID, bom_id)
+    if not legacy:
+        return bom_obj._bom_explode(cr, SUPERUSER_ID, bom, 1.0, [])
+    bom_obj._bom_explode = lambda *args, **kwargs: super(mrp_bom, bom_obj)._bom_explode(*args, **kwargs)
+    try:
+        return bom_obj._bom_explode(cr, SUPERUSER_ID, bom, 1.0, [])
+    finally:
+        del bom_obj._bom_explode
+
+def timed(function, repeat):
+    """
+    -Return
+        -(average seconds per call, last result), result is None if the call failed
+    """
+    result = None
+    start = time.time()
+    try:
+        for index in xrange(repeat):
+            result = function()
+    except RuntimeError:
+        # maximum recursion depth exceeded
+        return time.time() - start, None
+    return (time.time() - start) / repeat, result
+
+def products_of(result):
+    return sorted([(line['product_id'], round(line['product_qty'], 6)) for line in result[0]])
+
+def compare(cr, registry, name, bom_id, repeat):
+    bom_obj = registry.get('mrp.bom')
+    bom_obj.clear_caches()
+    cold, result = timed(lambda: explode(cr, bom_obj, bom_id), 1)
+    warm, result = timed(lambda: explode(cr, bom_obj, bom_id), repeat)
+    legacy, legacy_result = timed(lambda: explode(cr, bom_obj, bom_id, legacy=True), repeat)
+    print '%s: %d products, %d work centers' % (name, len(result[0]), len(result[1]))
+    print '  iterative, first call: %8.4fs' % cold
+    print '  iterative, cached:     %8.4fs' % warm
+    if legacy_result is None:
+        print '  recursive:             failed, maximum recursion depth exceeded'
+    else:
+        print '  recursive:             %8.4fs (%.1fx)' % (legacy, legacy / (warm or 1e-9))
+        assert products_of(result) == products_of(legacy_result), 'explosions of %s differ' % (name,)
+
+def run(database, depth, width, leaves, repeat):
+    registry = openerp.modules.registry.RegistryManager.get(database)
+    cr = registry.db.cursor()
+    try:
+        compare(cr, registry, 'deep (%d levels)' % depth, create_deep(cr, registry, depth, leaves), repeat)
+        compare(cr, registry, 'wide (%d lines)' % width, create_wide(cr, registry, width, leaves), repeat)
+    finally:
+        cr.rollback()
+        cr.close()
+        registry.get('mrp.bom').clear_caches()
+
+if __name__ == '__main__':
+    parser = optparse.OptionParser(usage='%prog -d DATABASE [options]')
+    parser.add_option('-d', '--database', help='database where l10n_in_mrp_subcontract is installed')
+    parser.add_option('-c', '--config', help='OpenERP server configuration file')
+    parser.add_option('--depth', type='int', default=100, help='levels of the deep BoM [default: %default]')
+    parser.add_option('--width', type='int', default=500, help='lines of the wide BoM [default: %default]')
+    parser.add_option('--leaves', type='int', default=5, help='raw materials of the last BoMs [default: %default]')
+    parser.add_option('--repeat', type='int', default=10, help='explosions timed per tree [default: %default]')
+    options, args = parser.parse_args()
+    if not options.database:
+        parser.error('a database is required')
+    openerp.tools.config.parse_config(options.config and ['-c', options.config] or [])
+    run(options.database, options.depth, options.width, options.leaves, options.repeat)
@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+#    OpenERP, Open Source Management Solution
+#    Copyright (C) 2004-2010 Tiny SPRL (<http://tiny.be>).
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as
+#    published by the Free Software Foundation, either version 3 of the
+#    License, or (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+##############################################################################
+
+"""Time the partial receipt of a large incoming shipment.
+
+An incoming shipment of --moves moves (2,000 by default) is created from
+suppliers to stock on a database where l10n_in_mrp_subcontract is
+installed, confirmed and assigned. Then stock.picking.do_partial() receives
+every move, --partial of them (half by default) for part of their quantity
+so that the split moves and the back order are created as well. Only
+do_partial() is timed.
+
+Everything is rolled back at the end, the database is left as it was.
+
+Usage: python benchmark_partial_receipt.py -d DATABASE [-c openerp-server.conf]
+       [--moves 2000] [--products 50] [--partial 0.5]
+"""
+
+import optparse
+import time
+
+import openerp
+from openerp import SUPERUSER_ID, netsvc
+
+def create_receipt(cr, registry, moves, products):
+    """
+    -Process
+        -Create products and an assigned incoming shipment of given number of moves.
+    -Return
+        -id of the shipment
+    """
+    data_obj = registry.get('ir.model.data')
+    product_obj = registry.get('product.product')
+    picking_obj = registry.get('stock.picking')
+    move_obj = registry.get('stock.move')
+    supplier_location_id = data_obj.get_object_reference(cr, SUPERUSER_ID, 'stock', 'stock_location_suppliers')[1]
+    stock_location_id = data_obj.get_object_reference(cr, SUPERUSER_ID, 'stock', 'stock_location_stock')[1]
+
+    product_ids = []
+    for index in xrange(products):
+        product_ids.append(product_obj.create(cr, SUPERUSER_ID, {
+            'name': 'Benchmark Product %04d' % (index + 1),
+            'type': 'product',
+            'standard_price': 10.0,
+        }))
+    uoms = dict([(product.id, product.uom_id.id) for product in product_obj.browse(cr, SUPERUSER_ID, product_ids)])
+
+    picking_id = picking_obj.create(cr, SUPERUSER_ID, {'type': 'in'})
+    for index in xrange(moves):
+        product_id = product_ids[index % products]
+        move_obj.create(cr, SUPERUSER_ID, {
+            'name': 'Benchmark Move %05d' % (index + 1),
+            'picking_id': picking_id,
+            'product_id': product_id,
+            'product_qty': 10.0,
+            'product_uom': uoms[product_id],
+            'location_id': supplier_location_id,
+            'location_dest_id': stock_location_id,
+        })
+    netsvc.LocalService('workflow').trg_validate(SUPERUSER_ID, 'stock.picking', picking_id, 'button_confirm', cr)
+    picking_obj.force_assign(cr, SUPERUSER_ID, [picking_id])
+    return picking_id
+
+def partial_datas(cr, registry, picking_id, partial):
+    """
+    -Process
+        -Receive every move of the shipment, one move out of 1/partial for 4 of its 10 units.
+    -Return
+        -partial_datas as given by the wizard stock.partial.picking
+    """
+    picking = registry.get('stock.picking').browse(cr, SUPERUSER_ID, picking_id)
+    every = partial and int(round(1 / partial)) or 0
+    res = {'delivery_date': time.strftime('%Y-%m-%d %H:%M:%S')}
+    for index, move in enumerate(picking.move_lines):
+        product_qty = move.product_qty
+        if every and index % every == 0:
+            product_qty = 4.0
+        res['move%s' % move.id] = {
+            'product_id': move.product_id.id,
+            'product_qty': product_qty,
+            'product_uom': move.product_uom.id,
+            'prodlot_id': False,
+        }
+    return res
+
+def run(database, moves, products, partial):
+    registry = openerp.modules.registry.RegistryManager.get(database)
+    cr = registry.db.cursor()
+    try:
+        picking_id = create_receipt(cr, registry, moves, products)
+        datas = partial_datas(cr, registry, picking_id, partial)
+        start = time.time()
+        registry.get('stock.picking').do_partial(cr, SUPERUSER_ID, [picking_id], datas)
+        elapsed = time.time() - start
+        # the received moves and the remaining ones are split between the
+        # shipment and its back order
+        cr.execute("SELECT COALESCE(SUM(CASE WHEN m.state = 'done' THEN 1 ELSE 0 END), 0), "
+                   "COALESCE(SUM(CASE WHEN m.state != 'done' THEN 1 ELSE 0 END), 0) "
+                   "FROM stock_move m JOIN stock_picking p ON (p.id = m.picking_id) "
+                   "WHERE p.id = %s OR p.backorder_id = %s "
+                   "OR p.id = (SELECT backorder_id FROM stock_picking WHERE id = %s)",
+                   (picking_id, picking_id, picking_id))
+        done, remaining = cr.fetchone()
+    finally:
+        cr.rollback()
+        cr.close()
+    return elapsed, done, remaining
+
+if __name__ == '__main__':
+    parser = optparse.OptionParser(usage='%prog -d DATABASE [options]')
+    parser.add_option('-d', '--database', help='database where l10n_in_mrp_subcontract is installed')
+    parser.add_option('-c', '--config', help='OpenERP server configuration file')
+    parser.add_option('--moves', type='int', default=2000, help='number of moves of the shipment [default: %default]')
+    parser.add_option('--products', type='int', default=50, help='number of distinct products [default: %default]')
+    parser.add_option('--partial', type='float', default=0.5, help='share of moves received partially [default: %default]')
+    options, args = parser.parse_args()
+    if not options.database:
+        parser.error('a database is required')
+    openerp.tools.config.parse_config(options.config and ['-c', options.config] or [])
+    elapsed, done, remaining = run(options.database, options.moves, options.products, options.partial)
+    print '%d moves received in %.2fs (%.0f moves/s): %d done moves, %d moves left to receive' % (
+        options.moves, elapsed, options.moves / elapsed, done, remaining)
@@ -27,6 +27,7 @@ from dateutil.relativedelta import relativedelta
 from openerp.tools.translate import _
 from datetime import datetime
 from openerp import netsvc
+from openerp.addons.l10n_in_base.orm_bulk import bulk_insert
 
 class stock_move(osv.osv):
     """
@@ -34,8 +35,52 @@ class stock_move(osv.osv):
     """
     _inherit = 'stock.move'
 
+    def write(self, cr, uid, ids, vals, context=None):
+        """
+        -Process
+            -Produced quantity of productions the moves are taken away from is
+             recomputed too, store triggers only see the new production of a move.
+        """
+        if isinstance(ids, (int, long)):
+            ids = [ids]
+        old_production_ids = []
+        if 'production_id' in vals and ids:
+            cr.execute("""  SELECT DISTINCT production_id FROM stock_move
+                            WHERE id IN %s AND production_id IS NOT NULL
+                            AND production_id IS DISTINCT FROM %s """, (tuple(ids), vals['production_id'] or None))
+            old_production_ids = [x[0] for x in cr.fetchall()]
+        res = super(stock_move, self).write(cr, uid, ids, vals, context=context)
+        if old_production_ids:
+            self.pool.get('mrp.production')._store_set_values(cr, uid, old_production_ids, ['already_produced_qty'], context)
+        return res
+
+    def _returned_qty_by_move(self, cr, uid, ids):
+        """
+        -Process
+            -Sum return moves of done moves in one query,
+             only take into account 'product return' moves, ignoring any other
+             kind of upstream moves, such as internal procurements, etc.
+             a valid return move will be the exact opposite of ours:
+                 (src location, dest location) <=> (dest location, src location))
+        -Return
+            -{move_id: returned qty} of done moves
+        """
+        if not ids:
+            return {}
+        cr.execute("""  SELECT m.id, COALESCE(SUM(r.product_qty * u.factor), 0.0)
+                        FROM stock_move m
+                        LEFT JOIN stock_move_history_ids h ON (h.child_id = m.id)
+                        LEFT JOIN stock_move r ON (r.id = h.parent_id AND r.state != 'cancel'
+                                                   AND r.location_dest_id = m.location_id
+                                                   AND r.location_id = m.location_dest_id)
+                        LEFT JOIN product_uom u ON (u.id = r.product_uom)
+                        WHERE m.id IN %s AND m.state = 'done'
+                        GROUP BY m.id """, (tuple(ids),))
+        return dict(cr.fetchall())
+
     def _return_history(self, cr, uid, ids, field_name, arg, context=None):
         """ Gets returns qty of picking
+            -moves which are fully returned or QC processed are marked as QC completed with one write
         """
         if context is None:
             context = {}
@@ -43,41 +88,34 @@ class stock_move(osv.osv):
         if isinstance(ids, (int, long)):
             ids = [ids]
         return_history = {}.fromkeys(ids, 0.0)
-        for m in self.browse(cr, uid, ids):
-            if m.state == 'done':
-                return_history[m.id] = 0
-                for rec in m.move_history_ids2:
-                    if rec.state == 'cancel': continue
-                    # only take into account 'product return' moves, ignoring any other
-                    # kind of upstream moves, such as internal procurements, etc.
-                    # a valid return move will be the exact opposite of ours:
-                    #     (src location, dest location) <=> (dest location, src location))
-                    if rec.location_dest_id.id == m.location_id.id \
-                        and rec.location_id.id == m.location_dest_id.id:
-                        return_history[m.id] += (rec.product_qty * rec.product_uom.factor)
-                # TODO:bettter to move in funct_inv
-                if return_history[m.id] + m.qc_ok_qty == m.product_qty:
-                    m.write({'qc_completed': True})
+        return_history.update(self._returned_qty_by_move(cr, uid, ids))
+        completed = []
+        for m in self.read(cr, uid, return_history.keys(), ['state', 'qc_ok_qty', 'product_qty', 'qc_completed'], context=context):
+            # TODO:bettter to move in funct_inv
+            if m['state'] == 'done' and not m['qc_completed'] and return_history[m['id']] + m['qc_ok_qty'] == m['product_qty']:
+                completed.append(m['id'])
+        if completed:
+            self.write(cr, uid, completed, {'qc_completed': True}, context=context)
         return return_history
 
+    def _get_returned_moves(self, cr, uid, ids, context=None):
+        """
+        -Process
+            -Changed moves and moves they are return of
+        """
+        if not ids:
+            return []
+        cr.execute("SELECT child_id FROM stock_move_history_ids WHERE parent_id IN %s", (tuple(ids),))
+        return list(set(ids + [x[0] for x in cr.fetchall()]))
+
     def get_return_history(self, cr, uid, pick_id, context=None):
         """
             get return history
         """
-        pick_obj = self.pool.get('stock.picking')
-        pick = pick_obj.browse(cr, uid, pick_id, context=context)
         return_history = {}
-        for m  in pick.move_lines:
-            if m.state == 'done':
-                return_history[m.id] = 0
-                for rec in m.move_history_ids2:
-                    # only take into account 'product return' moves, ignoring any other
-                    # kind of upstream moves, such as internal procurements, etc.
-                    # a valid return move will be the exact opposite of ours:
-                    #     (src location, dest location) <=> (dest location, src location))
-                    if rec.location_dest_id.id == m.location_id.id \
-                        and rec.location_id.id == m.location_dest_id.id:
-                        return_history[m.id] += (rec.product_qty * rec.product_uom.factor)
+        move_ids = self.search(cr, uid, [('picking_id', '=', pick_id), ('state', '=', 'done')], context=context)
+        for m in self.read(cr, uid, move_ids, ['returned_qty'], context=context):
+            return_history[m['id']] = m['returned_qty']
         return return_history
 
     # TODO : Better idea to called funct_inv and write to move
@@ -110,7 +148,10 @@ class stock_move(osv.osv):
         'qc_ok_qty': fields.float('QC Qty ', digits_compute=dp.get_precision('Product Unit of Measure'), readonly=True),
 
         'is_qc': fields.boolean('Can be QC?'),
-        'returned_qty': fields.function(_return_history, method=True,string="Return Qty", digits_compute=dp.get_precision('Product Unit of Measure')),
+        'returned_qty': fields.function(_return_history, method=True,string="Return Qty", digits_compute=dp.get_precision('Product Unit of Measure'),
+            store={
+                'stock.move': (_get_returned_moves, ['state', 'product_qty', 'product_uom', 'location_id', 'location_dest_id', 'qc_ok_qty', 'move_history_ids', 'move_history_ids2'], 10),
+            }),
 
         #Fields here overwrites only for readonly process.
         'date': fields.datetime('Move Done Date', states={'done': [('readonly', True)]}, required=True, select=True, help="Move date: scheduled date until move is done, then date of actual move processing"),
@@ -149,6 +190,55 @@ class stock_move(osv.osv):
         default.update({'qc_completed': False, 'qc_ok_qty':0.0,'is_qc':is_qc,'extra_consumed':False,'received_date':False})
         return super(stock_move, self).copy(cr, uid, id, default, context=context)
 
+    # values copy() resets on a move, applied by bulk_split() as well
+    _split_reset_values = {
+        'tracking_id': False,
+        'prodlot_id': False,
+        'move_history_ids': [],
+        'move_history_ids2': [],
+        'qc_completed': False,
+        'qc_ok_qty': 0.0,
+        'extra_consumed': False,
+        'received_date': False,
+    }
+
+    def bulk_split(self, cr, uid, splits, context=None):
+        """
+        -Process
+            -copy many moves with one read of source moves and their many2many links,
+             values reset by copy() are reset the same way,
+            -new moves are inserted with bulk_insert() of l10n_in_base.
+        -Return
+            -ids of new moves, in order of splits [(move id, default values)]
+        """
+        if not splits:
+            return []
+        if context is None:
+            context = {}
+        src_ids = tuple(set([move_id for move_id, defaults in splits]))
+        cr.execute("SELECT * FROM stock_move WHERE id IN %s", (src_ids,))
+        sources = dict([(row['id'], row) for row in cr.dictfetchall()])
+        simple = [name for name, column in self._columns.items() if column._classic_write and not isinstance(column, fields.function)]
+        links = {}
+        for name, column in self._columns.items():
+            if isinstance(column, fields.many2many) and name not in self._split_reset_values:
+                table, col1, col2 = column._sql_names(self)
+                cr.execute('SELECT "' + col1 + '", "' + col2 + '" FROM "' + table + '" WHERE "' + col1 + '" IN %s', (src_ids,))
+                links[name] = {}
+                for move_id, rel_id in cr.fetchall():
+                    links[name].setdefault(move_id, []).append(rel_id)
+        vals_list = []
+        for move_id, defaults in splits:
+            vals = dict([(name, sources[move_id][name]) for name in simple if name in sources[move_id]])
+            for name in links:
+                vals[name] = [(6, 0, links[name].get(move_id, []))]
+            vals.update(self._split_reset_values)
+            if context.get('split_move', False):
+                vals['is_qc'] = True
+            vals.update(defaults)
+            vals_list.append(vals)
+        return bulk_insert(self, cr, uid, vals_list, context=context)
+
     def _prepare_chained_picking(self, cr, uid, picking_name, picking, picking_type, moves_todo, context=None):
         """Prepare the definition (values) to create a new chained picking.
 
@@ -214,45 +304,80 @@ class stock_move(osv.osv):
                 'context':context
                 }
 
+    def _pending_upstream_dest_ids(self, cr, uid, dest_ids, move_ids):
+        """
+        -Process
+            -one grouped query over all destination moves
+        -Return
+            -destination moves still having pending upstream moves outside of move_ids
+        """
+        if not dest_ids:
+            return set()
+        cr.execute("""  SELECT DISTINCT move_dest_id FROM stock_move
+                        WHERE move_dest_id IN %s AND id NOT IN %s
+                        AND state NOT IN ('done', 'cancel') """, (tuple(dest_ids), tuple(move_ids)))
+        return set([x[0] for x in cr.fetchall()])
+
+    def _trigger_moves(self, cr, uid, ids):
+        """
+        -Process
+            -fire workflow triggers only for moves some workflow is waiting on,
+             found with one query instead of one trigger lookup per move
+        """
+        if not ids:
+            return True
+        wf_service = netsvc.LocalService("workflow")
+        cr.execute("SELECT DISTINCT res_id FROM wkf_triggers WHERE model = 'stock.move' AND res_id IN %s", (tuple(ids),))
+        for id in [x[0] for x in cr.fetchall()]:
+            wf_service.trg_trigger(uid, 'stock.move', id, cr)
+        return True
+
     def action_done(self, cr, uid, ids, context=None):
         """ Makes the move done and if all moves are done, it will finish the picking.
+        -Process
+            -Moves are handled as a set: destination moves are released once all their
+             pending upstream moves are in this set, valuation is only built for real time
+             valued products and workflows are triggered once per picking.
         @return:
         """
-        picking_ids = []
-        move_ids = []
         wf_service = netsvc.LocalService("workflow")
         if context is None:
             context = {}
 
-        todo = []
-        for move in self.browse(cr, uid, ids, context=context):
-            if move.state=="draft":
-                todo.append(move.id)
+        moves = self.browse(cr, uid, ids, context=context)
+        todo = [move.id for move in moves if move.state == "draft"]
         if todo:
             self.action_confirm(cr, uid, todo, context=context)
+            moves = self.browse(cr, uid, ids, context=context)
             todo = []
 
-        for move in self.browse(cr, uid, ids, context=context):
-            if move.state in ['done','cancel']:
-                continue
-            move_ids.append(move.id)
-
-            if move.picking_id:
-                picking_ids.append(move.picking_id.id)
-            if move.move_dest_id.id and (move.state != 'done'):
-                # Downstream move should only be triggered if this move is the last pending upstream move
-                other_upstream_move_ids = self.search(cr, uid, [('id','!=',move.id),('state','not in',['done','cancel']),
-                                            ('move_dest_id','=',move.move_dest_id.id)], context=context)
-                if not other_upstream_move_ids:
-                    self.write(cr, uid, [move.id], {'move_history_ids': [(4, move.move_dest_id.id)]})
-                    if move.move_dest_id.state in ('waiting', 'confirmed'):
-                        self.force_assign(cr, uid, [move.move_dest_id.id], context=context)
-                        if move.move_dest_id.picking_id:
-                            wf_service.trg_write(uid, 'stock.picking', move.move_dest_id.picking_id.id, cr)
-                        if move.move_dest_id.auto_validate:
-                            self.action_done(cr, uid, [move.move_dest_id.id], context=context)
-
-            self._create_product_valuation_moves(cr, uid, move, context=context)
+        moves = [move for move in moves if move.state not in ['done','cancel']]
+        move_ids = [move.id for move in moves]
+        if not move_ids:
+            return True
+        picking_ids = set([move.picking_id.id for move in moves if move.picking_id])
+
+        # Downstream move should only be triggered if there is no more pending upstream move
+        dests = {}
+        for move in moves:
+            if move.move_dest_id.id:
+                dests.setdefault(move.move_dest_id.id, []).append(move.id)
+        waiting_dest_ids = self._pending_upstream_dest_ids(cr, uid, dests.keys(), move_ids)
+        released = [dest for dest in self.browse(cr, uid, dests.keys(), context=context) if dest.id not in waiting_dest_ids]
+        for dest in released:
+            self.write(cr, uid, dests[dest.id], {'move_history_ids': [(4, dest.id)]})
+        to_assign = [dest for dest in released if dest.state in ('waiting', 'confirmed')]
+        if to_assign:
+            self.force_assign(cr, uid, [dest.id for dest in to_assign], context=context)
+            for dest_picking_id in set([dest.picking_id.id for dest in to_assign if dest.picking_id]):
+                wf_service.trg_write(uid, 'stock.picking', dest_picking_id, cr)
+            auto_validate = [dest.id for dest in to_assign if dest.auto_validate]
+            if auto_validate:
+                self.action_done(cr, uid, auto_validate, context=context)
+
+        for move in moves:
+            if move.product_id.valuation == 'real_time':
+                self._create_product_valuation_moves(cr, uid, move, context=context)
             if move.state not in ('confirmed','done','assigned'):
                 todo.append(move.id)
 
@@ -261,8 +386,7 @@ class stock_move(osv.osv):
 
         #Just to update move Received Date
         self.write(cr, uid, move_ids, {'state': 'done', 'date': time.strftime(DEFAULT_SERVER_DATETIME_FORMAT),'received_date': time.strftime(DEFAULT_SERVER_DATETIME_FORMAT)}, context=context)
-        for id in move_ids:
-            wf_service.trg_trigger(uid, 'stock.move', id, cr)
+        self._trigger_moves(cr, uid, move_ids)
 
         for pick_id in picking_ids:
             wf_service.trg_write(uid, 'stock.picking', pick_id, cr)
@@ -334,6 +458,8 @@ class stock_move(osv.osv):
                                  'price_currency_id': product_currency,
                                 })
 
+        # split all partially processed moves at once, done quantity goes to the new moves
+        splits, remaining = [], {}
         for move in too_few:
             product_qty = move_product_qty[move.id]
             if product_qty != 0:
@@ -348,42 +474,47 @@ class stock_move(osv.osv):
                 prodlot_id = prodlot_ids[move.id]
                 if prodlot_id:
                     defaults.update(prodlot_id=prodlot_id)
-                new_move = self.copy(cr, uid, move.id, defaults)
-                complete.append(self.browse(cr, uid, new_move))
-            self.write(cr, uid, [move.id],
-                    {
+                splits.append((move.id, defaults))
+            remaining[move.id] = {
                         'product_qty': move.product_qty - product_qty,
                         'product_uos_qty': move.product_qty - product_qty,
                         'prodlot_id': False,
                         'tracking_id': False,
-                    })
-
-
-        for move in too_many:
-            self.write(cr, uid, [move.id],
-                    {
-                        'product_qty': move.product_qty,
-                        'product_uos_qty': move.product_qty,
-                    })
-            complete.append(move)
-
-        for move in complete:
-            if prodlot_ids.get(move.id):
-                self.write(cr, uid, [move.id],{'prodlot_id': prodlot_ids.get(move.id)})
-            self.action_done(cr, uid, [move.id], context=context)
-            if  move.picking_id.id :
+                    }
+        done_ids = [move.id for move in complete] + self.bulk_split(cr, uid, splits)
+        self._write_grouped(cr, uid, remaining)
+
+        self._write_grouped(cr, uid, dict([(move.id, {'prodlot_id': prodlot_ids[move.id]}) for move in complete
+                                           if prodlot_ids.get(move.id) and prodlot_ids[move.id] != move.prodlot_id.id]))
+        if done_ids:
+            self.action_done(cr, uid, done_ids, context=context)
+            picking_ids = list(set([move.picking_id.id for move in complete + too_few if move.picking_id]))
+            if picking_ids:
                 # TOCHECK : Done picking if all moves are done
                 cr.execute("""
-                    SELECT move.id FROM stock_picking pick
-                    RIGHT JOIN stock_move move ON move.picking_id = pick.id AND move.state = %s
-                    WHERE pick.id = %s""",
-                            ('done', move.picking_id.id))
-                res = cr.fetchall()
-                if len(res) == len(move.picking_id.move_lines):
-                    picking_obj.action_move(cr, uid, [move.picking_id.id])
-                    wf_service.trg_validate(uid, 'stock.picking', move.picking_id.id, 'button_done', cr)
+                    SELECT picking_id FROM stock_move
+                    WHERE picking_id IN %s
+                    GROUP BY picking_id
+                    HAVING bool_and(state = 'done')""", (tuple(picking_ids),))
+                for picking_id, in cr.fetchall():
+                    picking_obj.action_move(cr, uid, [picking_id])
+                    wf_service.trg_validate(uid, 'stock.picking', picking_id, 'button_done', cr)
+
+        return done_ids
 
-        return [move.id for move in complete]
+    def _write_grouped(self, cr, uid, vals_by_id, context=None):
+        """
+        -Process
+            -write records which get the same values with one write(),
+            -records with empty values are skipped.
+        """
+        groups = {}
+        for record_id, vals in vals_by_id.items():
+            if vals:
+                groups.setdefault(tuple(sorted(vals.items())), []).append(record_id)
+        for vals, record_ids in groups.items():
+            self.write(cr, uid, record_ids, dict(vals), context=context)
+        return True
 
 stock_move()
 
@@ -409,21 +540,24 @@ class stock_picking(osv.osv):
         return super(stock_picking, self).copy(cr, uid, id, default, context)
 
     def _get_picking(self, cr, uid, ids, context=None):
-        result = {}
-        for line in self.pool.get('stock.move').browse(cr, uid, ids, context=context):
-            result[line.picking_id.id] = True
-        return result.keys()
+        if not ids:
+            return []
+        cr.execute("SELECT DISTINCT picking_id FROM stock_move WHERE id IN %s AND picking_id IS NOT NULL", (tuple(ids),))
+        return [x[0] for x in cr.fetchall()]
 
     def _total_moves_to_store(self, cr, uid, ids, field_name, arg, context=None):
-        res = {}
-        for order in self.browse(cr, uid, ids, context=context):
-            res[order.id] = {
-                'total_moves_to_xloc': False,
-            }
-            if len(order.move_lines) and (len(order.move_lines) == len([x.id for x in order.move_lines if x.qc_completed])):
-                res[order.id] = {
-                    'total_moves_to_xloc': True,
-                }
+        """
+        -Process
+            -Picking is moved to x location when all of its moves are QC completed,
+             checked with one aggregate for all pickings
+        """
+        res = dict.fromkeys(ids, False)
+        if ids:
+            cr.execute("""  SELECT picking_id, bool_and(COALESCE(qc_completed, False))
+                            FROM stock_move
+                            WHERE picking_id IN %s
+                            GROUP BY picking_id """, (tuple(ids),))
+            res.update(dict(cr.fetchall()))
         return res
 
     _columns = {
@@ -499,6 +633,11 @@ class stock_picking(osv.osv):
         @param partial_datas : Dictionary containing details of partial picking
                           like partner_id, partner_id, delivery_date,
                           delivery moves with product_id, product_qty, uom
+        -Process
+            -all pickings are browsed at once and the split of every move is computed first,
+            -split moves of all pickings are created with one bulk_split(),
+            -moves getting same values are written together, unchanged values are not written,
+            -then workflow of each picking and its back order is run.
         @return: Dictionary of values
         """
         
@@ -513,33 +652,43 @@ class stock_picking(osv.osv):
         uom_obj = self.pool.get('product.uom')
         sequence_obj = self.pool.get('ir.sequence')
         wf_service = netsvc.LocalService("workflow")
-        for pick in self.browse(cr, uid, ids, context=context):
-            new_picking = None
-            complete, too_many, too_few = [], [], []
-            move_product_qty, prodlot_ids, product_avail, partial_qty, product_uoms = {}, {}, {}, {}, {}
+
+        pickings = self.browse(cr, uid, ids, context=context)
+        average_product_ids = set()
+        for pick in pickings:
+            if pick.type == 'in':
+                average_product_ids.update([move.product_id.id for move in pick.move_lines
+                                            if move.state not in ('done', 'cancel') and move.product_id.cost_method == 'average'])
+        products = dict([(product.id, product) for product in product_obj.browse(cr, uid, list(average_product_ids))])
+
+        plans = []
+        price_vals = {}
+        for pick in pickings:
+            plan = {'pick': pick, 'complete': [], 'too_few': [], 'move_product_qty': {}, 'prodlot_ids': {}, 'partial_qty': {}, 'product_uoms': {}}
+            product_avail = {}
             for move in pick.move_lines:
                 if move.state in ('done', 'cancel'):
                     continue
                 partial_data = partial_datas.get('move%s'%(move.id), {})
                 product_qty = partial_data.get('product_qty',0.0)
-                move_product_qty[move.id] = product_qty
+                plan['move_product_qty'][move.id] = product_qty
                 product_uom = partial_data.get('product_uom',False)
                 product_price = partial_data.get('product_price',0.0)
                 product_currency = partial_data.get('product_currency',False)
-                prodlot_id = partial_data.get('prodlot_id')
-                prodlot_ids[move.id] = prodlot_id
-                product_uoms[move.id] = product_uom
-                partial_qty[move.id] = uom_obj._compute_qty(cr, uid, product_uoms[move.id], product_qty, move.product_uom.id)
-                if move.product_qty == partial_qty[move.id]:
-                    complete.append(move)
-                elif move.product_qty > partial_qty[move.id]:
-                    too_few.append(move)
+                plan['prodlot_ids'][move.id] = partial_data.get('prodlot_id')
+                plan['product_uoms'][move.id] = product_uom
+                partial_qty = uom_obj._compute_qty(cr, uid, product_uom, product_qty, move.product_uom.id)
+                plan['partial_qty'][move.id] = partial_qty
+                if move.product_qty == partial_qty:
+                    plan['complete'].append(move)
+                elif move.product_qty > partial_qty:
+                    plan['too_few'].append(move)
                 else:
                     raise osv.except_osv(_('Over Limit!'), _('You cannot allow more then PO Qty.'))
 
                 # Average price computation
                 if (pick.type == 'in') and (move.product_id.cost_method == 'average'):
-                    product = product_obj.browse(cr, uid, move.product_id.id)
+                    product = products[move.product_id.id]
                     move_currency_id = move.company_id.currency_id.id
                     context['currency_id'] = move_currency_id
                     qty = uom_obj._compute_qty(cr, uid, product_uom, product_qty, product.uom_id.id)
@@ -566,28 +715,31 @@ class stock_picking(osv.osv):
 
                         # Record the values that were chosen in the wizard, so they can be
                         # used for inventory valuation if real-time valuation is enabled.
-                        move_obj.write(cr, uid, [move.id],
-                                {'price_unit': product_price,
-                                 'price_currency_id': product_currency})
+                        price_vals[move.id] = {'price_unit': product_price, 'price_currency_id': product_currency}
 
                         product_avail[product.id] += qty
+            plans.append(plan)
+        move_obj._write_grouped(cr, uid, price_vals)
 
+        # back orders are created first, then split moves of all pickings at once
+        splits, move_vals = [], {}
+        for plan in plans:
+            pick = plan['pick']
+            new_picking = None
+            if plan['too_few']:
+                new_picking_name = pick.name
+                plan['back_order_name'] = sequence_obj.get(cr, uid, 'stock.picking.%s'%(pick.type))
+                self.write(cr, uid, [pick.id], {'name': plan['back_order_name']})
+                new_picking = self.copy(cr, uid, pick.id,
+                        {
+                            'name': new_picking_name,
+                            'move_lines' : [],
+                            'state':'draft',
+                        })
+            plan['new_picking'] = new_picking
 
-
-            for move in too_few:
-                product_qty = move_product_qty[move.id]
-                if not new_picking:
-                    new_picking_name = pick.name
-                    self.write(cr, uid, [pick.id], 
-                               {'name': sequence_obj.get(cr, uid,
-                                            'stock.picking.%s'%(pick.type)),
-                               })
-                    new_picking = self.copy(cr, uid, pick.id,
-                            {
-                                'name': new_picking_name,
-                                'move_lines' : [],
-                                'state':'draft',
-                            })
+            for move in plan['too_few']:
+                product_qty = plan['move_product_qty'][move.id]
                 if product_qty != 0:
                     defaults = {
                             'product_qty' : product_qty,
@@ -596,41 +748,37 @@ class stock_picking(osv.osv):
                             'state': 'assigned',
                             'move_dest_id': False,
                             'price_unit': move.price_unit,
-                            'product_uom': product_uoms[move.id]
+                            'product_uom': plan['product_uoms'][move.id]
                     }
-                    prodlot_id = prodlot_ids[move.id]
+                    prodlot_id = plan['prodlot_ids'][move.id]
                     if prodlot_id:
                         defaults.update(prodlot_id=prodlot_id)
-                    move_obj.copy(cr, uid, move.id, defaults)
-                move_obj.write(cr, uid, [move.id],
-                        {
-                            'product_qty': move.product_qty - partial_qty[move.id],
-                            'product_uos_qty': move.product_qty - partial_qty[move.id], #TODO: put correct uos_qty
+                    splits.append((move.id, defaults))
+                move_vals[move.id] = {
+                            'product_qty': move.product_qty - plan['partial_qty'][move.id],
+                            'product_uos_qty': move.product_qty - plan['partial_qty'][move.id], #TODO: put correct uos_qty
                             'prodlot_id': False,
                             'tracking_id': False,
-                        })
+                        }
 
-            if new_picking:
-                move_obj.write(cr, uid, [c.id for c in complete], {'picking_id': new_picking})
-            for move in complete:
-                defaults = {'product_uom': product_uoms[move.id], 'product_qty': move_product_qty[move.id]}
-                if prodlot_ids.get(move.id):
-                    defaults.update({'prodlot_id': prodlot_ids[move.id]})
-                move_obj.write(cr, uid, [move.id], defaults)
-            for move in too_many:
-                product_qty = move_product_qty[move.id]
-                defaults = {
-                    'product_qty' : product_qty,
-                    'product_uos_qty': product_qty, #TODO: put correct uos_qty
-                    'product_uom': product_uoms[move.id]
-                }
-                prodlot_id = prodlot_ids.get(move.id)
-                if prodlot_ids.get(move.id):
-                    defaults.update(prodlot_id=prodlot_id)
+            for move in plan['complete']:
+                vals = {}
                 if new_picking:
-                    defaults.update(picking_id=new_picking)
-                move_obj.write(cr, uid, [move.id], defaults)
-
+                    vals['picking_id'] = new_picking
+                if plan['product_uoms'][move.id] != move.product_uom.id:
+                    vals['product_uom'] = plan['product_uoms'][move.id]
+                if plan['move_product_qty'][move.id] != move.product_qty:
+                    vals['product_qty'] = plan['move_product_qty'][move.id]
+                prodlot_id = plan['prodlot_ids'].get(move.id)
+                if prodlot_id and prodlot_id != move.prodlot_id.id:
+                    vals['prodlot_id'] = prodlot_id
+                move_vals[move.id] = vals
+        move_obj.bulk_split(cr, uid, splits)
+        move_obj._write_grouped(cr, uid, move_vals)
+
+        for plan in plans:
+            pick = plan['pick']
+            new_picking = plan['new_picking']
             # At first we confirm the new picking (if necessary)
             if new_picking:
                 wf_service.trg_validate(uid, 'stock.picking', new_picking, 'button_confirm', cr)
@@ -639,16 +787,12 @@ class stock_picking(osv.osv):
                 self.action_move(cr, uid, [new_picking], context=context)
                 wf_service.trg_validate(uid, 'stock.picking', new_picking, 'button_done', cr)
                 wf_service.trg_write(uid, 'stock.picking', pick.id, cr)
-                delivered_pack_id = pick.id
-                back_order_name = self.browse(cr, uid, delivered_pack_id, context=context).name
-                self.message_post(cr, uid, new_picking, body=_("Back order <em>%s</em> has been <b>created</b>.") % (back_order_name), context=context)
+                self.message_post(cr, uid, new_picking, body=_("Back order <em>%s</em> has been <b>created</b>.") % (plan['back_order_name']), context=context)
             else:
                 self.action_move(cr, uid, [pick.id], context=context)
                 wf_service.trg_validate(uid, 'stock.picking', pick.id, 'button_done', cr)
-                delivered_pack_id = pick.id
 
-            delivered_pack = self.browse(cr, uid, delivered_pack_id, context=context)
-            res[pick.id] = {'delivered_picking': delivered_pack.id or False}
+            res[pick.id] = {'delivered_picking': pick.id}
 
         return res
 
@@ -697,23 +841,8 @@ class stock_picking_in(osv.osv):
                    }
         return super(stock_picking_in, self).copy(cr, uid, id, default, context)
 
-    def _get_picking(self, cr, uid, ids, context=None):
-        result = {}
-        for line in self.pool.get('stock.move').browse(cr, uid, ids, context=context):
-            result[line.picking_id.id] = True
-        return result.keys()
-
     def _total_moves_to_store(self, cr, uid, ids, field_name, arg, context=None):
-        res = {}
-        for order in self.browse(cr, uid, ids, context=context):
-            res[order.id] = {
-                'total_moves_to_xloc': False,
-            }
-            if len(order.move_lines) and (len(order.move_lines) == len([x.id for x in order.move_lines if x.qc_completed])):
-                res[order.id] = {
-                    'total_moves_to_xloc': True,
-                }
-        return res
+        return self.pool.get('stock.picking')._total_moves_to_store(cr, uid, ids, field_name, arg, context=context)
 
     _columns = {
         'pass_to_qc': fields.boolean('QC Test?'),
@@ -726,8 +855,8 @@ class stock_picking_in(osv.osv):
         'move_loc_id': fields.many2one('stock.location', 'Destination Location', readonly=True),
         'total_moves_to_xloc': fields.function(_total_moves_to_store, digits_compute=dp.get_precision('Account'), string='Total qty moves to x location?', type="boolean",
             store={
-                'stock.picking': (lambda self, cr, uid, ids, c={}: ids, ['move_lines'], 10),
-                'stock.move': (_get_picking, ['qc_completed'], 10),
+                # moves are handled by the trigger of stock.picking, both models share the same column
+                'stock.picking.in': (lambda self, cr, uid, ids, c={}: ids, ['move_lines'], 10),
             },
             ),
         
@@ -39,4 +39,5 @@ import mrp_partially_close
 import costing_analysis_report
 import mrp_product_produce
 import qc2reject
+import production_moves_to_workcenter
 # vim:expandtab:smartindent:tabstop=4:softtabstop=4:shiftwidth=4:
\ No newline at end of file
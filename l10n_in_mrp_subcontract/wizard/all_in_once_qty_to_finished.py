@@ -19,7 +19,7 @@
 #
 ##############################################################################
 import time
-import openerp.netsvc
+from openerp import netsvc
 
 from openerp.osv import fields, osv
 import openerp.addons.decimal_precision as dp
@@ -99,35 +99,17 @@ class all_in_once_qty_to_finished(osv.osv_memory):
             - True
         """
         process_move = self.pool.get('stock.moves.workorder')
-        prod_obj =  self.pool.get('mrp.production')
         current_wrkorder_line_id = context and context.get('active_id', False) or False
         wizard_rec = self.browse(cr, uid, ids[0])
         go_to_finished = []
-        updt_prcs_mve = {}
         for data in wizard_rec.all_process_moves_ids:
             go_to_finished.append(data.process_move_id.id)
             #all line first in draft stage to in_progress state
             if data.state == 'draft':
                 data.process_move_id.button_to_start(context=context)
-            #update that current moves
-            updt_prcs_mve.update({
-                                  data.process_move_id.id:{
-                                                           'state':'finished', 
-                                                           #'end_date':time.strftime(DEFAULT_SERVER_DATETIME_FORMAT),
-                                                           'accepted_qty': data.total_qty + data.accepted_qty,
-                                                           'process_qty':0.0
-                                                           }})
 
-        #all current moves finished at once
-        for key,value in updt_prcs_mve.items():
-            process_move.write(cr, uid ,key, value)
-
-        #create new process moves into next work-order
-        if wizard_rec.next_stage_workorder_id:
-            for data in wizard_rec.all_process_moves_ids:
-                res = prod_obj._create_process_dict(cr, uid, data.process_move_id.move_id, wizard_rec.next_stage_workorder_id.id)
-                res.update({'total_qty':data.total_qty})
-                process_move.create(cr, uid, res, context=context)
+        #all current moves finished at once, with new process moves into next work-order
+        process_move.advance_to_next_stage(cr, uid, go_to_finished, next_workorder_id=wizard_rec.next_stage_workorder_id.id, context=context)
 
         #Work-Order done process
         wf_service = netsvc.LocalService("workflow")
@@ -69,63 +69,68 @@ class costing_analysis_report(osv.osv_memory):
             return user_datetime.strftime(DEFAULT_SERVER_DATETIME_FORMAT)
         return user_date.strftime(DEFAULT_SERVER_DATETIME_FORMAT)
 
-    def _make_query_result(self, cr , uid, data, context=None):
+    def _make_query_criteria(self, cr, uid, data, context=None):
         """
         Process
-            -To make Query According to Datewise,Number Wise. 
+            -To make Query criteria According to Datewise,Number Wise.
+        Return
+            -WHERE clause on mrp_production (mp) and its parameters
         """
-        search_criterea = ''
+        where, params = [], []
         #Date Wise Bifurcation
         if data.type == 'date':
-            start = data.start_date
-            end = data.end_date
-            if start and end:
-                start = self.date_to_datetime(cr, uid, start + ' 00:00:00', context=context)
-                end = self.date_to_datetime(cr, uid, end + ' 23:59:59', context=context)
-                search_criterea += " AND mp.date_planned > '" + str(start) + "' AND mp.date_finished < '" + str(end) + "' "
-            elif start:
-                start = self.date_to_datetime(cr, uid, start + ' 00:00:00', context=context)
-                search_criterea += " AND mp.date_planned > '" + str(start) + "' "
-            elif end:
-                end = self.date_to_datetime(cr, uid, end + ' 23:59:59', context=context)
-                search_criterea += " AND mp.date_finished < '" + str(end) + "' "
+            if data.start_date:
+                where.append('mp.date_planned > %s')
+                params.append(self.date_to_datetime(cr, uid, data.start_date + ' 00:00:00', context=context))
+            if data.end_date:
+                where.append('mp.date_finished < %s')
+                params.append(self.date_to_datetime(cr, uid, data.end_date + ' 23:59:59', context=context))
         else:
             #Number Wise Bifurcation
             number_from = data.number_from
             number_to = data.number_to
             if number_from <= 0 or number_to <= 0:
                 raise osv.except_osv(_('Warning!'), _('Negative or Zero number  not allow to pass!'))
-            if number_from > 0 and number_to > 0:
-                if number_from > number_to:
-                    raise osv.except_osv(_('Warning!'), _('Please correct the number place.\nNumber To must be greater then Number From.'))
-            count, comma =  0, True
-            if number_from == number_to:
-                comma = False
-            for r in range(number_from, number_to + 1):
-                count += 1
-                if count == 1: search_criterea += " AND mp.name SIMILAR TO '%("
-                search_criterea += str(r)
-                if comma and (r <> number_to): search_criterea += '|'
-                if r == number_to: search_criterea += ")%'"
+            if number_from > number_to:
+                raise osv.except_osv(_('Warning!'), _('Please correct the number place.\nNumber To must be greater then Number From.'))
+            where.append('mp.order_number BETWEEN %s AND %s')
+            params.extend([number_from, number_to])
         #State Wise Bifurcation
-        if data.draft or data.in_production or data.ready or data.done or data.cancel or data.confirmed or data.picking_except:
-            if not search_criterea: search_criterea += ' AND mp.state in ('
-            else:
-                search_criterea += ' AND mp.state in ('
-            j_s = ''
-            if data.draft: j_s += "'draft',"
-            if data.in_production: j_s += "'in_production',"
-            if data.ready: j_s += "'ready',"
-            if data.done: j_s += "'done',"
-            if data.cancel: j_s += "'cancel',"
-            if data.confirmed: j_s += "'confirmed',"
-            if data.picking_except: j_s += "'picking_except',"
-            search_criterea += j_s[:-1]+')'
-        if search_criterea: search_criterea = ' WHERE  mpwl.production_id = mp.id ' + search_criterea
-        #Merged this query criterea for execution
-        cr.execute(""" SELECT mpwl.id FROM mrp_production mp, mrp_production_workcenter_line mpwl """+ search_criterea)
+        states = [state for state in ('draft', 'in_production', 'ready', 'done', 'cancel', 'confirmed', 'picking_except') if data[state]]
+        if states:
+            where.append('mp.state IN %s')
+            params.append(tuple(states))
+        return where and ' WHERE ' + ' AND '.join(where) or '', params
+
+    def _make_query_result(self, cr , uid, data, context=None):
+        """
+        Process
+            -To find workorders According to Datewise,Number Wise.
+        """
+        where, params = self._make_query_criteria(cr, uid, data, context=context)
+        cr.execute(""" SELECT mpwl.id FROM mrp_production mp
+                        JOIN mrp_production_workcenter_line mpwl ON (mpwl.production_id = mp.id) """ + where, params)
         return [r[0] for r in cr.fetchall()]
 
+    def _make_report_lines(self, cr, uid, data, context=None):
+        """
+        Process
+            -Planned Time,Actual Time,Planning cost,Actual cost summed per production order in one query
+        """
+        where, params = self._make_query_criteria(cr, uid, data, context=context)
+        cr.execute(""" DELETE FROM costing_analysis_report_line WHERE wizard_id = %s """, (data.id,))
+        cr.execute(""" INSERT INTO costing_analysis_report_line
+                        (wizard_id, production_id, planned_hour, actual_hour, planned_cost, actual_cost,
+                         create_uid, create_date, write_uid, write_date)
+                        SELECT %s, mp.id,
+                            SUM(COALESCE(mpwl.hour, 0.0)), SUM(COALESCE(mpwl.delay, 0.0)),
+                            SUM(COALESCE(mpwl.wo_planned_cost, 0.0)), SUM(COALESCE(mpwl.wo_actual_cost, 0.0)),
+                            %s, (now() at time zone 'UTC'), %s, (now() at time zone 'UTC')
+                        FROM mrp_production mp
+                        JOIN mrp_production_workcenter_line mpwl ON (mpwl.production_id = mp.id) """ + where + """
+                        GROUP BY mp.id """, [data.id, uid, uid] + params)
+        return True
+
     def open_workorders(self, cr, uid, ids, context=None):
         """
         process
@@ -139,16 +144,51 @@ class costing_analysis_report(osv.osv_memory):
         context = context or {}
         models_data = self.pool.get('ir.model.data')
         data = self.browse(cr, uid, ids[0])
-        wo_ids = self._make_query_result(cr, uid, data, context=context)
+        self._make_report_lines(cr, uid, data, context=context)
 
-        # Get workorder views
-        dummy, form_view = models_data.get_object_reference(cr, uid, 'l10n_in_mrp_subcontract', 'mrp_production_workcenter_form_cost_report')
-        dummy, tree_view = models_data.get_object_reference(cr, uid, 'l10n_in_mrp_subcontract', 'mrp_production_workcenter_tree_view_cost_report')
+        # Get report line view
+        dummy, tree_view = models_data.get_object_reference(cr, uid, 'l10n_in_mrp_subcontract', 'view_costing_analysis_report_line_tree')
+
+        return {
+            'domain': [('wizard_id', '=', data.id)],
+            'name': _('WorkOrder Cost Analysis'),
+            'view_type': 'form',
+            'view_mode': 'tree',
+            'context':context,
+            'res_model': 'costing.analysis.report.line',
+            'views': [(tree_view or False, 'tree')],
+            'type': 'ir.actions.act_window',
+        }
+
+costing_analysis_report()
 
-        context.update({'group_by':'production_id'})
+class costing_analysis_report_line(osv.osv_memory):
+    _name = "costing.analysis.report.line"
+    _description = "Costing Analysis per Production Order"
+    _order = "production_id desc"
+    _columns = {
+        'wizard_id': fields.many2one('costing.analysis.report', 'Costing Analysis', ondelete='cascade'),
+        'production_id': fields.many2one('mrp.production', 'Production Order', readonly=True),
+        'product_id': fields.related('production_id', 'product_id', type='many2one', relation='product.product', string='Finish Product', readonly=True),
+        'currency_id': fields.related('production_id', 'currency_id', type='many2one', relation='res.currency', string='Currency', readonly=True),
+        'planned_hour': fields.float('Planned Time(HH:MM)', readonly=True),
+        'actual_hour': fields.float('Actual Time(HH:MM)', readonly=True),
+        'planned_cost': fields.float('Planned Cost', readonly=True),
+        'actual_cost': fields.float('Actual Cost', readonly=True),
+    }
 
+    def open_workorders(self, cr, uid, ids, context=None):
+        """
+        process
+            -Open work-orders of production order of the analysis line
+        """
+        context = context or {}
+        models_data = self.pool.get('ir.model.data')
+        line = self.browse(cr, uid, ids[0], context=context)
+        dummy, form_view = models_data.get_object_reference(cr, uid, 'l10n_in_mrp_subcontract', 'mrp_production_workcenter_form_cost_report')
+        dummy, tree_view = models_data.get_object_reference(cr, uid, 'l10n_in_mrp_subcontract', 'mrp_production_workcenter_tree_view_cost_report')
         return {
-            'domain': "[('id','in',["+','.join(map(str, wo_ids))+"])]",
+            'domain': [('production_id', '=', line.production_id.id)],
             'name': _('WorkOrder Cost Analysis'),
             'view_type': 'form',
             'view_mode': 'form',
@@ -158,6 +198,6 @@ class costing_analysis_report(osv.osv_memory):
             'type': 'ir.actions.act_window',
         }
 
-costing_analysis_report()
+costing_analysis_report_line()
 
 # vim:expandtab:smartindent:tabstop=4:softtabstop=4:shiftwidth=4:
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+#    OpenERP, Open Source Management Solution
+#    Copyright (C) 2004-2010 Tiny SPRL (<http://tiny.be>).
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as
+#    published by the Free Software Foundation, either version 3 of the
+#    License, or (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+##############################################################################
+
+from openerp.osv import fields, osv
+from openerp.tools.translate import _
+from openerp import tools
+
+class production_moves_to_workcenter_line(osv.osv_memory):
+    _name = "production.moves.to.workcenter.line"
+    _description = "Move Raw Materials To Work-Center Result"
+    _columns = {
+        'wizard_id': fields.many2one('production.moves.to.workcenter', 'Wizard', ondelete='cascade'),
+        'production_id': fields.many2one('mrp.production', 'Production Order', readonly=True),
+        'state': fields.selection([('done', 'Moved'), ('failed', 'Failed')], 'Status', readonly=True),
+        'message': fields.char('Message', size=256, readonly=True),
+    }
+production_moves_to_workcenter_line()
+
+class production_moves_to_workcenter(osv.osv_memory):
+    _name = "production.moves.to.workcenter"
+    _description = "Move Raw Materials Of Many Production Orders To Work-Center"
+
+    def default_get(self, cr, uid, fields, context=None):
+        """
+        Process
+            -Set selected production orders
+        """
+        context = context or {}
+        res = super(production_moves_to_workcenter, self).default_get(cr, uid, fields, context=context)
+        if 'production_ids' in fields and context.get('active_model') == 'mrp.production':
+            res.update({'production_ids': [(6, 0, context.get('active_ids', []))]})
+        return res
+
+    _columns = {
+        'production_ids': fields.many2many('mrp.production', 'production_moves_to_workcenter_rel', 'wizard_id', 'production_id', 'Production Orders'),
+        'chunk_size': fields.integer('Orders per Commit', help="Commit after this number of orders, 0 processes all orders in one transaction."),
+        'result_ids': fields.one2many('production.moves.to.workcenter.line', 'wizard_id', 'Result', readonly=True),
+        'state': fields.selection([('draft', 'Draft'), ('done', 'Done')], 'Status', readonly=True),
+    }
+
+    _defaults = {
+        'chunk_size': 0,
+        'state': 'draft',
+    }
+
+    def move_to_workcenter(self, cr, uid, ids, context=None):
+        """
+        Process
+            -Validate all production orders in one pass,
+            -Move raw materials of valid orders to work-center per chunk,
+             a failing chunk is rolled back alone and reported,
+            -Commit after each chunk when chunk size is given.
+        Return
+            -Same wizard with result per production order
+        """
+        context = context or {}
+        production_obj = self.pool.get('mrp.production')
+        result_obj = self.pool.get('production.moves.to.workcenter.line')
+        wizard_rec = self.browse(cr, uid, ids[0], context=context)
+
+        results = []
+        valid = []
+        for production in wizard_rec.production_ids:
+            message = production_obj._check_moves_to_workcenter(cr, uid, production, context=context)
+            if message:
+                results.append((production.id, 'failed', message))
+            else:
+                valid.append(production)
+
+        chunk_size = wizard_rec.chunk_size > 0 and wizard_rec.chunk_size or len(valid)
+        for pos in xrange(0, len(valid), chunk_size or 1):
+            chunk = valid[pos:pos + chunk_size]
+            cr.execute('SAVEPOINT production_moves_to_workcenter')
+            try:
+                production_obj._moves_to_workcenter(cr, uid, chunk, context=context)
+            except Exception, e:
+                cr.execute('ROLLBACK TO SAVEPOINT production_moves_to_workcenter')
+                message = isinstance(e, osv.except_osv) and e.value or tools.ustr(e)
+                results.extend([(production.id, 'failed', message[:256]) for production in chunk])
+                continue
+            cr.execute('RELEASE SAVEPOINT production_moves_to_workcenter')
+            results.extend([(production.id, 'done', '') for production in chunk])
+            if wizard_rec.chunk_size > 0:
+                cr.commit()
+
+        for production_id, state, message in results:
+            result_obj.create(cr, uid, {
+                'wizard_id': wizard_rec.id,
+                'production_id': production_id,
+                'state': state,
+                'message': message,
+            }, context=context)
+        self.write(cr, uid, ids, {'state': 'done'}, context=context)
+
+        return {
+            'name': _('Move Raw Materials To Work-Center'),
+            'view_type': 'form',
+            'view_mode': 'form',
+            'res_model': 'production.moves.to.workcenter',
+            'res_id': wizard_rec.id,
+            'context': context,
+            'type': 'ir.actions.act_window',
+            'target': 'new',
+        }
+
+production_moves_to_workcenter()
+
+# vim:expandtab:smartindent:tabstop=4:softtabstop=4:shiftwidth=4:
@@ -98,22 +98,7 @@ class stock_return_picking(osv.osv_memory):
          @param context: A standard dictionary
          @return: A dictionary which of values.
         """
-        pick_obj = self.pool.get('stock.picking')
-        pick = pick_obj.browse(cr, uid, pick_id, context=context)
-        return_history = {}
-        for m  in pick.move_lines:
-            if m.state == 'done':
-                return_history[m.id] = 0
-                for rec in m.move_history_ids2:
-                    if rec.state == 'cancel': continue
-                    # only take into account 'product return' moves, ignoring any other
-                    # kind of upstream moves, such as internal procurements, etc.
-                    # a valid return move will be the exact opposite of ours:
-                    #     (src location, dest location) <=> (dest location, src location))
-                    if rec.location_dest_id.id == m.location_id.id \
-                        and rec.location_id.id == m.location_dest_id.id:
-                        return_history[m.id] += (rec.product_qty * rec.product_uom.factor)
-        return return_history
+        return self.pool.get('stock.move').get_return_history(cr, uid, pick_id, context=context)
 
     def create_returns(self, cr, uid, ids, context=None):
         """ 
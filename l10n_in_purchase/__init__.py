@@ -22,3 +22,4 @@
 import l10n_in_purchase
 import l10n_in_account
 import report
+import wizard
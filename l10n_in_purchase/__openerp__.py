@@ -54,6 +54,7 @@ It also prints reports of Purchase orders and Supplier Invoices with Freight/Pac
         'l10n_in_purchase_view.xml',
         'l10n_in_account_view.xml',
         'purchase_report.xml',
+        'wizard/purchase_invoice_batch_view.xml',
     ],
 
     'demo': [],
@@ -21,6 +21,7 @@
 from openerp.osv import fields, osv
 from openerp import netsvc
 import openerp.addons.decimal_precision as dp
+from openerp.addons.l10n_in_base.orm_bulk import bulk_insert
 
 class account_invoice(osv.osv):
     _inherit = 'account.invoice'
@@ -89,4 +90,18 @@ class account_invoice(osv.osv):
             },
             multi='all'),
     }
-account_invoice()
\ No newline at end of file
+account_invoice()
+
+class account_invoice_line(osv.osv):
+    _inherit = 'account.invoice.line'
+
+    def bulk_create(self, cr, uid, vals_list, context=None):
+        """
+        -Process
+            -Insert invoice lines with one statement, see bulk_insert() of l10n_in_base.
+        -Return
+            -ids of created lines, in order of vals_list
+        """
+        return bulk_insert(self, cr, uid, vals_list, context=context)
+
+account_invoice_line()
@@ -22,6 +22,7 @@ from openerp import netsvc
 from openerp.osv import fields, osv
 from openerp.tools.translate import _
 import openerp.addons.decimal_precision as dp
+from openerp.addons.l10n_in_base.orm_bulk import insert_m2m_rows
 
 class purchase_order(osv.Model):
     _inherit = 'purchase.order'
@@ -49,70 +50,125 @@ class purchase_order(osv.Model):
         }
         return res
     
-    def action_invoice_create(self, cr, uid, ids, context=None):
-        """Generates invoice for given ids of purchase orders and links that invoice ID to purchase order.
-        :param ids: list of ids of purchase orders.
-        :return: ID of created invoice.
-        :rtype: int
+    def _prepare_invoice_vals(self, cr, uid, order, pay_acc_id, journal_id, context=None):
+        """Collects invoice values of purchase order, invoice lines are linked later
+        :param browse_record order: Purchase order browse record
+        :return: Value for fields of invoice.
+        :rtype: dict
         """
-        if context is None:
-            context = {}
-        journal_obj = self.pool.get('account.journal')
-        inv_obj = self.pool.get('account.invoice')
-        inv_line_obj = self.pool.get('account.invoice.line')
+        return {
+            'name': order.partner_ref or order.name,
+            'reference': order.partner_ref or order.name,
+            'account_id': pay_acc_id,
+            'type': 'in_invoice',
+            'partner_id': order.partner_id.id,
+            'currency_id': order.pricelist_id.currency_id.id,
+            'journal_id': journal_id,
+            'origin': order.name,
+            'fiscal_position': order.fiscal_position.id or False,
+            'payment_term': order.payment_term_id.id or False,
+            'company_id': order.company_id.id,
+            'package_and_forwording':order.amount_package_and_forwording,
+            'freight':order.amount_freight,
+            'insurance':order.amount_insurance,
+            'round_off':order.round_off
+        }
 
-        res = False
+    def _po_line_invoice_vals(self, cr, uid, context=None):
+        """Values written on purchase order lines once invoiced"""
+        return {'invoiced': True}
+
+    def _invoice_groups(self, cr, uid, ids, context=None):
+        """
+        -Process
+            -Browse orders once, in company of each order,
+            -Find purchase journal once per company
+        -Return
+            -{(partner_id, journal_id, currency_id): [orders]}
+        """
+        journal_obj = self.pool.get('account.journal')
         uid_company_id = self.pool.get('res.users').browse(cr, uid, uid, context=context).company_id.id
+        journals = {}
+        groups = {}
         for order in self.browse(cr, uid, ids, context=context):
-            context.pop('force_company', None)
             if order.company_id.id != uid_company_id:
                 #if the company of the document is different than the current user company, force the company in the context
                 #then re-do a browse to read the property fields for the good company.
-                context['force_company'] = order.company_id.id
-                order = self.browse(cr, uid, order.id, context=context)
-            pay_acc_id = order.partner_id.property_account_payable.id
-            journal_ids = journal_obj.search(cr, uid, [('type', '=', 'purchase'), ('company_id', '=', order.company_id.id)], limit=1)
-            if not journal_ids:
-                raise osv.except_osv(_('Error!'),
-                    _('Define purchase journal for this company: "%s" (id:%d).') % (order.company_id.name, order.company_id.id))
-
-            # generate invoice line correspond to PO line and link that to created invoice (inv_id) and PO line
-            inv_lines = []
-            for po_line in order.order_line:
-                acc_id = self._choose_account_from_po_line(cr, uid, po_line, context=context)
-                inv_line_data = self._prepare_inv_line(cr, uid, acc_id, po_line, context=context)
-                inv_line_id = inv_line_obj.create(cr, uid, inv_line_data, context=context)
-                inv_lines.append(inv_line_id)
-
-                po_line.write({'invoiced': True, 'invoice_lines': [(4, inv_line_id)]}, context=context)
-
-            # get invoice data and create invoice
-            inv_data = {
-                'name': order.partner_ref or order.name,
-                'reference': order.partner_ref or order.name,
-                'account_id': pay_acc_id,
-                'type': 'in_invoice',
-                'partner_id': order.partner_id.id,
-                'currency_id': order.pricelist_id.currency_id.id,
-                'journal_id': len(journal_ids) and journal_ids[0] or False,
-                'invoice_line': [(6, 0, inv_lines)],
-                'origin': order.name,
-                'fiscal_position': order.fiscal_position.id or False,
-                'payment_term': order.payment_term_id.id or False,
-                'company_id': order.company_id.id,
-                'package_and_forwording':order.amount_package_and_forwording,
-                'freight':order.amount_freight,
-                'insurance':order.amount_insurance,
-                'round_off':order.round_off
-            }
-            inv_id = inv_obj.create(cr, uid, inv_data, context=context)
+                order = self.browse(cr, uid, order.id, context=dict(context, force_company=order.company_id.id))
+            company_id = order.company_id.id
+            if company_id not in journals:
+                journal_ids = journal_obj.search(cr, uid, [('type', '=', 'purchase'), ('company_id', '=', company_id)], limit=1)
+                if not journal_ids:
+                    raise osv.except_osv(_('Error!'),
+                        _('Define purchase journal for this company: "%s" (id:%d).') % (order.company_id.name, order.company_id.id))
+                journals[company_id] = journal_ids[0]
+            key = (order.partner_id.id, journals[company_id], order.pricelist_id.currency_id.id)
+            groups.setdefault(key, []).append(order)
+        return groups
 
-            # compute the invoice
-            inv_obj.button_compute(cr, uid, [inv_id], context=context, set_total=True)
+    def _invoice_create_batch(self, cr, uid, ids, context=None):
+        """
+        -Process
+            -Group orders by partner, journal and currency,
+            -Choose expense account once per product and fiscal position,
+            -Create one invoice per order, insert lines of all invoices of a group at once,
+            -Compute taxes of all invoices of a group in one call, lines having same taxes
+             share the cached tax plan of account.tax.
+        -Return
+            -{order_id: invoice_id}
+        """
+        context = dict(context or {})
+        context.pop('force_company', None)
+        inv_obj = self.pool.get('account.invoice')
+        inv_line_obj = self.pool.get('account.invoice.line')
+        po_line_obj = self.pool.get('purchase.order.line')
 
-            # Link this new invoice to related purchase order
-            order.write({'invoice_ids': [(4, inv_id)]}, context=context)
-            res = inv_id
+        res = {}
+        accounts = {}
+        for (partner_id, journal_id, currency_id), orders in self._invoice_groups(cr, uid, ids, context=context).items():
+            pay_acc_id = orders[0].partner_id.property_account_payable.id
+            inv_ids = []
+            line_vals = []
+            po_line_ids = []
+            for order in orders:
+                inv_vals = self._prepare_invoice_vals(cr, uid, order, pay_acc_id, journal_id, context=context)
+                inv_id = inv_obj.create(cr, uid, inv_vals, context=order._context)
+                inv_ids.append(inv_id)
+                res[order.id] = inv_id
+                # generate invoice line correspond to PO line and link that to created invoice (inv_id) and PO line
+                for po_line in order.order_line:
+                    acc_key = (order.company_id.id, po_line.product_id.id, order.fiscal_position.id)
+                    if acc_key not in accounts:
+                        accounts[acc_key] = self._choose_account_from_po_line(cr, uid, po_line, context=order._context)
+                    inv_line_data = self._prepare_inv_line(cr, uid, accounts[acc_key], po_line, context=context)
+                    inv_line_data['invoice_id'] = inv_id
+                    line_vals.append(inv_line_data)
+                    po_line_ids.append(po_line.id)
+
+            inv_line_ids = inv_line_obj.bulk_create(cr, uid, line_vals, context=context)
+            insert_m2m_rows(cr, po_line_obj, 'invoice_lines', zip(po_line_ids, inv_line_ids))
+            po_line_vals = self._po_line_invoice_vals(cr, uid, context=context)
+            if po_line_vals and po_line_ids:
+                po_line_obj.write(cr, uid, po_line_ids, po_line_vals, context=context)
+
+            # compute the invoices
+            inv_obj.button_compute(cr, uid, inv_ids, context=context, set_total=True)
+
+            # Link new invoices to related purchase orders, write() also triggers order workflow
+            for order in orders:
+                self.write(cr, uid, [order.id], {'invoice_ids': [(4, res[order.id])]}, context=context)
+        return res
+
+    def action_invoice_create(self, cr, uid, ids, context=None):
+        """Generates invoice for given ids of purchase orders and links that invoice ID to purchase order.
+        :param ids: list of ids of purchase orders.
+        :return: ID of created invoice.
+        :rtype: int
+        """
+        invoices = self._invoice_create_batch(cr, uid, ids, context=context)
+        res = False
+        for order_id in ids:
+            res = invoices.get(order_id, res)
         return res
     
     def _get_order(self, cr, uid, ids, context=None):
@@ -121,13 +177,35 @@ class purchase_order(osv.Model):
             result[line.order_id.id] = True
         return result.keys()
     
+    def _has_included_charges(self, order):
+        for charge_type, amount in ((order.package_and_forwording_type, order.package_and_forwording),
+                                    (order.freight_type, order.freight),
+                                    (order.insurance_type, order.insurance)):
+            if charge_type == 'include' and amount:
+                return True
+        return False
+
+    #: quantity column of order lines that per unit charges apply to
+    _line_qty_column = 'product_qty'
+
     def _amount_all(self, cr, uid, ids, field_name, arg, context=None):
+        """
+        -Process
+            -Sum stored line contributions of all orders in one query, the tax of
+             lines already has charges included in price allocated.
+        """
         cur_obj=self.pool.get('res.currency')
-        tax_obj = self.pool.get('account.tax')
-        
+
         res = {}
-        untax_amount = 0
-        
+        line_totals = {}
+        if ids:
+            cr.execute("""  SELECT order_id, SUM(line_untaxed), SUM(line_tax), SUM(""" + self._line_qty_column + """)
+                            FROM purchase_order_line
+                            WHERE order_id IN %s
+                            GROUP BY order_id """, (tuple(ids),))
+            for order_id, untax_amount, tax_total, qty in cr.fetchall():
+                line_totals[order_id] = (untax_amount or 0.0, tax_total or 0.0, qty or 0.0)
+
         for order in self.browse(cr, uid, ids, context=context):
             res[order.id] = {
                 'amount_untaxed': 0.0,
@@ -135,42 +213,18 @@ class purchase_order(osv.Model):
                 'amount_total': 0.0,
                 'other_charges':0.0,
             }
-            order_total = val = val1 = tax_total = other_charges = included_price = 0.0
+            other_charges = included_price = 0.0
             cur = order.pricelist_id.currency_id
-            
-            for line in order.order_line:
-                order_total += line.price_subtotal
 
-            for line in order.order_line:
-                price = line.price_unit * (1 - (line.discount or 0.0) / 100.0)
-                val1 += (price * line.product_qty)
-                untax_amount += line.price_subtotal
-                
-                if order.package_and_forwording_type == 'per_unit' and order.package_and_forwording:
-                    other_charges += (order.package_and_forwording * line.product_qty)
-                
-                if order.freight_type == 'per_unit' and order.freight:
-                    other_charges += (order.freight * line.product_qty)
-                
-                if order_total > 0:
-                    #Add fixed amount to order included in price
-                    pre_line = round((price * 100) / order_total,2)
-                    line_part = 0.0
-                    if order.package_and_forwording_type == 'include' and order.package_and_forwording:
-                        line_part = order.package_and_forwording * (pre_line / 100)
-                        price -= line_part
-                        
-                    if order.freight_type == 'include' and order.freight:
-                        line_part = order.freight  * (pre_line / 100)
-                        price -= line_part
-                        
-                    if order.insurance_type == 'include' and order.insurance:
-                        line_part = order.insurance  * (pre_line / 100)
-                        price -= line_part
-
-                taxes = tax_obj.compute_all(cr, uid, line.taxes_id, price, line.product_qty, line.product_id, line.order_id.partner_id)
-                tax_total += taxes.get('total_included', 0.0) - taxes.get('total', 0.0)
-            
+            untax_amount, tax_total, qty = line_totals.get(order.id, (0.0, 0.0, 0.0))
+            order_total = untax_amount
+
+            if order.package_and_forwording_type == 'per_unit' and order.package_and_forwording:
+                other_charges += (order.package_and_forwording * qty)
+
+            if order.freight_type == 'per_unit' and order.freight:
+                other_charges += (order.freight * qty)
+
             #Add fixed amount to order included in price
             if order.package_and_forwording_type == 'include' and order.package_and_forwording:
                 included_price += order.package_and_forwording
@@ -359,9 +413,111 @@ class purchase_order_line(osv.Model):
             res[line.id] = cur_obj.round(cr, uid, cur, taxes['total'])
         return res
 
+    def _line_price_qty(self, line):
+        """
+        -Return
+            -(price unit, quantity) of line that its subtotal and taxes are computed on
+        """
+        return line.price_unit, line.product_qty
+
+    def _line_breakdown(self, cr, uid, ids, field_names, arg, context=None):
+        """
+        -Process
+            -Stored contribution of line into totals of its order, so order totals
+             are a sum of lines and a line change only recomputes that line,
+            -Old orders having charges included in price allocate them on each line
+             before computing its taxes, in proportion of the line price to the order total.
+        """
+        res = {}
+        cur_obj=self.pool.get('res.currency')
+        tax_obj = self.pool.get('account.tax')
+        order_obj = self.pool.get('purchase.order')
+
+        lines = self.browse(cr, uid, ids, context=context)
+        prices = {}
+        qtys = {}
+        for line in lines:
+            price_unit, qty = self._line_price_qty(line)
+            price = price_unit * (1 - (line.discount or 0.0) / 100.0)
+            taxes = tax_obj.compute_all(cr, uid, line.taxes_id, price, qty, line.product_id, line.order_id.partner_id)
+            cur = line.order_id.pricelist_id.currency_id
+            prices[line.id] = price
+            qtys[line.id] = qty
+            res[line.id] = {
+                'line_untaxed': cur_obj.round(cr, uid, cur, taxes['total']),
+                'line_included_charges': 0.0,
+                'line_tax': taxes.get('total_included', 0.0) - taxes.get('total', 0.0),
+            }
+
+        order_totals = {}
+        for line in lines:
+            order = line.order_id
+            if not order or not order_obj._has_included_charges(order):
+                continue
+            if order.id not in order_totals:
+                order_totals[order.id] = 0.0
+                for order_line in order.order_line:
+                    if order_line.id in res:
+                        order_totals[order.id] += res[order_line.id]['line_untaxed']
+                    else:
+                        order_totals[order.id] += order_line.line_untaxed
+            order_total = order_totals[order.id]
+            if order_total > 0:
+                #Add fixed amount to order included in price
+                price = prices[line.id]
+                pre_line = round((price * 100) / order_total,2)
+                line_part = 0.0
+                if order.package_and_forwording_type == 'include' and order.package_and_forwording:
+                    line_part = order.package_and_forwording * (pre_line / 100)
+                    price -= line_part
+
+                if order.freight_type == 'include' and order.freight:
+                    line_part = order.freight  * (pre_line / 100)
+                    price -= line_part
+
+                if order.insurance_type == 'include' and order.insurance:
+                    line_part = order.insurance  * (pre_line / 100)
+                    price -= line_part
+
+                taxes = tax_obj.compute_all(cr, uid, line.taxes_id, price, qtys[line.id], line.product_id, order.partner_id)
+                res[line.id]['line_included_charges'] = (prices[line.id] - price) * qtys[line.id]
+                res[line.id]['line_tax'] = taxes.get('total_included', 0.0) - taxes.get('total', 0.0)
+        return res
+
+    def _get_breakdown_lines(self, cr, uid, ids, context=None):
+        """
+        -Process
+            -Changed lines, with all lines of their orders having charges included in
+             price since the allocation of these charges follows the order total.
+        """
+        if not ids:
+            return []
+        cr.execute("""  SELECT l.id FROM purchase_order_line l
+                        JOIN purchase_order o ON (o.id = l.order_id)
+                        WHERE o.id IN (SELECT order_id FROM purchase_order_line WHERE id IN %s)
+                        AND ((o.package_and_forwording_type = 'include' AND COALESCE(o.package_and_forwording, 0.0) != 0.0)
+                          OR (o.freight_type = 'include' AND COALESCE(o.freight, 0.0) != 0.0)
+                          OR (o.insurance_type = 'include' AND COALESCE(o.insurance, 0.0) != 0.0)) """, (tuple(ids),))
+        return list(set(ids) | set([row[0] for row in cr.fetchall()]))
+
+    def _get_lines_from_order(self, cr, uid, ids, context=None):
+        return self.pool.get('purchase.order.line').search(cr, uid, [('order_id', 'in', ids)], context=context)
+
+    _line_breakdown_store = {
+        'purchase.order.line': (_get_breakdown_lines, ['price_unit', 'discount', 'product_qty', 'taxes_id', 'product_id', 'order_id'], 5),
+        'purchase.order': (_get_lines_from_order, ['partner_id', 'pricelist_id', 'package_and_forwording_type', 'package_and_forwording',
+                                                   'freight_type', 'freight', 'insurance_type', 'insurance'], 5),
+    }
+
     _columns = {
         'discount': fields.float('Discount (%)'),
         'price_subtotal': fields.function(_amount_line, string='Subtotal', digits_compute= dp.get_precision('Account')),
+        'line_untaxed': fields.function(_line_breakdown, multi='breakdown', string='Untaxed Contribution', digits_compute= dp.get_precision('Account'),
+            store=_line_breakdown_store),
+        'line_included_charges': fields.function(_line_breakdown, multi='breakdown', string='Included Charges', digits_compute= dp.get_precision('Account'),
+            store=_line_breakdown_store, help="Part of the charges included in price of the order allocated to the line, deducted from the price before computing its taxes."),
+        'line_tax': fields.function(_line_breakdown, multi='breakdown', string='Tax Contribution',
+            store=_line_breakdown_store, help="Tax of line, not rounded, summed into order tax amount."),
         'package_and_forwording': fields.float('Packing Unit'),
         'insurance': fields.float('Insurance Unit'),
         'freight': fields.float('Freight Unit'),
@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+#    OpenERP, Open Source Management Solution
+#    Copyright (C) 2004-2010 Tiny SPRL (<http://tiny.be>).
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as
+#    published by the Free Software Foundation, either version 3 of the
+#    License, or (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+##############################################################################
+
+import logging
+
+from openerp.osv import fields, osv
+from openerp.tools.translate import _
+from openerp import tools
+
+_logger = logging.getLogger(__name__)
+
+class purchase_invoice_batch_line(osv.osv_memory):
+    _name = "purchase.invoice.batch.line"
+    _description = "Purchase Orders Invoicing Result"
+    _columns = {
+        'wizard_id': fields.many2one('purchase.invoice.batch', 'Wizard', ondelete='cascade'),
+        'order_id': fields.many2one('purchase.order', 'Purchase Order', readonly=True),
+        'invoice_id': fields.many2one('account.invoice', 'Invoice', readonly=True),
+        'state': fields.selection([('done', 'Invoiced'), ('failed', 'Failed')], 'Status', readonly=True),
+        'message': fields.char('Message', size=256, readonly=True),
+    }
+purchase_invoice_batch_line()
+
+class purchase_invoice_batch(osv.osv_memory):
+    _name = "purchase.invoice.batch"
+    _description = "Create Invoices Of Many Purchase Orders"
+
+    def default_get(self, cr, uid, fields, context=None):
+        """
+        Process
+            -Set selected purchase orders
+        """
+        context = context or {}
+        res = super(purchase_invoice_batch, self).default_get(cr, uid, fields, context=context)
+        if 'order_ids' in fields and context.get('active_model') == 'purchase.order':
+            res.update({'order_ids': [(6, 0, context.get('active_ids', []))]})
+        return res
+
+    _columns = {
+        'order_ids': fields.many2many('purchase.order', 'purchase_invoice_batch_order_rel', 'wizard_id', 'order_id', 'Purchase Orders'),
+        'chunk_size': fields.integer('Orders per Commit', help="Commit after this number of orders, 0 invoices all orders in one transaction."),
+        'result_ids': fields.one2many('purchase.invoice.batch.line', 'wizard_id', 'Result', readonly=True),
+        'state': fields.selection([('draft', 'Draft'), ('done', 'Done')], 'Status', readonly=True),
+    }
+
+    _defaults = {
+        'chunk_size': 100,
+        'state': 'draft',
+    }
+
+    def _check_order(self, cr, uid, order, context=None):
+        """
+        Return
+            -reason why order can not be invoiced, False when it can
+        """
+        if order.state not in ('approved', 'done'):
+            return _('Purchase order is not confirmed.')
+        if [invoice for invoice in order.invoice_ids if invoice.state != 'cancel']:
+            return _('Purchase order is already invoiced.')
+        if not order.order_line:
+            return _('Purchase order has no line.')
+        return False
+
+    def create_invoices(self, cr, uid, ids, context=None):
+        """
+        Process
+            -Check all purchase orders in one pass,
+            -Invoice valid orders per chunk with batch pipeline of purchase order,
+             a failing chunk is rolled back alone and reported,
+            -Commit and log progress after each chunk when chunk size is given.
+        Return
+            -Same wizard with result per purchase order
+        """
+        context = context or {}
+        order_obj = self.pool.get('purchase.order')
+        result_obj = self.pool.get('purchase.invoice.batch.line')
+        wizard_rec = self.browse(cr, uid, ids[0], context=context)
+
+        results = []
+        valid = []
+        for order in wizard_rec.order_ids:
+            message = self._check_order(cr, uid, order, context=context)
+            if message:
+                results.append((order.id, False, 'failed', message))
+            else:
+                valid.append(order.id)
+
+        chunk_size = wizard_rec.chunk_size > 0 and wizard_rec.chunk_size or len(valid)
+        done = 0
+        for pos in xrange(0, len(valid), chunk_size or 1):
+            chunk = valid[pos:pos + chunk_size]
+            cr.execute('SAVEPOINT purchase_invoice_batch')
+            try:
+                invoices = order_obj._invoice_create_batch(cr, uid, chunk, context=context)
+            except Exception, e:
+                cr.execute('ROLLBACK TO SAVEPOINT purchase_invoice_batch')
+                message = isinstance(e, osv.except_osv) and e.value or tools.ustr(e)
+                results.extend([(order_id, False, 'failed', message[:256]) for order_id in chunk])
+                _logger.warning('Purchase invoicing: chunk of %d orders failed: %s', len(chunk), message)
+                continue
+            cr.execute('RELEASE SAVEPOINT purchase_invoice_batch')
+            results.extend([(order_id, invoices.get(order_id, False), 'done', '') for order_id in chunk])
+            done += len(chunk)
+            if wizard_rec.chunk_size > 0:
+                cr.commit()
+            _logger.info('Purchase invoicing: %d/%d orders invoiced', done, len(valid))
+
+        for order_id, invoice_id, state, message in results:
+            result_obj.create(cr, uid, {
+                'wizard_id': wizard_rec.id,
+                'order_id': order_id,
+                'invoice_id': invoice_id,
+                'state': state,
+                'message': message,
+            }, context=context)
+        self.write(cr, uid, ids, {'state': 'done'}, context=context)
+
+        return {
+            'name': _('Create Invoices'),
+            'view_type': 'form',
+            'view_mode': 'form',
+            'res_model': 'purchase.invoice.batch',
+            'res_id': wizard_rec.id,
+            'context': context,
+            'type': 'ir.actions.act_window',
+            'target': 'new',
+        }
+
+purchase_invoice_batch()
+
+# vim:expandtab:smartindent:tabstop=4:softtabstop=4:shiftwidth=4:
@@ -20,34 +20,127 @@
 ##############################################################################
 
 import time
+import logging
 
 from openerp.osv import fields, osv
 from openerp.tools.translate import _
+from openerp.addons.l10n_in_base.orm_bulk import bulk_insert
+
+_logger = logging.getLogger(__name__)
 
 class stock_production_lot(osv.osv):
     _inherit = 'stock.production.lot'
-    
+
+    def _get_product_lots(self, cr, uid, ids, context=None):
+        return self.pool.get('stock.production.lot').search(cr, uid, [('product_id', 'in', ids)], context=context)
+
     _columns = {
-        'container_serial_id':fields.many2one('stock.production.lot', 'Container Serial', readonly=True)
+        'container_serial_id':fields.many2one('stock.production.lot', 'Container Serial', readonly=True),
+        'container_ok': fields.related('product_id', 'container_ok', type='boolean', string='Container Product', readonly=True,
+            store={
+                'stock.production.lot': (lambda self, cr, uid, ids, c={}: ids, ['product_id'], 10),
+                'product.product': (_get_product_lots, ['container_ok'], 10),
+            }),
     }
+
+    def __init__(self, pool, cr):
+        super(stock_production_lot, self).__init__(pool, cr)
+        pool._sql_error['stock_production_lot_container_name_uniq'] = 'Serial number of a container must be unique per container product !'
+
+    def _auto_init(self, cr, context=None):
+        """
+        -Process
+            -unique index on (product_id, name) of container serials, it stops concurrent
+             shipments from creating the same container serial twice,
+            -container_ok is filled in here because stored fields are only computed
+             after all models are initialised,
+            -existing duplicate container serials are reported and the index is
+             created on next update once they are merged.
+        """
+        res = super(stock_production_lot, self)._auto_init(cr, context=context)
+        cr.execute("SELECT indexname FROM pg_indexes WHERE indexname = 'stock_production_lot_container_name_uniq'")
+        if cr.fetchone():
+            return res
+        cr.execute("""  UPDATE stock_production_lot l SET container_ok = COALESCE(p.container_ok, False)
+                        FROM product_product p
+                        WHERE p.id = l.product_id AND l.container_ok IS NULL """)
+        cr.execute("""  SELECT p.name_template, l.name, count(*)
+                        FROM stock_production_lot l
+                        JOIN product_product p ON (p.id = l.product_id)
+                        WHERE l.container_ok
+                        GROUP BY p.name_template, l.name
+                        HAVING count(*) > 1 """)
+        duplicates = cr.fetchall()
+        if duplicates:
+            _logger.warning("Unique index on container serials is not created, duplicate serials found (product, serial, count): %s",
+                            ", ".join(["(%s, %s, %s)" % duplicate for duplicate in duplicates]))
+        else:
+            cr.execute("""CREATE UNIQUE INDEX stock_production_lot_container_name_uniq
+                            ON stock_production_lot (product_id, name) WHERE container_ok""")
+        return res
+
+    def resolve_container_serials(self, cr, uid, keys, context=None):
+        """
+        -Process
+            -find the container serials of all (container product, serial name) with one query,
+            -missing container serials are created with create(), so mail.thread hooks of
+             serials are run, the unique index on container serials stops concurrent
+             shipments from creating a serial twice.
+        -Return
+            -{(container product id, serial name): container serial id}
+        """
+        keys = list(set(keys))
+        if not keys:
+            return {}
+        res = {}
+        cr.execute("""  SELECT product_id, name, id FROM stock_production_lot
+                        WHERE (product_id, name) IN %s
+                        ORDER BY id """, (tuple(keys),))
+        for product_id, name, serial_id in cr.fetchall():
+            res.setdefault((product_id, name), serial_id)
+        date = time.strftime('%Y-%m-%d %H:%M:%S')
+        for product_id, name in keys:
+            if (product_id, name) not in res:
+                res[(product_id, name)] = self.create(cr, uid, {'name':name, 'product_id':product_id, 'date':date}, context=context)
+        return res
+
 stock_production_lot()
 
+class stock_move(osv.Model):
+    _inherit = 'stock.move'
+
+    def bulk_create(self, cr, uid, vals_list, context=None):
+        """
+        -Process
+            -Insert moves with one statement, see bulk_insert() of l10n_in_base.
+        -Return
+            -ids of created moves, in order of vals_list
+        """
+        return bulk_insert(self, cr, uid, vals_list, context=context)
+
+stock_move()
+
 class stock_picking(osv.Model):
     _inherit = "stock.picking"
     _table = "stock_picking"
     _order = "name desc"
     
     def do_partial(self, cr, uid, ids, partial_datas, context=None):
+        """
+        -Process
+            -after partial processing, moves of all processed pickings are checked in one pass,
+            -container serials of the whole batch are looked up and created with
+             resolve_container_serials() and linked with one write per container serial,
+            -container moves of all pickings are created with one bulk_create().
+        """
         move_pool = self.pool.get('stock.move')
-        warehouse_pool = self.pool.get('stock.warehouse')
         serial_pool = self.pool.get('stock.production.lot')
         
         res = super(stock_picking, self).do_partial(cr, uid, ids, partial_datas, context=context)
         
-        package_serial_entry = {}
-        
-        for picking_id in res:
-            picking = self.browse(cr, uid, picking_id)
+        # (move, picking, container product, container serial name, packed)
+        container_moves = []
+        for picking in self.browse(cr, uid, res.keys()):
             for move in picking.move_lines:
                 
                 if move.product_id.container_id and move.product_id.container_id.track_outgoing and not move.prodlot_id:
@@ -60,70 +153,45 @@ class stock_picking(osv.Model):
                     raise osv.except_osv(_('Warning!'),_('You cannot confirm an shipping %s with container %s, without serial number' % (move.name, move.product_packaging.ul.container_id.id)))
                 
                 if move.product_id.container_id and move.prodlot_id:
-                    serial_id = False
-                    if not move.prodlot_id.container_serial_id:
-                        serial_ids = serial_pool.search(cr, uid, [('product_id','=',move.product_id.container_id.id), ('name','=',move.prodlot_id.name)])
-                        if serial_ids:
-                            serial_id = serial_ids[0]
-                        else:
-                            res = {
-                                'name':move.prodlot_id.name,
-                                'product_id':move.product_id.container_id.id,
-                                'date':time.strftime('%Y-%m-%d %H:%M:%S')
-                            }
-                            serial_id = serial_pool.create(cr, uid, res)
-                        serial_pool.write(cr, uid, [move.prodlot_id.id], {'container_serial_id':serial_id})
-                    else:
-                        serial_id = move.prodlot_id.container_serial_id.id
-                    
-                    res = {
-                        'product_id':move.product_id.container_id.id,
-                        'product_qty':1,
-                        'product_uom':move.product_id.container_id.uom_id.id,
-                        'name':move.name,
-                        'origin':picking.name,
-                        'type':'internal',
-                        'location_id':move.location_id.id,
-                        'location_dest_id':move.location_dest_id.id,
-                        'partner_id':move.partner_id.id,
-                        'date':move.date,
-                        'prodlot_id':serial_id,
-                        'state':'done'
-                    }
-                    move_pool.create(cr, uid, res)
+                    container_moves.append((move, picking, move.product_id.container_id, move.prodlot_id.name, False))
                 elif not move.product_id.container_id and move.prodlot_id and move.tracking_id and move.product_packaging:
-                    serial_id = False
-                    if not move.prodlot_id.container_serial_id:
-                        serial_ids = serial_pool.search(cr, uid, [('product_id','=',move.product_packaging.ul.container_id.id), ('name','=',move.tracking_id.name)])
-                        if serial_ids:
-                            serial_id = serial_ids[0]
-                        else:
-                            res = {
-                                'name':move.tracking_id.name,
-                                'product_id':move.product_packaging.ul.container_id.id,
-                                'date':time.strftime('%Y-%m-%d %H:%M:%S')
-                            }
-                            serial_id = serial_pool.create(cr, uid, res)
-                        serial_pool.write(cr, uid, [move.prodlot_id.id], {'container_serial_id':serial_id})
-                    else:
-                        serial_id = move.prodlot_id.container_serial_id.id
-                    
-                    if not package_serial_entry.get(serial_id):
-                        res = {
-                            'product_id':move.product_packaging.ul.container_id.id,
-                            'product_qty':1,
-                            'product_uom':move.product_packaging.ul.container_id.uom_id.id,
-                            'name':move.name,
-                            'origin':picking.name,
-                            'type':'internal',
-                            'location_id':move.location_id.id,
-                            'location_dest_id':move.location_dest_id.id,
-                            'partner_id':move.partner_id.id,
-                            'date':move.date,
-                            'prodlot_id':serial_id,
-                            'state':'done'
-                        }
-                        package_serial_entry[serial_id] = move_pool.create(cr, uid, res)
+                    container_moves.append((move, picking, move.product_packaging.ul.container_id, move.tracking_id.name, True))
+        
+        serials = serial_pool.resolve_container_serials(cr, uid, [(container.id, name) for move, picking, container, name, packed in container_moves
+                                                                  if not move.prodlot_id.container_serial_id], context=context)
+        serial_prodlots = {}
+        for move, picking, container, name, packed in container_moves:
+            if not move.prodlot_id.container_serial_id:
+                serial_prodlots.setdefault(serials[(container.id, name)], set()).add(move.prodlot_id.id)
+        for serial_id, prodlot_ids in serial_prodlots.items():
+            serial_pool.write(cr, uid, list(prodlot_ids), {'container_serial_id':serial_id})
+        
+        package_serial_entry = {}
+        move_vals = []
+        for move, picking, container, name, packed in container_moves:
+            if move.prodlot_id.container_serial_id:
+                serial_id = move.prodlot_id.container_serial_id.id
+            else:
+                serial_id = serials[(container.id, name)]
+            if packed:
+                if package_serial_entry.get(serial_id):
+                    continue
+                package_serial_entry[serial_id] = True
+            move_vals.append({
+                'product_id':container.id,
+                'product_qty':1,
+                'product_uom':container.uom_id.id,
+                'name':move.name,
+                'origin':picking.name,
+                'type':'internal',
+                'location_id':move.location_id.id,
+                'location_dest_id':move.location_dest_id.id,
+                'partner_id':move.partner_id.id,
+                'date':move.date,
+                'prodlot_id':serial_id,
+                'state':'done'
+            })
+        move_pool.bulk_create(cr, uid, move_vals)
         return res
     
 stock_picking()
\ No newline at end of file